@@ -0,0 +1,331 @@
+"""
+Art image catalogue
+
+Keeps per-image metadata for the art folders under /config/www in one SQLite
+file: size, mtime, content hash, format, dimensions, progressive flag and
+whether the panels can show it (a 720x720 baseline JPEG).
+
+A listing is one os.scandir pass over the directory. Only files whose
+(mtime, size) differ from the catalogue are read and probed again, and a
+directory whose mtime has not changed is served from memory for a short
+while without touching the files at all.
+"""
+
+import hashlib
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+# What the panels can display
+PANEL_SIZE = (720, 720)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha1 TEXT NOT NULL,
+    format TEXT,
+    width INTEGER,
+    height INTEGER,
+    progressive INTEGER NOT NULL DEFAULT 0,
+    valid INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (directory, name)
+);
+"""
+
+COLUMNS = ('name', 'size', 'mtime_ns', 'sha1', 'format', 'width', 'height', 'progressive', 'valid', 'error')
+
+# Start-of-frame markers that carry the image size; C2/C6/CA/CE are progressive
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+PROGRESSIVE_MARKERS = {0xC2, 0xC6, 0xCA, 0xCE}
+
+
+# The JPEG probe reads through a buffer of this size; segments are skipped by seeking
+JPEG_PROBE_CHUNK = 4096
+# Give up on files with more segments than this before the frame header
+JPEG_MAX_SEGMENTS = 1024
+
+
+class _ChunkReader:
+    """Fixed-size buffered reader over a binary stream (memory bounded by chunk_size)"""
+
+    def __init__(self, stream, chunk_size=JPEG_PROBE_CHUNK):
+        self.stream = stream
+        self.buf = bytearray(chunk_size)
+        self.view = memoryview(self.buf)
+        self.start = 0
+        self.end = 0
+        self.seekable = getattr(stream, 'seekable', lambda: False)()
+
+    def take(self, n):
+        """Return the next n bytes (n <= chunk_size), or None at end of stream"""
+        if self.end - self.start < n:
+            tail = self.end - self.start
+            self.buf[:tail] = self.view[self.start:self.end]
+            self.start, self.end = 0, tail
+            while self.end < n:
+                read = self.stream.readinto(self.view[self.end:])
+                if not read:
+                    return None
+                self.end += read
+        out = self.view[self.start:self.start + n]
+        self.start += n
+        return out
+
+    def skip(self, n):
+        buffered = self.end - self.start
+        if n <= buffered:
+            self.start += n
+            return
+        n -= buffered
+        self.start = self.end = 0
+        if self.seekable:
+            self.stream.seek(n, 1)
+            return
+        while n > 0:
+            read = self.stream.readinto(self.view[:min(n, len(self.buf))])
+            if not read:
+                return
+            n -= read
+
+
+def probe_jpeg(stream):
+    """Read a JPEG's frame header from a binary stream.
+    Returns {format, width, height, progressive}, or None if the stream is not a JPEG.
+    Reads only up to the frame header, jumping over other segments by their length.
+    """
+    reader = _ChunkReader(stream)
+    soi = reader.take(2)
+    if soi is None or soi[0] != 0xFF or soi[1] != 0xD8:
+        return None
+    info = {"format": "jpeg", "width": None, "height": None, "progressive": False}
+    for _ in range(JPEG_MAX_SEGMENTS):
+        byte = reader.take(1)
+        if byte is None:
+            break
+        if byte[0] != 0xFF:
+            continue  # Stray byte between segments
+        marker = reader.take(1)
+        while marker is not None and marker[0] == 0xFF:
+            marker = reader.take(1)  # Fill bytes
+        if marker is None:
+            break
+        marker = marker[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # Markers without a length
+        if marker in (0xD9, 0xDA):
+            break  # EOI, or start of scan: the frame header always comes before it
+        length = reader.take(2)
+        if length is None:
+            break
+        length = (length[0] << 8) | length[1]
+        if length < 2:
+            break
+        if marker in SOF_MARKERS:
+            header = reader.take(5)
+            if header is not None:
+                info["height"] = (header[1] << 8) | header[2]
+                info["width"] = (header[3] << 8) | header[4]
+                info["progressive"] = marker in PROGRESSIVE_MARKERS
+            break
+        reader.skip(length - 2)
+    return info
+
+
+def probe_image(stream):
+    """Return {format, width, height, progressive} for a JPEG, PNG, GIF or WebP stream"""
+    head = stream.read(32)
+    stream.seek(0)
+    if head[:2] == b'\xff\xd8':
+        return probe_jpeg(stream)
+    info = {"format": None, "width": None, "height": None, "progressive": False}
+    if head[:8] == b'\x89PNG\r\n\x1a\n' and len(head) >= 24:
+        info["format"] = "png"
+        info["width"], info["height"] = struct.unpack('>II', head[16:24])
+    elif head[:6] in (b'GIF87a', b'GIF89a') and len(head) >= 10:
+        info["format"] = "gif"
+        info["width"], info["height"] = struct.unpack('<HH', head[6:10])
+    elif head[:4] == b'RIFF' and head[8:12] == b'WEBP' and len(head) >= 30:
+        info["format"] = "webp"
+        chunk = head[12:16]
+        if chunk == b'VP8 ':
+            w, h = struct.unpack('<HH', head[26:30])
+            info["width"], info["height"] = w & 0x3FFF, h & 0x3FFF
+        elif chunk == b'VP8L':
+            bits = int.from_bytes(head[21:25], 'little')
+            info["width"], info["height"] = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        elif chunk == b'VP8X':
+            info["width"] = int.from_bytes(head[24:27], 'little') + 1
+            info["height"] = int.from_bytes(head[27:30], 'little') + 1
+    return info
+
+
+def file_sha1(stream, chunk_size=65536):
+    digest = hashlib.sha1()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def panel_compatibility(info):
+    """Return (valid, error) for probed image info against what the panels display"""
+    if info["format"] != "jpeg":
+        return False, f"{(info['format'] or 'unknown').upper()} images are not shown on panels, use JPEG"
+    if info["width"] is None:
+        return False, "Not a valid JPEG file"
+    if info["progressive"]:
+        return False, "Progressive JPEG not supported - use baseline JPEG"
+    if (info["width"], info["height"]) != PANEL_SIZE:
+        return False, f"Image must be {PANEL_SIZE[0]}x{PANEL_SIZE[1]} pixels, got {info['width']}x{info['height']}"
+    return True, None
+
+
+class ArtCatalogue:
+    """Persistent metadata index of the image files in art directories"""
+
+    # Seconds a directory listing is reused while the directory mtime is unchanged
+    RESCAN_SECS = 30
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._listings = {}  # directory -> (dir mtime_ns, scanned_at, [entry dict])
+        self.probes = 0
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def _probe_file(path, size, mtime_ns):
+        with open(path, 'rb') as f:
+            info = probe_image(f)
+            f.seek(0)
+            sha1 = file_sha1(f)
+        valid, error = panel_compatibility(info)
+        return {
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "sha1": sha1,
+            **info,
+            "valid": valid,
+            "error": error
+        }
+
+    def _save(self, db, directory, name, entry):
+        db.execute(
+            f"INSERT OR REPLACE INTO images (directory, {', '.join(COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' * len(COLUMNS))})",
+            (directory, name, *(entry[c] for c in COLUMNS[1:]))
+        )
+
+    def list(self, directory):
+        """Return [entry dict] for the images in a directory, sorted by name"""
+        directory = str(directory)
+        dir_mtime = os.stat(directory).st_mtime_ns
+        with self._lock:
+            cached = self._listings.get(directory)
+            if cached and cached[0] == dir_mtime and time.monotonic() - cached[1] < self.RESCAN_SECS:
+                return cached[2]
+
+            db = self._connect()
+            known = {row[0]: dict(zip(COLUMNS, row)) for row in db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM images WHERE directory = ?", (directory,)
+            )}
+            entries = []
+            seen = set()
+            with db:
+                with os.scandir(directory) as it:
+                    for item in it:
+                        if not item.name.lower().endswith(IMAGE_EXTENSIONS) or not item.is_file():
+                            continue
+                        st = item.stat()
+                        seen.add(item.name)
+                        entry = known.get(item.name)
+                        if entry is None or entry['mtime_ns'] != st.st_mtime_ns or entry['size'] != st.st_size:
+                            try:
+                                entry = self._probe_file(item.path, st.st_size, st.st_mtime_ns)
+                            except OSError:
+                                continue  # Removed or unreadable mid-scan
+                            self.probes += 1
+                            self._save(db, directory, item.name, entry)
+                            entry["name"] = item.name
+                        entries.append(entry)
+                gone = [(directory, name) for name in known if name not in seen]
+                db.executemany('DELETE FROM images WHERE directory = ? AND name = ?', gone)
+
+            entries = [self._public(e) for e in entries]
+            entries.sort(key=lambda e: e["name"])
+            self._listings[directory] = (dir_mtime, time.monotonic(), entries)
+            return entries
+
+    def update(self, directory, name):
+        """Re-catalogue one file after it was written or removed. None for non-image names."""
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            return None
+        directory = str(directory)
+        path = os.path.join(directory, name)
+        with self._lock:
+            self._listings.pop(directory, None)
+            with self._connect() as db:
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    db.execute('DELETE FROM images WHERE directory = ? AND name = ?', (directory, name))
+                    return None
+                entry = self._probe_file(path, st.st_size, st.st_mtime_ns)
+                self.probes += 1
+                self._save(db, directory, name, entry)
+        entry["name"] = name
+        return self._public(entry)
+
+    def lookup(self, directory, name):
+        """Catalogue entry for one file, probing it only if it changed.
+        None if it does not exist or is not an image.
+        """
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            return None
+        directory = str(directory)
+        try:
+            st = os.stat(os.path.join(directory, name))
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT {', '.join(COLUMNS)} FROM images WHERE directory = ? AND name = ?",
+                (directory, name)
+            ).fetchone()
+        if row is not None:
+            entry = dict(zip(COLUMNS, row))
+            if entry['mtime_ns'] == st.st_mtime_ns and entry['size'] == st.st_size:
+                return self._public(entry)
+        return self.update(directory, name)
+
+    @staticmethod
+    def _public(entry):
+        return {
+            "name": entry["name"],
+            "size": entry["size"],
+            "mtime": entry["mtime_ns"] // 1_000_000_000,
+            "sha1": entry["sha1"],
+            "format": entry["format"],
+            "width": entry["width"],
+            "height": entry["height"],
+            "progressive": bool(entry["progressive"]),
+            "valid": bool(entry["valid"]),
+            "error": entry["error"]
+        }
@@ -0,0 +1,323 @@
+"""
+Art image normalization
+
+Turns an uploaded PNG, WebP, GIF or progressive/odd-sized JPEG into what the
+panels display: a 720x720 baseline JPEG. The image is centre-cropped to a
+square, resized with Lanczos, and encoded as baseline JPEG with 4:2:0
+subsampling. Quality starts at `quality` and steps down until the file fits
+`target_bytes` (or `min_quality` is reached), which keeps downloads and
+decode time on the ESP32 small.
+
+Decoding and encoding run in a bounded process pool so image work never
+holds a Flask worker's GIL. Images above MAX_PIXELS are refused before they
+are decoded, and a pool whose process died is replaced on the next job.
+Results are cached on disk under the SHA-1 of the source bytes plus the
+encoding settings, so re-uploading the same image is a file copy.
+
+The same pool renders gallery thumbnails (make_thumbnail), cached on disk
+by the source file's hash and the thumbnail size. Concurrent requests for
+the same output share one job.
+
+Pillow is optional; without it `available` is False, uploads that are not
+already panel-ready are rejected as before and the gallery shows originals.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow not installed (local dev), normalization disabled
+    Image = ImageOps = None
+
+from art_catalogue import PANEL_SIZE
+
+# Lowest quality the size target may push an image to
+MIN_QUALITY = 60
+QUALITY_STEP = 5
+
+# Images with more pixels than this are refused before decoding (a small PNG or WebP
+# can expand to gigabytes and take the pool process down)
+MAX_PIXELS = 40_000_000
+
+# Panels show the image on black; transparent areas are flattened onto this
+BACKGROUND = (0, 0, 0)
+
+
+class IngestBusy(Exception):
+    """The normalization pool already has its maximum of queued jobs"""
+
+
+def _open_image(source, max_pixels):
+    """Image.open that raises DecompressionBombError above max_pixels, before decoding"""
+    img = Image.open(source)
+    if img.width * img.height > max_pixels:
+        img.close()
+        raise Image.DecompressionBombError(f"{img.width}x{img.height} exceeds {max_pixels} pixels")
+    return img
+
+
+def normalize_image(source, output, quality=85, target_bytes=0, min_quality=MIN_QUALITY,
+                    max_pixels=MAX_PIXELS):
+    """Decode `source`, crop/resize to the panel size and write a baseline JPEG to `output`.
+    Runs in a pool process. Returns {source_format, source_width, source_height, quality, bytes}.
+    """
+    with _open_image(source, max_pixels) as img:
+        source_format = (img.format or '').lower()
+        source_size = img.size
+        img.draft('RGB', (PANEL_SIZE[0] * 2, PANEL_SIZE[1] * 2))  # Cheap JPEG downscale on decode
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            flat = Image.new('RGB', img.size, BACKGROUND)
+            flat.paste(img, mask=img.getchannel('A'))
+            img = flat
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        img = ImageOps.fit(img, PANEL_SIZE, method=Image.LANCZOS)
+
+    tmp = f"{output}.{os.getpid()}.tmp"
+    q = quality
+    while True:
+        img.save(tmp, 'JPEG', quality=q, optimize=True, progressive=False, subsampling='4:2:0')
+        size = os.path.getsize(tmp)
+        if not target_bytes or size <= target_bytes or q - QUALITY_STEP < min_quality:
+            break
+        q -= QUALITY_STEP
+    os.replace(tmp, output)
+    return {
+        "source_format": source_format,
+        "source_width": source_size[0],
+        "source_height": source_size[1],
+        "quality": q,
+        "bytes": size
+    }
+
+
+def make_thumbnail(source, output, size, quality=80, max_pixels=MAX_PIXELS):
+    """Write a JPEG thumbnail of `source` fitting size x size to `output`. Runs in a pool process."""
+    with _open_image(source, max_pixels) as img:
+        img.draft('RGB', (size, size))  # JPEG decodes straight at 1/2, 1/4 or 1/8 scale
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGB')
+        img.thumbnail((size, size), Image.LANCZOS)
+    tmp = f"{output}.{os.getpid()}.tmp"
+    img.save(tmp, 'JPEG', quality=quality, optimize=True)
+    os.replace(tmp, output)
+    return {"width": img.width, "height": img.height, "bytes": os.path.getsize(output)}
+
+
+class ArtIngest:
+    """Normalizes uploads on a bounded process pool, with an on-disk cache by source hash"""
+
+    # Thumbnail edge lengths served; requests are rounded up to the next one
+    THUMB_SIZES = (64, 128, 256, 360)
+    THUMB_QUALITY = 80
+
+    def __init__(self, cache_dir, workers=2, quality=85, target_kb=0, max_pending=8,
+                 max_cache_files=500, max_thumb_files=5000, timeout=60, max_pixels=MAX_PIXELS):
+        self.cache_dir = os.path.join(str(cache_dir), 'normalized')
+        self.thumb_dir = os.path.join(str(cache_dir), 'thumbs')
+        self.workers = workers
+        self.quality = quality
+        self.target_bytes = target_kb * 1024
+        self.max_pending = max_pending
+        self.max_cache_files = max_cache_files
+        self.max_thumb_files = max_thumb_files
+        self.timeout = timeout
+        self.max_pixels = max_pixels
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending = 0
+        self._inflight = {}  # output path -> Future
+        self.stats = {"normalized": 0, "cache_hits": 0, "failed": 0, "busy": 0,
+                      "thumbs_rendered": 0, "thumb_hits": 0, "pool_restarts": 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.makedirs(self.thumb_dir, exist_ok=True)
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def _executor(self):
+        # spawn: pool processes start clean instead of forking a threaded server
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _reset_pool(self, pool):
+        """Drop a pool whose process died so the next job starts a new one (call with _lock held)"""
+        if self._pool is pool and pool is not None:
+            self._pool = None
+            self.stats["pool_restarts"] += 1
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _check_capacity(self):
+        """Raise IngestBusy when max_pending jobs are queued (call with _lock held)"""
+        if self._pending >= self.max_pending:
+            self.stats["busy"] += 1
+            raise IngestBusy(f"{self._pending} images already being processed")
+
+    def _submit(self, output, fn, *args, on_done=None):
+        """Queue fn(*args) writing `output` on the pool, or join the job already writing it.
+        on_done(future) runs once when a new job finishes. Raises IngestBusy when
+        max_pending jobs are queued.
+        """
+        with self._lock:
+            future = self._inflight.get(output)
+            if future is not None:
+                return future
+            self._check_capacity()
+            pool = self._executor()
+            try:
+                future = pool.submit(fn, *args)
+            except BrokenProcessPool:
+                self._reset_pool(pool)
+                pool = self._executor()
+                future = pool.submit(fn, *args)
+            self._pending += 1
+            self._inflight[output] = future
+        future.add_done_callback(lambda f: self._done(output, pool, f))
+        if on_done is not None:
+            future.add_done_callback(on_done)
+        return future
+
+    def _done(self, output, pool, future):
+        with self._lock:
+            self._pending -= 1
+            self._inflight.pop(output, None)
+            if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                self._reset_pool(pool)  # A pool process died (e.g. out of memory)
+
+    def _wait(self, future):
+        """Result of a pool job; ValueError when it failed or took too long"""
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise ValueError(f"Image processing took longer than {self.timeout}s")
+        except BrokenProcessPool:
+            with self._lock:
+                self.stats["failed"] += 1
+            raise ValueError("Image processing failed, the image may be too large to decode")
+        except Image.DecompressionBombError as e:
+            with self._lock:
+                self.stats["failed"] += 1
+            raise ValueError(f"Image too large to process ({e})")
+        except (OSError, ValueError, SyntaxError) as e:
+            with self._lock:
+                self.stats["failed"] += 1
+            raise ValueError(f"Cannot decode image, unsupported or corrupt file ({type(e).__name__})")
+
+    def _cache_key(self, sha1):
+        settings = f"{PANEL_SIZE[0]}x{PANEL_SIZE[1]}-q{self.quality}-t{self.target_bytes}"
+        return f"{sha1}-{hashlib.sha1(settings.encode()).hexdigest()[:8]}"
+
+    def normalize(self, stream):
+        """Normalize an upload stream. Returns (cached output path, info).
+        Raises IngestBusy when the pool queue is full, ValueError for undecodable images.
+        """
+        with self._lock:
+            self._check_capacity()  # Before spooling a possibly large upload
+        # Spool the upload to disk for the pool process, hashing it on the way
+        digest = hashlib.sha1()
+        fd, source = tempfile.mkstemp(dir=self.cache_dir, suffix='.src')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: stream.read(65536), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+            sha1 = digest.hexdigest()
+            output = os.path.join(self.cache_dir, self._cache_key(sha1) + '.jpg')
+            if os.path.exists(output):
+                os.utime(output)  # Keep recently used entries when pruning
+                with self._lock:
+                    self.stats["cache_hits"] += 1
+                return output, {"source_sha1": sha1, "cached": True, "bytes": os.path.getsize(output)}
+
+            info = self._wait(self._submit(output, normalize_image, source, output,
+                                           self.quality, self.target_bytes, MIN_QUALITY, self.max_pixels))
+        finally:
+            try:
+                os.unlink(source)
+            except FileNotFoundError:
+                pass
+
+        with self._lock:
+            self.stats["normalized"] += 1
+        self._prune(self.cache_dir, self.max_cache_files)
+        return output, {"source_sha1": sha1, "cached": False, **info}
+
+    def save(self, stream, destination):
+        """Normalize an upload and copy the result to destination. Returns info."""
+        output, info = self.normalize(stream)
+        tmp = f"{destination}.tmp"
+        shutil.copyfile(output, tmp)
+        os.replace(tmp, destination)
+        return info
+
+    @classmethod
+    def thumb_size(cls, requested):
+        """Smallest served thumbnail size at least `requested` (the largest if none is)"""
+        for size in cls.THUMB_SIZES:
+            if size >= requested:
+                return size
+        return cls.THUMB_SIZES[-1]
+
+    def thumbnail(self, source, sha1, size, wait=True):
+        """Path of the cached thumbnail of `source` (content hash sha1), rendering it if needed.
+        With wait=False the render is only queued (prewarm) and None is returned.
+        Raises IngestBusy when the pool is full, ValueError when the image cannot be decoded.
+        """
+        output = os.path.join(self.thumb_dir, f"{sha1}-{size}.jpg")
+        if os.path.exists(output):
+            if wait:
+                os.utime(output)  # Keep recently used entries when pruning
+                with self._lock:
+                    self.stats["thumb_hits"] += 1
+            return output
+        future = self._submit(output, make_thumbnail, source, output, size, self.THUMB_QUALITY,
+                              self.max_pixels, on_done=self._thumb_done)
+        if not wait:
+            return None
+        self._wait(future)
+        return output
+
+    def _thumb_done(self, future):
+        if future.exception() is not None:
+            return
+        with self._lock:
+            self.stats["thumbs_rendered"] += 1
+            prune = self.stats["thumbs_rendered"] % 100 == 0
+        if prune:
+            self._prune(self.thumb_dir, self.max_thumb_files)
+
+    def _prune(self, directory, max_files):
+        """Drop the least recently used cached outputs beyond max_files"""
+        with os.scandir(directory) as it:
+            files = [(e.stat().st_mtime, e.path) for e in it if e.name.endswith('.jpg')]
+        excess = len(files) - max_files
+        if excess <= 0:
+            return
+        for _, path in sorted(files)[:excess]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def status(self):
+        with self._lock:
+            return {
+                "available": self.available,
+                "workers": self.workers,
+                "pending": self._pending,
+                "quality": self.quality,
+                "target_kb": self.target_bytes // 1024,
+                **self.stats
+            }
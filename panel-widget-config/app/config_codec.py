@@ -0,0 +1,231 @@
+"""
+Compact binary (CBOR) rendition of site_settings.json for panels
+
+The document is a CBOR map with integer keys:
+
+    0: format version (1)
+    1: key table - every map key in the payload is a uint index into it
+    2: value tables {key index: [str, ...]} - under these keys a uint value
+       is an index into the table (widget type codes, EQ band types, ...)
+    3: flag keys [key index, ...] - under these keys true/false mean "Y"/"N"
+    4: payload
+
+Tables are built from the document itself, so the encoding is lossless:
+decode(encode(doc)) == doc. Floats are written as float32 when that is exact.
+"""
+
+import struct
+
+FORMAT_VERSION = 1
+
+# A key gets a value table when its string values repeat and stay this few
+MAX_VALUE_TABLE = 64
+
+
+def _walk(node, visit):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            visit(key, value)
+            _walk(value, visit)
+    elif isinstance(node, list):
+        for item in node:
+            _walk(item, visit)
+
+
+def build_tables(doc):
+    """Return (keys, value_tables, flag_keys) for a document"""
+    key_counts = {}
+    values = {}
+
+    def visit(key, value):
+        key_counts[key] = key_counts.get(key, 0) + 1
+        values.setdefault(key, []).append(value)
+
+    _walk(doc, visit)
+
+    # Most frequent keys get the smallest (single byte) indexes
+    keys = sorted(key_counts, key=lambda k: (-key_counts[k], k))
+
+    value_tables = {}
+    flag_keys = set()
+    for key, vals in values.items():
+        if not all(isinstance(v, str) for v in vals):
+            continue
+        distinct = sorted(set(vals))
+        if set(distinct) <= {'Y', 'N'}:
+            flag_keys.add(key)
+        elif len(distinct) < len(vals) and len(distinct) <= MAX_VALUE_TABLE:
+            value_tables[key] = distinct
+    return keys, value_tables, flag_keys
+
+
+class _Writer:
+    def __init__(self):
+        self.out = bytearray()
+
+    def head(self, major, n):
+        if n < 24:
+            self.out.append((major << 5) | n)
+        elif n < 0x100:
+            self.out += bytes(((major << 5) | 24, n))
+        elif n < 0x10000:
+            self.out.append((major << 5) | 25)
+            self.out += struct.pack('>H', n)
+        elif n < 0x100000000:
+            self.out.append((major << 5) | 26)
+            self.out += struct.pack('>I', n)
+        else:
+            self.out.append((major << 5) | 27)
+            self.out += struct.pack('>Q', n)
+
+    def value(self, v):
+        if v is None:
+            self.out.append(0xF6)
+        elif v is True:
+            self.out.append(0xF5)
+        elif v is False:
+            self.out.append(0xF4)
+        elif isinstance(v, int):
+            if v >= 0:
+                self.head(0, v)
+            else:
+                self.head(1, -1 - v)
+        elif isinstance(v, float):
+            try:
+                packed = struct.pack('>f', v)
+            except OverflowError:
+                packed = None  # Beyond float32 range
+            if packed is not None and struct.unpack('>f', packed)[0] == v:
+                self.out.append(0xFA)
+                self.out += packed
+            else:
+                self.out.append(0xFB)
+                self.out += struct.pack('>d', v)
+        elif isinstance(v, str):
+            raw = v.encode('utf-8')
+            self.head(3, len(raw))
+            self.out += raw
+        elif isinstance(v, (list, tuple)):
+            self.head(4, len(v))
+            for item in v:
+                self.value(item)
+        elif isinstance(v, dict):
+            self.head(5, len(v))
+            for key, item in v.items():
+                self.value(key)
+                self.value(item)
+        else:
+            raise TypeError(f"Cannot encode {type(v).__name__}")
+
+
+def _compact(node, key_index, value_index, flag_keys):
+    if isinstance(node, list):
+        return [_compact(item, key_index, value_index, flag_keys) for item in node]
+    if not isinstance(node, dict):
+        return node
+    out = {}
+    for key, value in node.items():
+        if key in flag_keys:
+            value = value == 'Y'
+        elif key in value_index:
+            value = value_index[key][value]
+        else:
+            value = _compact(value, key_index, value_index, flag_keys)
+        out[key_index[key]] = value
+    return out
+
+
+def encode_config(doc):
+    """Encode a config document to compact CBOR bytes"""
+    keys, value_tables, flag_keys = build_tables(doc)
+    key_index = {k: i for i, k in enumerate(keys)}
+    value_index = {k: {v: i for i, v in enumerate(table)} for k, table in value_tables.items()}
+    writer = _Writer()
+    writer.value({
+        0: FORMAT_VERSION,
+        1: keys,
+        2: {key_index[k]: table for k, table in sorted(value_tables.items())},
+        3: sorted(key_index[k] for k in flag_keys),
+        4: _compact(doc, key_index, value_index, flag_keys)
+    })
+    return bytes(writer.out)
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+
+    def _arg(self, info):
+        if info < 24:
+            return info
+        size = {24: 1, 25: 2, 26: 4, 27: 8}.get(info)
+        if size is None:
+            raise ValueError(f"Unsupported CBOR length encoding {info}")
+        n = int.from_bytes(self.data[self.pos:self.pos + size], 'big')
+        self.pos += size
+        return n
+
+    def value(self):
+        initial = self.data[self.pos]
+        self.pos += 1
+        major, info = initial >> 5, initial & 0x1F
+        if major == 7:
+            if info == 20:
+                return False
+            if info == 21:
+                return True
+            if info == 22:
+                return None
+            if info == 26:
+                v = struct.unpack('>f', self.data[self.pos:self.pos + 4])[0]
+                self.pos += 4
+                return v
+            if info == 27:
+                v = struct.unpack('>d', self.data[self.pos:self.pos + 8])[0]
+                self.pos += 8
+                return v
+            raise ValueError(f"Unsupported CBOR simple value {info}")
+        n = self._arg(info)
+        if major == 0:
+            return n
+        if major == 1:
+            return -1 - n
+        if major == 3:
+            s = bytes(self.data[self.pos:self.pos + n]).decode('utf-8')
+            self.pos += n
+            return s
+        if major == 4:
+            return [self.value() for _ in range(n)]
+        if major == 5:
+            out = {}
+            for _ in range(n):
+                key = self.value()
+                out[key] = self.value()
+            return out
+        raise ValueError(f"Unsupported CBOR major type {major}")
+
+
+def _expand(node, keys, value_tables, flag_keys):
+    if isinstance(node, list):
+        return [_expand(item, keys, value_tables, flag_keys) for item in node]
+    if not isinstance(node, dict):
+        return node
+    out = {}
+    for index, value in node.items():
+        if index in flag_keys:
+            value = 'Y' if value else 'N'
+        elif index in value_tables:
+            value = value_tables[index][value]
+        else:
+            value = _expand(value, keys, value_tables, flag_keys)
+        out[keys[index]] = value
+    return out
+
+
+def decode_config(data):
+    """Decode bytes produced by encode_config back to the original document"""
+    header = _Reader(data).value()
+    if header.get(0) != FORMAT_VERSION:
+        raise ValueError(f"Unsupported config format version {header.get(0)}")
+    return _expand(header[4], header[1], header[2], set(header[3]))
@@ -0,0 +1,282 @@
+"""
+Versioned history of site configs in one SQLite file
+
+Every staging save and live publish is recorded as a version. A version is
+stored as content-addressed, zlib-compressed blobs:
+
+    base    the config with "devices" set to null (site info, services, ...)
+    devices one blob per device, listed in order as [[key, hash], ...]
+
+Unchanged devices share blobs between versions, so a save that touches one
+panel adds one small blob, and a diff between any two versions only decodes
+the base and the devices whose hashes differ.
+
+Retention keeps at most max_versions versions no older than max_age_days.
+The newest live version is always kept so live can be rebuilt.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    note TEXT NOT NULL DEFAULT '',
+    config_hash TEXT NOT NULL,
+    base_hash TEXT NOT NULL,
+    devices TEXT NOT NULL,
+    device_count INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_kind_created ON versions (kind, created_at);
+CREATE INDEX IF NOT EXISTS versions_created ON versions (created_at);
+"""
+
+LIST_COLUMNS = ('id', 'created_at', 'kind', 'name', 'note', 'config_hash', 'device_count', 'size')
+
+# Structural diffs stop listing changes for a device after this many
+MAX_CHANGES_PER_DEVICE = 200
+
+
+def _encode(value):
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def _hash(body):
+    return hashlib.sha1(body).hexdigest()
+
+
+def device_keys(devices):
+    """Stable keys for a device list: the device id, made unique by position when needed"""
+    keys = []
+    seen = set()
+    for i, device in enumerate(devices):
+        key = device.get('id') if isinstance(device, dict) else None
+        if not isinstance(key, str) or not key or key in seen:
+            key = f'#{i}'
+        seen.add(key)
+        keys.append(key)
+    return keys
+
+
+def diff_values(old, new, path, changes, limit=MAX_CHANGES_PER_DEVICE):
+    """Append {path, op: added|removed|changed, old, new} entries for old -> new"""
+    if len(changes) >= limit:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                changes.append({"path": f"{path}.{key}", "op": "removed", "old": old[key]})
+        for key, value in new.items():
+            if key not in old:
+                changes.append({"path": f"{path}.{key}", "op": "added", "new": value})
+            elif old[key] != value:
+                diff_values(old[key], value, f"{path}.{key}", changes, limit)
+    elif isinstance(old, list) and isinstance(new, list):
+        for i in range(max(len(old), len(new))):
+            if i >= len(new):
+                changes.append({"path": f"{path}[{i}]", "op": "removed", "old": old[i]})
+            elif i >= len(old):
+                changes.append({"path": f"{path}[{i}]", "op": "added", "new": new[i]})
+            elif old[i] != new[i]:
+                diff_values(old[i], new[i], f"{path}[{i}]", changes, limit)
+    elif old != new:
+        changes.append({"path": path, "op": "changed", "old": old, "new": new})
+    del changes[limit:]
+
+
+class ConfigHistory:
+    """SQLite-backed version store for site configs (safe across threads and processes)"""
+
+    def __init__(self, path, max_versions=200, max_age_days=90):
+        self.path = str(path)
+        self.max_versions = max_versions
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def _put_blob(self, db, body):
+        digest = _hash(body)
+        db.execute('INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)',
+                   (digest, zlib.compress(body, 6)))
+        return digest
+
+    def _get_blob(self, db, digest):
+        row = db.execute('SELECT data FROM blobs WHERE hash = ?', (digest,)).fetchone()
+        if row is None:
+            raise KeyError(f"Missing history blob {digest}")
+        return json.loads(zlib.decompress(row[0]))
+
+    def record(self, config, kind, name='', note='', created_at=None):
+        """Store a config version. Returns the version id, or the id of the
+        latest version of the same kind and name when the config is unchanged.
+        """
+        devices = config.get('devices') or []
+        base = dict(config)
+        base['devices'] = None
+        base_body = _encode(base)
+        device_bodies = [_encode(d) for d in devices]
+        config_hash = _hash(_encode(config))
+
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                'SELECT id, config_hash FROM versions WHERE kind = ? AND name = ? ORDER BY id DESC LIMIT 1',
+                (kind, name)
+            ).fetchone()
+            if row is not None and row[1] == config_hash:
+                return row[0]
+
+            base_hash = self._put_blob(db, base_body)
+            entries = [[key, self._put_blob(db, body)]
+                       for key, body in zip(device_keys(devices), device_bodies)]
+            cursor = db.execute(
+                'INSERT INTO versions (created_at, kind, name, note, config_hash, base_hash, devices, '
+                'device_count, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (created_at or time.time(), kind, name, note, config_hash, base_hash,
+                 json.dumps(entries), len(devices), len(base_body) + sum(map(len, device_bodies)))
+            )
+            version_id = cursor.lastrowid
+            self._prune(db)
+        return version_id
+
+    def list(self, kind=None, name=None, limit=50, before=None):
+        """Newest first. before: only versions with a smaller id (for paging)"""
+        query = f"SELECT {', '.join(LIST_COLUMNS)} FROM versions WHERE 1 = 1"
+        args = []
+        if kind:
+            query += ' AND kind = ?'
+            args.append(kind)
+        if name is not None:
+            query += ' AND name = ?'
+            args.append(name)
+        if before:
+            query += ' AND id < ?'
+            args.append(before)
+        query += ' ORDER BY id DESC LIMIT ?'
+        args.append(limit)
+        with self._lock:
+            rows = self._connect().execute(query, args).fetchall()
+        return [dict(zip(LIST_COLUMNS, row)) for row in rows]
+
+    def _row(self, db, version_id):
+        row = db.execute(
+            f"SELECT {', '.join(LIST_COLUMNS)}, base_hash, devices FROM versions WHERE id = ?",
+            (version_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        info = dict(zip(LIST_COLUMNS, row))
+        return info, row[-2], json.loads(row[-1])
+
+    def info(self, version_id):
+        with self._lock:
+            found = self._row(self._connect(), version_id)
+        return found[0] if found else None
+
+    def latest(self, kind):
+        rows = self.list(kind=kind, limit=1)
+        return rows[0] if rows else None
+
+    def get(self, version_id):
+        """Rebuild the config of a version, or None if it does not exist"""
+        with self._lock:
+            db = self._connect()
+            found = self._row(db, version_id)
+            if found is None:
+                return None
+            _, base_hash, entries = found
+            config = self._get_blob(db, base_hash)
+            config['devices'] = [self._get_blob(db, digest) for _, digest in entries]
+        return config
+
+    def diff(self, from_id, to_id):
+        """Structural diff between two versions, touching only changed devices.
+        Returns {from, to, settings: [changes], devices: {added, removed, changed: {key: [changes]}, moved}}
+        or None if a version does not exist.
+        """
+        with self._lock:
+            db = self._connect()
+            old = self._row(db, from_id)
+            new = self._row(db, to_id)
+            if old is None or new is None:
+                return None
+            old_info, old_base, old_entries = old
+            new_info, new_base, new_entries = new
+
+            settings = []
+            if old_base != new_base:
+                diff_values(self._get_blob(db, old_base), self._get_blob(db, new_base), '$', settings)
+
+            old_devices = dict(old_entries)
+            new_devices = dict(new_entries)
+            changed = {}
+            for key, digest in new_entries:
+                if key in old_devices and old_devices[key] != digest:
+                    changes = []
+                    diff_values(self._get_blob(db, old_devices[key]), self._get_blob(db, digest),
+                                '$', changes)
+                    changed[key] = changes
+
+        common_old = [k for k, _ in old_entries if k in new_devices]
+        common_new = [k for k, _ in new_entries if k in old_devices]
+        return {
+            "from": old_info,
+            "to": new_info,
+            "settings": settings,
+            "devices": {
+                "added": [k for k, _ in new_entries if k not in old_devices],
+                "removed": [k for k, _ in old_entries if k not in new_devices],
+                "changed": changed,
+                "reordered": common_old != common_new
+            }
+        }
+
+    def _prune(self, db):
+        """Apply retention, then drop blobs no version references"""
+        keep_live = db.execute("SELECT MAX(id) FROM versions WHERE kind = 'live'").fetchone()[0] or 0
+        cutoff = time.time() - self.max_age_days * 86400
+        deleted = db.execute(
+            'DELETE FROM versions WHERE id != ? AND (created_at < ? OR id NOT IN '
+            '(SELECT id FROM versions ORDER BY id DESC LIMIT ?))',
+            (keep_live, cutoff, self.max_versions)
+        ).rowcount
+        if not deleted:
+            return 0
+        referenced = set()
+        for base_hash, devices in db.execute('SELECT base_hash, devices FROM versions'):
+            referenced.add(base_hash)
+            referenced.update(digest for _, digest in json.loads(devices))
+        unreferenced = [(h,) for (h,) in db.execute('SELECT hash FROM blobs') if h not in referenced]
+        db.executemany('DELETE FROM blobs WHERE hash = ?', unreferenced)
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            db = self._connect()
+            versions, blobs = (db.execute('SELECT COUNT(*) FROM versions').fetchone()[0],
+                               db.execute('SELECT COUNT(*) FROM blobs').fetchone()[0])
+            stored = db.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM blobs').fetchone()[0]
+        return {"versions": versions, "blobs": blobs, "stored_bytes": stored,
+                "max_versions": self.max_versions, "max_age_days": self.max_age_days}
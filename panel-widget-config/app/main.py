@@ -5,12 +5,39 @@ Generates and validates JSON configuration for ESPHome panel widgets
 """
 
 import os
+import re
 import json
+import copy
+import heapq
+import hashlib
 import logging
+import threading
+import time
+import atexit
+import shutil
+from contextlib import contextmanager
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_file, send_from_directory, Response, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
 import requests
+from config_codec import encode_config
+from config_history import ConfigHistory
+from art_catalogue import ArtCatalogue, IMAGE_EXTENSIONS, probe_jpeg, panel_compatibility, file_sha1
+from art_ingest import ArtIngest, IngestBusy
+from upload_sessions import UploadSessions, UploadError
+try:
+    import websocket  # websocket-client, used for the live entity-state mirror
+except ImportError:
+    websocket = None
+try:
+    import fcntl
+except ImportError:  # Not available on Windows dev machines
+    fcntl = None
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Configuration
 HA_TOKEN = os.environ.get('SUPERVISOR_TOKEN', '')
@@ -56,6 +83,10 @@ except Exception as e:
 
 print(f"[VERSION DEBUG] Final ADDON_VERSION: {ADDON_VERSION}", flush=True)
 
+# gunicorn worker model chosen by run.sh from the add-on options
+SERVER_MODE = os.environ.get('SERVER_MODE', 'gthread')
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '32'))
+
 # Determine if running in HA add-on mode or local development
 RUNNING_IN_HA = os.path.exists('/config') and os.environ.get('SUPERVISOR_TOKEN')
 
@@ -125,6 +156,1321 @@ STAGING_DIR = ADDON_CONFIG / 'staging'
 STAGING_DIR.mkdir(parents=True, exist_ok=True)
 logger.info(f"Staging directory: {STAGING_DIR}")
 
+
+# =============================================================================
+# LIVE CONFIG CACHE
+# =============================================================================
+
+class ConfigStore:
+    """In-memory parsed copy of a JSON config file.
+
+    The parsed document is revalidated with a single stat() per read and only
+    re-parsed when (mtime_ns, size, inode) changes, so it also picks up writes
+    made by the other gunicorn worker. The returned dict is shared between
+    requests - treat it as read-only and use load_copy() before mutating.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        # (stat key, parsed document, generation), always replaced as one tuple so
+        # the lock-free read in load() never pairs a new key with old data
+        self._state = (None, None, 0)
+        self._body = None  # (stat key, encoded JSON) of the cached document
+
+    @property
+    def generation(self):
+        """Bumped whenever a new document is loaded"""
+        return self._state[2]
+
+    def _stat_key(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def exists(self):
+        return self._stat_key() is not None
+
+    @staticmethod
+    def _etag_for(key):
+        return '-'.join(f'{v:x}' for v in key)
+
+    def etag(self):
+        """Strong ETag derived from the file's (mtime_ns, size, inode), or None if missing"""
+        key = self._stat_key()
+        return self._etag_for(key) if key is not None else None
+
+    def body(self):
+        """Return (encoded JSON bytes, etag) of the document, or (None, None) if missing.
+        The encoding is cached, so an unchanged file costs neither a parse nor an encode.
+        """
+        state = self._load_state()
+        if state[1] is None:
+            return None, None
+        with self._lock:
+            if self._body is None or self._body[0] != state[0]:
+                self._body = (state[0], app.json.dumps(state[1]).encode() + b'\n')
+            key, body = self._body
+        return body, self._etag_for(key)
+
+    def _load_state(self):
+        """Return the current (stat key, document, generation), re-parsing the file if it changed"""
+        key = self._stat_key()
+        state = self._state
+        if key is None:
+            if state[1] is not None:
+                self.invalidate()
+            return self._state
+        if key == state[0]:
+            return state
+        with self._lock:
+            state = self._state
+            if key == state[0]:
+                return state
+            with open(self.path, 'r') as f:
+                st = os.fstat(f.fileno())
+                data = json.load(f)
+            state = self._state = ((st.st_mtime_ns, st.st_size, st.st_ino), data, state[2] + 1)
+            logger.info(f"Parsed config {self.path} (generation {state[2]})")
+            return state
+
+    def load(self):
+        """Return the parsed config, or None if the file does not exist.
+        Raises json.JSONDecodeError if the file is not valid JSON.
+        """
+        return self._load_state()[1]
+
+    def snapshot(self):
+        """Return (document, generation) read together, so the generation labels that document"""
+        _, data, generation = self._load_state()
+        return data, generation
+
+    def load_copy(self):
+        """Return a private deep copy of the config (or None) that callers may mutate"""
+        data = self.load()
+        return copy.deepcopy(data) if data is not None else None
+
+    def update(self, data):
+        """Record a document that was just written to disk, avoiding a re-parse"""
+        with self._lock:
+            key = self._stat_key()
+            self._state = (key, data if key is not None else None, self._state[2] + 1)
+
+    def invalidate(self):
+        """Drop the cached document; the next load() re-reads the file"""
+        with self._lock:
+            self._state = (None, None, self._state[2] + 1)
+
+
+LIVE_STORE = ConfigStore(LIVE_CONFIG)
+
+# Stores for staging files, keyed by path (created on first load of an existing file)
+_staging_stores = {}
+
+
+def staging_store(path):
+    store = _staging_stores.get(path)
+    if store is None:
+        store = ConfigStore(path)
+        if not path.exists():
+            return store  # Not cached, so lookups of missing names cannot grow the dict
+        store = _staging_stores.setdefault(path, store)
+    return store
+
+
+# =============================================================================
+# CONDITIONAL GET HELPERS
+# =============================================================================
+
+def etag_matches(etag):
+    return etag is not None and etag in request.if_none_match
+
+
+def json_body_response(body, etag):
+    """Pre-encoded JSON response carrying a strong ETag; 304 when the client copy matches"""
+    if etag_matches(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Always revalidate, but allow the browser to keep the body
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+# Encoded bodies for content that only changes with the add-on version
+_static_bodies = {}
+
+
+def static_json_response(key, build):
+    entry = _static_bodies.get(key)
+    if entry is None:
+        body = app.json.dumps(build()).encode() + b'\n'
+        etag = hashlib.sha1(ADDON_VERSION.encode() + body).hexdigest()
+        entry = _static_bodies[key] = (body, etag)
+    return json_body_response(*entry)
+
+
+# =============================================================================
+# CONFIG PERSISTENCE
+# =============================================================================
+
+# Cross-process lock serializing every config read-modify-write and publish
+CONFIG_LOCK_FILE = ADDON_CONFIG / '.config.lock'
+_config_thread_lock = threading.RLock()
+
+
+@contextmanager
+def config_lock():
+    """Exclusive lock across threads and gunicorn workers for config writes"""
+    with _config_thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(CONFIG_LOCK_FILE, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write_json(path, data, compact=False):
+    """Write JSON via temp file + fsync + os.replace so readers never see a torn file.
+    Staging files stay pretty-printed; compact=True is used for the live file panels download.
+    """
+    if compact:
+        body = json.dumps(data, separators=(',', ':'))
+    else:
+        body = json.dumps(data, indent=2)
+    atomic_write_bytes(path, body.encode())
+
+
+def atomic_write_bytes(path, body):
+    """Replace path with body atomically (temp file + fsync + os.replace + directory fsync)"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    try:
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+
+# =============================================================================
+# CONFIG HISTORY
+# =============================================================================
+
+# Retention for config_history.db (add-on options history_max_versions / history_max_days)
+CONFIG_HISTORY_MAX_VERSIONS = int(os.environ.get('CONFIG_HISTORY_MAX_VERSIONS', '200'))
+CONFIG_HISTORY_MAX_DAYS = int(os.environ.get('CONFIG_HISTORY_MAX_DAYS', '90'))
+
+config_history = ConfigHistory(ADDON_CONFIG / 'config_history.db',
+                               max_versions=CONFIG_HISTORY_MAX_VERSIONS,
+                               max_age_days=CONFIG_HISTORY_MAX_DAYS)
+
+
+def record_history(data, kind, name='', note='', created_at=None):
+    """Record a config version; history failures never block a save"""
+    try:
+        return config_history.record(data, kind, name=name, note=note, created_at=created_at)
+    except Exception as e:
+        logger.error(f"Failed to record config history ({kind} {name}): {e}")
+        return None
+
+
+def record_existing(path, kind, name=''):
+    """Record the file about to be overwritten, unless it already is its latest version
+    (first save after upgrading from backup files, or a file edited outside the add-on).
+    Caller must hold config_lock().
+    """
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        modified = path.stat().st_mtime
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        logger.warning(f"Could not record previous {path.name} in the history: {e}")
+        return
+    if isinstance(data, dict):
+        record_history(data, kind, name=name, note='Previous file contents', created_at=modified)
+
+
+def import_legacy_backups():
+    """Move site_settings_staging_backup_<timestamp>.json files into the history"""
+    with config_lock():
+        backups = sorted(ADDON_CONFIG.glob('site_settings_staging_backup_*.json'), key=lambda p: p.stat().st_mtime)
+        for path in backups:
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                if not isinstance(data, dict):
+                    raise ValueError("not a config object")
+                config_history.record(data, 'staging', name='site_settings_staging.json',
+                                      note=f'Imported {path.name}', created_at=path.stat().st_mtime)
+                path.unlink()
+            except Exception as e:
+                logger.warning(f"Could not import legacy backup {path.name}: {e}")
+        if backups:
+            logger.info(f"Imported {len(backups)} legacy staging backups into the config history")
+
+
+import_legacy_backups()
+
+
+def write_live_config(data, note=''):
+    """Publish a config to the live location. Caller must hold config_lock().
+    The publish is recorded in the config history with `note`.
+    Returns the per-device slice stats from publish_device_slices().
+    """
+    record_existing(LIVE_CONFIG, 'live')
+    atomic_write_json(LIVE_CONFIG, data, compact=True)
+    LIVE_STORE.update(data)
+    record_history(data, 'live', note=note)
+    # The JSON is live at this point; derived files failing must not fail the save
+    try:
+        if BINARY_CONFIG:
+            atomic_write_bytes(LIVE_CONFIG_BINARY, encode_config(data))
+        else:
+            LIVE_CONFIG_BINARY.unlink(missing_ok=True)
+    except Exception as e:
+        logger.error(f"Failed to write {LIVE_CONFIG_BINARY}: {e}")
+    try:
+        return publish_device_slices(data)
+    except Exception as e:
+        logger.error(f"Failed to publish device slices: {e}")
+        return {"error": str(e)}
+
+
+# Optional compact CBOR renditions (see config_codec.py), written next to the JSON files
+BINARY_CONFIG = os.environ.get('BINARY_CONFIG', 'false').lower() in ('1', 'true', 'yes')
+LIVE_CONFIG_BINARY = LIVE_CONFIG.with_suffix('.cbor')
+
+# Per-device slices of the live config: panel_widgets/devices/<id>.json
+DEVICE_SLICES_DIR = LIVE_CONFIG.parent / 'devices'
+DEVICE_SLICES_MANIFEST = DEVICE_SLICES_DIR / 'index.json'
+
+# Site services a panel only needs when it has one of these widgets.
+# Services not listed here (e.g. audio, which carries the EQ profiles) go to every panel.
+SLICE_SERVICE_WIDGETS = {
+    'cameras': ('cctv',),
+    'weather': ('weather',),
+    'slideshow': ('art', 'art3', 'slideshow'),
+}
+
+
+def safe_slice_name(device_id):
+    """File name for a device slice, or None if the ID cannot be used as one.
+    IDs that had to be rewritten get a short hash of the raw ID, so "a b" and "a_b"
+    do not share a file.
+    """
+    device_id = str(device_id)
+    name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in device_id)
+    if not name.strip('._'):
+        return None
+    if name != device_id:
+        name += '-' + hashlib.sha1(device_id.encode()).hexdigest()[:6]
+    return f"{name}.json"
+
+
+def build_device_slice(config, device):
+    """Site-wide settings plus one device, in the same shape as site_settings.json"""
+    widgets = device.get('widgets') or {}
+    services = {}
+    for name, value in (config.get('services') or {}).items():
+        needed_by = SLICE_SERVICE_WIDGETS.get(name)
+        if needed_by is None:
+            services[name] = value
+        elif any(widgets.get(w) for w in needed_by):
+            services[name] = value
+
+    # Only the cameras this panel's CCTV widget references
+    if 'cameras' in services:
+        camera_ids = {c.get('id') for c in (widgets.get('cctv') or []) if isinstance(c, dict)}
+        services['cameras'] = [c for c in services['cameras'] if c.get('id') in camera_ids]
+
+    return {
+        "site_meta": config.get('site_meta', {}),
+        "site_info": config.get('site_info', {}),
+        "defaults": config.get('defaults', {}),
+        "services": services,
+        "devices": [device]
+    }
+
+
+def publish_device_slices(config):
+    """Write one slice per device, rewriting only slices whose content hash changed.
+    Caller must hold config_lock(). Returns {written, unchanged, removed}.
+    """
+    DEVICE_SLICES_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(DEVICE_SLICES_MANIFEST, 'r') as f:
+            previous = json.load(f).get('devices', {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        previous = {}
+
+    manifest = {}
+    used = {}  # file name -> device id
+    written = unchanged = 0
+    for device in config.get('devices', []):
+        device_id = device.get('id', '')
+        filename = safe_slice_name(device_id)
+        if not filename or device_id in manifest:
+            continue
+        if filename in used:
+            logger.warning(f"Device '{device_id}' maps to slice {filename} of '{used[filename]}', not published")
+            continue
+        used[filename] = device_id
+        device_slice = build_device_slice(config, device)
+        body = json.dumps(device_slice, separators=(',', ':'))
+        digest = hashlib.sha1(body.encode()).hexdigest()
+        entry = {"file": filename, "sha1": digest, "size": len(body)}
+        binary_file = Path(filename).with_suffix('.cbor').name
+        if BINARY_CONFIG:
+            entry["cbor_file"] = binary_file
+        manifest[device_id] = entry
+
+        old = previous.get(device_id)
+        if old and old.get('sha1') == digest and old.get('file') == filename \
+                and (DEVICE_SLICES_DIR / filename).exists() \
+                and (not BINARY_CONFIG or (DEVICE_SLICES_DIR / binary_file).exists()):
+            if BINARY_CONFIG and 'cbor_size' in old:
+                entry["cbor_size"] = old['cbor_size']
+            unchanged += 1
+            continue
+        atomic_write_bytes(DEVICE_SLICES_DIR / filename, body.encode())
+        if BINARY_CONFIG:
+            binary = encode_config(device_slice)
+            atomic_write_bytes(DEVICE_SLICES_DIR / binary_file, binary)
+            entry["cbor_size"] = len(binary)
+        written += 1
+
+    # Remove slices of devices that left the config
+    current_files = {f for entry in manifest.values() for f in (entry['file'], entry.get('cbor_file')) if f}
+    removed = 0
+    for entry in previous.values():
+        stale = [f for f in (entry.get('file'), entry.get('cbor_file')) if f and f not in current_files]
+        for f in stale:
+            (DEVICE_SLICES_DIR / Path(f).name).unlink(missing_ok=True)
+        if entry.get('file') in stale:
+            removed += 1
+
+    atomic_write_json(DEVICE_SLICES_MANIFEST, {
+        "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "devices": manifest
+    }, compact=True)
+    logger.info(f"Device slices: {written} written, {unchanged} unchanged, {removed} removed")
+    return {"written": written, "unchanged": unchanged, "removed": removed}
+
+
+def apply_eq_update(update):
+    """Merge EQ profile fields into services.audio of the live config and write it.
+    Returns the number of profiles in the update.
+    """
+    with config_lock():
+        config = LIVE_STORE.load_copy()
+        if config is None:
+            raise FileNotFoundError(str(LIVE_CONFIG))
+
+        # Ensure services.audio exists
+        if 'services' not in config:
+            config['services'] = {}
+        if 'audio' not in config['services']:
+            config['services']['audio'] = {}
+
+        audio = config['services']['audio']
+
+        # Merge EQ profile data (preserve all other audio fields)
+        for key in ('eq_enabled', 'eq_active_profile', 'eq_profiles'):
+            if key in update:
+                audio[key] = update[key]
+
+        write_live_config(config, note='EQ profiles')
+    return len(update.get('eq_profiles', {}))
+
+
+# Rapid EQ saves (slider drags) within this window become one disk write
+EQ_SAVE_DEBOUNCE_SECS = float(os.environ.get('EQ_SAVE_DEBOUNCE_SECS', '0.5'))
+# Longest an EQ save request waits for its coalesced write after the window
+EQ_SAVE_TIMEOUT = 30
+
+
+class EqSaveBatch:
+    """EQ updates that are written to disk together"""
+
+    def __init__(self):
+        self.update = {}
+        self.count = 0
+        self.done = threading.Event()
+        self.error = None  # Exception from the write, once done
+
+
+class EqSaveCoalescer:
+    """Collects EQ updates and writes the merged result once per debounce window.
+    submit() returns the batch the update joined; requests wait on batch.done so a
+    save is only reported (with its error, if any) once it is on disk.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending = None
+        self._timer = None
+        self.writes = 0
+        self.submitted = 0
+
+    def submit(self, update):
+        with self._lock:
+            self.submitted += 1
+            batch = self._pending
+            if batch is None:
+                batch = self._pending = EqSaveBatch()
+            batch.update.update(update)
+            batch.count += 1
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return batch
+
+    def flush(self):
+        """Write any pending update now (also called before reads and at exit)"""
+        with self._lock:
+            batch, self._pending = self._pending, None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if batch is None:
+            return
+        try:
+            apply_eq_update(batch.update)
+            with self._lock:
+                self.writes += 1
+            logger.info(f"Saved EQ profiles to {LIVE_CONFIG} ({batch.count} updates coalesced)")
+        except Exception as e:
+            logger.error(f"Failed to save EQ config: {e}")
+            batch.error = e
+        finally:
+            batch.done.set()
+
+
+eq_saver = EqSaveCoalescer(EQ_SAVE_DEBOUNCE_SECS)
+atexit.register(eq_saver.flush)
+
+
+# =============================================================================
+# HOME ASSISTANT API CLIENT
+# =============================================================================
+
+# Pool and retry policy (override via environment for large installs)
+HA_POOL_SIZE = int(os.environ.get('HA_POOL_SIZE', '16'))
+HA_RETRIES = int(os.environ.get('HA_RETRIES', '2'))
+HA_RETRY_BACKOFF = float(os.environ.get('HA_RETRY_BACKOFF', '0.3'))
+HA_CONNECT_TIMEOUT = 3.05
+
+# Read timeouts (seconds) per call class
+HA_TIMEOUTS = {
+    'lookup': 5,    # Single entity lookups / entity lists for the UI
+    'state': 10,    # State reads and writes from the controller
+    'service': 10,  # Service calls that reach the panel firmware
+}
+
+# Circuit breaker: open after this many consecutive failures, probe again after HA_BREAKER_RESET seconds
+HA_BREAKER_THRESHOLD = int(os.environ.get('HA_BREAKER_THRESHOLD', '5'))
+HA_BREAKER_RESET = float(os.environ.get('HA_BREAKER_RESET', '10'))
+
+# Seconds a 404 entity lookup is remembered
+HA_NOT_FOUND_TTL = float(os.environ.get('HA_NOT_FOUND_TTL', '10'))
+
+
+class HAUnavailable(requests.exceptions.ConnectionError):
+    """Raised without contacting HA while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Fail fast while Home Assistant is down.
+
+    closed: requests pass. After `threshold` consecutive failures the breaker
+    opens and requests raise HAUnavailable immediately. Once `reset_after`
+    seconds have passed it goes half-open and lets a single probe through:
+    success closes it, failure opens it for another period.
+
+    Only connection errors and 502-504 from the Supervisor proxy count as
+    failures; a read timeout (an offline panel behind a service call) does not.
+    """
+
+    def __init__(self, threshold=HA_BREAKER_THRESHOLD, reset_after=HA_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+
+    def before_request(self):
+        with self._lock:
+            if self.state == 'closed':
+                return
+            remaining = self.opened_at + self.reset_after - time.monotonic()
+            if self.state == 'open' and remaining <= 0:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                logger.info("HA circuit half-open, probing")
+                return
+            self.rejected += 1
+        raise HAUnavailable(f"Home Assistant unavailable, retrying in {max(remaining, 0):.0f}s")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("HA circuit closed, Home Assistant reachable again")
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_neutral(self):
+        """A request that says nothing about HA's health; frees the half-open probe"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.threshold):
+                logger.warning(f"HA circuit open after {self.failures} failures, "
+                               f"failing fast for {self.reset_after:.0f}s")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def status(self):
+        with self._lock:
+            status = {
+                "state": self.state,
+                "failures": self.failures,
+                "rejected": self.rejected
+            }
+            if self.state != 'closed':
+                status["retry_in"] = round(max(self.opened_at + self.reset_after - time.monotonic(), 0), 1)
+            return status
+
+
+class NotFoundCache:
+    """Short-lived memory of entity ids HA answered 404 for"""
+
+    MAX_ENTRIES = 4096
+
+    def __init__(self, ttl=HA_NOT_FOUND_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._expires = {}
+        self.hits = 0
+
+    def __contains__(self, entity_id):
+        with self._lock:
+            expires = self._expires.get(entity_id)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._expires[entity_id]
+                return False
+            self.hits += 1
+            return True
+
+    def add(self, entity_id):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if len(self._expires) >= self.MAX_ENTRIES:
+                self._expires = {e: t for e, t in self._expires.items() if t >= now}
+            if len(self._expires) < self.MAX_ENTRIES:
+                self._expires[entity_id] = now + self.ttl
+
+    def discard(self, entity_id, *args):
+        """Forget an entity (also usable as a state mirror listener)"""
+        with self._lock:
+            self._expires.pop(entity_id, None)
+
+    def __len__(self):
+        return len(self._expires)
+
+
+class HAClient:
+    """Keep-alive HTTP client for the Home Assistant REST API.
+
+    One pooled requests.Session is shared by all request threads so bursts of
+    controller calls reuse TCP connections instead of opening one per call.
+    Only idempotent requests are retried on read errors; connection errors
+    (raised before the request reaches HA) are retried for every method.
+    All requests go through a circuit breaker so a restarting HA core costs
+    one timeout per probe instead of one per call.
+    """
+
+    def __init__(self, base_url, token, pool_size=HA_POOL_SIZE,
+                 retries=HA_RETRIES, backoff=HA_RETRY_BACKOFF):
+        self.base_url = base_url
+        self.breaker = CircuitBreaker()
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json'
+        })
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=retry, pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, path):
+        return f'{self.base_url}/{path.lstrip("/")}'
+
+    def request(self, method, path, timeout='state', **kwargs):
+        """Issue a request; timeout is a key of HA_TIMEOUTS or a number"""
+        read_timeout = HA_TIMEOUTS.get(timeout, 10) if isinstance(timeout, str) else timeout
+        self.breaker.before_request()
+        try:
+            response = self.session.request(method, self.url(path),
+                                            timeout=(HA_CONNECT_TIMEOUT, read_timeout), **kwargs)
+        except requests.exceptions.ConnectionError:
+            # Includes connect timeouts: HA itself is not reachable
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            # Read timeouts are usually a slow device behind a service call, not HA
+            self.breaker.record_neutral()
+            raise
+        # 502-504 come from the Supervisor proxy while HA core is down
+        if response.status_code in (502, 503, 504):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, path, timeout='state', **kwargs):
+        return self.request('GET', path, timeout=timeout, **kwargs)
+
+    def post(self, path, timeout='service', **kwargs):
+        return self.request('POST', path, timeout=timeout, **kwargs)
+
+
+ha_client = HAClient(HA_API, HA_TOKEN)
+ha_not_found = NotFoundCache()
+
+# Shared pool for fanning out independent HA calls from one request
+ha_executor = ThreadPoolExecutor(max_workers=HA_POOL_SIZE, thread_name_prefix='ha-call')
+
+
+# =============================================================================
+# HA STATES SNAPSHOT CACHE
+# =============================================================================
+
+# Seconds a /states snapshot is served before it is re-fetched
+HA_STATES_TTL = float(os.environ.get('HA_STATES_TTL', '15'))
+
+
+class EntitySearchIndex:
+    """Typeahead index over entity_id and friendly_name.
+
+    Entries are split into words (on non-alphanumerics) and each word maps to
+    the entries containing it. Query terms are matched against the word
+    vocabulary, which is far smaller than the entity list: short terms by word
+    prefix, longer ones by trigram intersection plus a substring check. Only
+    the page being returned is fully ranked.
+    """
+
+    SPLIT = re.compile(r'[^0-9a-z]+')
+
+    def __init__(self, entries):
+        # entries: [(entity_id, friendly_name)]
+        self.entries = entries
+        self.keys = []  # (entity_id, object_id, name) lowercased
+        self.by_domain = {}
+        self.words = {}  # word -> {entry index}
+        for i, (entity_id, name) in enumerate(entries):
+            entity_id = entity_id.lower()
+            name = str(name).lower()
+            self.keys.append((entity_id, entity_id.split('.', 1)[-1], name))
+            self.by_domain.setdefault(entity_id.split('.', 1)[0], set()).add(i)
+            for word in self.SPLIT.split(f"{entity_id} {name}"):
+                if word:
+                    self.words.setdefault(word, set()).add(i)
+
+        self.short_prefixes = {}  # 1-2 character prefix -> {word}
+        self.trigrams = {}  # trigram -> {word}
+        for word in self.words:
+            for n in (1, 2):
+                if len(word) >= n:
+                    self.short_prefixes.setdefault(word[:n], set()).add(word)
+            for j in range(len(word) - 2):
+                self.trigrams.setdefault(word[j:j + 3], set()).add(word)
+
+    def _matching_words(self, term):
+        if len(term) < 3:
+            # Short terms only match word starts, substring hits would be noise
+            return self.short_prefixes.get(term, set())
+        sets = []
+        for j in range(len(term) - 2):
+            words = self.trigrams.get(term[j:j + 3])
+            if not words:
+                return set()
+            sets.append(words)
+        sets.sort(key=len)
+        return {w for w in set.intersection(*sets) if term in w}
+
+    def search(self, query, domain=None, limit=None):
+        """Return (total, entry indexes) for entries matching every query term.
+        Indexes are best first; only the first `limit` are ranked and returned.
+        """
+        query = query.strip().lower()
+        terms = [t for t in self.SPLIT.split(query) if t]
+        candidates = self.by_domain.get(domain.lower(), set()) if domain else None
+        if not terms:
+            ids = candidates if candidates is not None else range(len(self.entries))
+            ordered = sorted(ids, key=lambda i: self.keys[i][0])
+            return len(ordered), ordered[:limit]
+
+        word_starts = []  # Per term, entries where some word starts with it
+        for term in sorted(terms, key=len, reverse=True):
+            ids = set()
+            starts = set()
+            for word in self._matching_words(term):
+                ids |= self.words[word]
+                if word.startswith(term):
+                    starts |= self.words[word]
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return 0, []
+            word_starts.append(starts)
+
+        def rank(i):
+            entity_id, object_id, name = self.keys[i]
+            if query in (entity_id, object_id, name):
+                r = 0
+            elif object_id.startswith(query) or name.startswith(query):
+                r = 1
+            elif all(i in starts for starts in word_starts):
+                r = 2
+            else:
+                r = 3
+            return (r, len(entity_id), entity_id)
+
+        if limit is None:
+            return len(candidates), sorted(candidates, key=rank)
+        return len(candidates), heapq.nsmallest(limit, candidates, key=rank)
+
+
+class StatesSnapshot:
+    """Immutable view of one /states download, indexed by entity and domain"""
+
+    # Last search index built; reused while no entity was added, removed or renamed
+    _last_index = (None, None)
+    _index_lock = threading.Lock()
+
+    def __init__(self, states):
+        self.fetched_at = time.time()
+        self._search_index = None
+        self.by_id = {}
+        self.by_domain = {}
+        for s in states:
+            entity_id = s.get('entity_id', '')
+            self.by_id[entity_id] = s
+            domain = entity_id.split('.', 1)[0]
+            self.by_domain.setdefault(domain, []).append({
+                "entity_id": entity_id,
+                "name": s.get('attributes', {}).get('friendly_name', entity_id),
+                "state": s.get('state')
+            })
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+    @property
+    def search_index(self):
+        """EntitySearchIndex over all entities, built on first use"""
+        if self._search_index is None:
+            entries = tuple((e['entity_id'], e['name']) for rows in self.by_domain.values() for e in rows)
+            with StatesSnapshot._index_lock:
+                last_entries, index = StatesSnapshot._last_index
+                if last_entries != entries:
+                    index = EntitySearchIndex(entries)
+                    StatesSnapshot._last_index = (entries, index)
+                self._search_index = index
+        return self._search_index
+
+
+class StatesCache:
+    """TTL-bounded cache of HA's /states list.
+
+    Concurrent callers that find the snapshot stale are coalesced: one thread
+    performs the upstream fetch while the others wait for its result.
+    """
+
+    def __init__(self, client, ttl=HA_STATES_TTL):
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._inflight = None  # threading.Event while a fetch is running
+        self._last_result = (None, None)
+        self.fetch_count = 0
+
+    def get(self, max_age=None, force=False):
+        """Return (snapshot, error). Serves the cached snapshot while it is fresh"""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            snapshot = self._snapshot
+            if not force and snapshot is not None and snapshot.age < max_age:
+                return snapshot, None
+            inflight = self._inflight
+            if inflight is None:
+                inflight = self._inflight = threading.Event()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            inflight.wait()
+            return self._last_result
+
+        # Followers read _last_result, so it is set even if the fetch raises
+        result = (None, "Failed to fetch states from Home Assistant")
+        try:
+            result = self._fetch()
+        finally:
+            with self._lock:
+                self._last_result = result
+                self._inflight = None
+            inflight.set()
+        return result
+
+    def _fetch(self):
+        try:
+            response = self.client.get('states', timeout='lookup')
+            if response.status_code != 200:
+                logger.error(f"HA API error: {response.status_code} - {response.text}")
+                result = (None, f"HA API returned {response.status_code}")
+            else:
+                snapshot = StatesSnapshot(response.json())
+                self.fetch_count += 1
+                logger.info(f"Fetched {len(snapshot.by_id)} states from HA")
+                with self._lock:
+                    self._snapshot = snapshot
+                result = (snapshot, None)
+        except HAUnavailable as e:
+            result = (None, str(e))
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to fetch states: {e}")
+            result = (None, "Cannot connect to Home Assistant API")
+        except Exception as e:
+            logger.error(f"Failed to process states from HA: {e}")
+            result = (None, f"Invalid states response from Home Assistant: {e}")
+        return result
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+
+states_cache = StatesCache(ha_client)
+
+
+# =============================================================================
+# LIVE ENTITY-STATE MIRROR (HA WebSocket API)
+# =============================================================================
+
+# Supervisor proxies the HA WebSocket API next to the REST API
+HA_WS_URL = os.environ.get('HA_WS_URL', HA_API.replace('http', 'ws', 1) + '/websocket' if HA_API else '')
+HA_WS_MIRROR = os.environ.get('HA_WS_MIRROR', '1') != '0'
+
+
+class EntityStateMirror:
+    """In-memory mirror of HA entity states kept current by state_changed events.
+
+    A daemon thread authenticates against the WebSocket API, subscribes to
+    state_changed and seeds the mirror with get_states. get() only answers
+    while the connection is up; callers fall back to REST otherwise.
+    Service (un)registration events are passed on to event_listeners.
+    """
+
+    PING_INTERVAL = 30
+    MAX_BACKOFF = 60
+    SERVICE_EVENTS = ('service_registered', 'service_removed')
+
+    def __init__(self, url, token):
+        self.url = url
+        self.token = token
+        self._states = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._msg_id = 0
+        self.events_received = 0
+        self.listeners = []  # Callables (entity_id, new_state) run on every change
+        self.event_listeners = []  # Callables (event_type, data) run on SERVICE_EVENTS
+        self.disconnect_listeners = []  # Callables () run when a seeded connection drops
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def get(self, entity_id):
+        """Return the mirrored state dict, or None if unknown or not connected"""
+        if not self._ready.is_set():
+            return None
+        return self._states.get(entity_id)
+
+    def snapshot(self):
+        """Return {entity_id: state} of all mirrored entities, or None if not connected"""
+        if not self._ready.is_set():
+            return None
+        with self._lock:
+            return dict(self._states)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='ha-state-mirror', daemon=True)
+        self._thread.start()
+
+    def _next_id(self):
+        self._msg_id += 1
+        return self._msg_id
+
+    def _run(self):
+        backoff = 1
+        while True:
+            try:
+                self._session()
+                backoff = 1
+            except Exception as e:
+                logger.warning(f"HA state mirror disconnected: {e}")
+            if self._ready.is_set():
+                self._ready.clear()
+                self._notify_disconnect()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.MAX_BACKOFF)
+
+    def _session(self):
+        ws = websocket.create_connection(self.url, timeout=10)
+        try:
+            msg = json.loads(ws.recv())
+            if msg.get('type') == 'auth_required':
+                ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+                msg = json.loads(ws.recv())
+            if msg.get('type') != 'auth_ok':
+                raise RuntimeError(f"authentication failed: {msg.get('message', msg.get('type'))}")
+
+            self._msg_id = 0
+            subscribe_id = self._next_id()
+            ws.send(json.dumps({"id": subscribe_id, "type": "subscribe_events", "event_type": "state_changed"}))
+            for event_type in self.SERVICE_EVENTS:
+                ws.send(json.dumps({"id": self._next_id(), "type": "subscribe_events", "event_type": event_type}))
+            seed_id = self._next_id()
+            ws.send(json.dumps({"id": seed_id, "type": "get_states"}))
+            logger.info(f"HA state mirror connected to {self.url}")
+
+            # Entities changed while the seed was in flight are newer than the seed
+            changed_before_seed = set()
+            seeded = False
+            ping_pending = False
+            ws.settimeout(self.PING_INTERVAL)
+            while True:
+                try:
+                    raw = ws.recv()
+                except websocket.WebSocketTimeoutException:
+                    if ping_pending:
+                        raise RuntimeError("ping timeout")
+                    ws.send(json.dumps({"id": self._next_id(), "type": "ping"}))
+                    ping_pending = True
+                    continue
+                if not raw:
+                    raise RuntimeError("connection closed")
+                ping_pending = False
+                msg = json.loads(raw)
+                msg_type = msg.get('type')
+
+                if msg_type == 'event':
+                    event = msg.get('event', {})
+                    data = event.get('data', {})
+                    if event.get('event_type') in self.SERVICE_EVENTS:
+                        self._notify_event(event['event_type'], data)
+                        continue
+                    entity_id = data.get('entity_id')
+                    if not entity_id:
+                        continue
+                    self.events_received += 1
+                    new_state = data.get('new_state')
+                    with self._lock:
+                        if new_state is None:
+                            self._states.pop(entity_id, None)
+                        else:
+                            self._states[entity_id] = new_state
+                    if not seeded:
+                        changed_before_seed.add(entity_id)
+                    self._notify(entity_id, new_state)
+                elif msg_type == 'result' and msg.get('id') == seed_id:
+                    if not msg.get('success'):
+                        raise RuntimeError(f"get_states failed: {msg.get('error')}")
+                    with self._lock:
+                        states = {s['entity_id']: s for s in msg.get('result', [])}
+                        for entity_id in changed_before_seed:
+                            if entity_id in self._states:
+                                states[entity_id] = self._states[entity_id]
+                            else:
+                                states.pop(entity_id, None)
+                        self._states = states
+                    seeded = True
+                    self._ready.set()
+                    logger.info(f"HA state mirror seeded with {len(states)} entities")
+                    # Anything may have changed while we were disconnected
+                    for entity_id, state in states.items():
+                        self._notify(entity_id, state)
+                elif msg_type == 'result' and msg.get('id') == subscribe_id and not msg.get('success'):
+                    raise RuntimeError(f"subscribe_events failed: {msg.get('error')}")
+        finally:
+            ws.close()
+
+    def _notify(self, entity_id, new_state):
+        for listener in self.listeners:
+            try:
+                listener(entity_id, new_state)
+            except Exception as e:
+                logger.error(f"State listener failed for {entity_id}: {e}")
+
+    def _notify_disconnect(self):
+        for listener in self.disconnect_listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Disconnect listener failed: {e}")
+
+    def _notify_event(self, event_type, data):
+        for listener in self.event_listeners:
+            try:
+                listener(event_type, data)
+            except Exception as e:
+                logger.error(f"Event listener failed for {event_type}: {e}")
+
+
+state_mirror = EntityStateMirror(HA_WS_URL, HA_TOKEN)
+
+
+class StateSubscriber:
+    """Pending state changes for one stream client.
+
+    Changes are coalesced per entity (latest wins), so a slow client never
+    accumulates a backlog.
+    """
+
+    def __init__(self, entity_ids):
+        self.entity_ids = frozenset(entity_ids)
+        self._pending = {}
+        self._cond = threading.Condition()
+        self.closed = False  # Set when the mirror dropped; the stream should end
+
+    def put(self, entity_id, state):
+        with self._cond:
+            self._pending[entity_id] = state
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def drain(self, timeout):
+        """Wait up to timeout seconds and return {entity_id: state} of pending changes"""
+        with self._cond:
+            if not self._pending and not self.closed:
+                self._cond.wait(timeout)
+            pending, self._pending = self._pending, {}
+            return pending
+
+
+class StateEventHub:
+    """Fans mirrored state changes out to stream subscribers by entity ID"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_entity = {}
+        self._subscribers = set()
+
+    def subscribe(self, entity_ids, limit=None):
+        """Register a subscriber, or return None if `limit` subscribers already exist"""
+        sub = StateSubscriber(entity_ids)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(sub)
+            for entity_id in sub.entity_ids:
+                self._by_entity.setdefault(entity_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+            for entity_id in sub.entity_ids:
+                subs = self._by_entity.get(entity_id)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._by_entity[entity_id]
+
+    def close_all(self):
+        """End every stream (the mirror dropped, so they would go silent)"""
+        with self._lock:
+            subs = list(self._subscribers)
+        for sub in subs:
+            sub.close()
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, entity_id, state):
+        subs = self._by_entity.get(entity_id)
+        if not subs:
+            return
+        for sub in list(subs):
+            sub.put(entity_id, state)
+
+
+state_hub = StateEventHub()
+state_mirror.listeners.append(state_hub.publish)
+state_mirror.listeners.append(ha_not_found.discard)
+state_mirror.disconnect_listeners.append(state_hub.close_all)
+
+
+# =============================================================================
+# ESPHOME SERVICE REGISTRY
+# =============================================================================
+
+# Seconds the ESPHome service list is trusted without a service_registered/removed event
+HA_SERVICES_TTL = float(os.environ.get('HA_SERVICES_TTL', '300'))
+# A miss triggers at most one early refresh per this many seconds (catches just-renamed panels)
+HA_SERVICES_MISS_REFRESH = 30
+
+
+class ESPHomeServiceRegistry:
+    """Cached list of the esphome.* services HA currently exposes.
+
+    Panels register their custom services (e.g. <base>_set_eq_profile) when
+    they connect, so the registry tells which panels are reachable and lets
+    device calls fail fast instead of waiting for HA to reject them. It is
+    refreshed from /services after HA_SERVICES_TTL, or on the next lookup
+    after a service_registered/service_removed event for the esphome domain.
+    """
+
+    def __init__(self, client, ttl=HA_SERVICES_TTL):
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._services = None  # {service name: [field names]}
+        self._fetched_at = 0.0
+        self._last_miss_refresh = 0.0
+        self.fetch_count = 0
+
+    def get(self, force=False):
+        """Return ({service name: [field names]}, error)"""
+        with self._lock:
+            fresh = self._services is not None and time.monotonic() - self._fetched_at < self.ttl
+            if fresh and not force:
+                return self._services, None
+            # Held during the fetch so concurrent callers share one download
+            try:
+                response = self.client.get('services', timeout='lookup')
+                if response.status_code != 200:
+                    return self._services, f"HA returned {response.status_code}"
+                services = {}
+                for entry in response.json():
+                    if entry.get('domain') == 'esphome':
+                        for name, spec in entry.get('services', {}).items():
+                            services[name] = list((spec or {}).get('fields', {}).keys())
+            except requests.exceptions.RequestException as e:
+                return self._services, str(e)
+            self._services = services
+            self._fetched_at = time.monotonic()
+            self.fetch_count += 1
+            logger.info(f"Loaded {len(services)} ESPHome services from HA")
+            return services, None
+
+    def has(self, service_name):
+        """True/False if the service is (not) registered, None if HA could not be asked"""
+        services, _ = self.get()
+        if services is None:
+            return None
+        if service_name in services:
+            return True
+        now = time.monotonic()
+        if now - self._last_miss_refresh >= HA_SERVICES_MISS_REFRESH:
+            self._last_miss_refresh = now
+            services, _ = self.get(force=True)
+            return services is not None and service_name in services
+        return False
+
+    def invalidate(self):
+        with self._lock:
+            self._services = None
+
+    def on_event(self, event_type, data):
+        if data.get('domain') == 'esphome':
+            logger.info(f"ESPHome service {event_type.split('_')[1]}: {data.get('service')}")
+            self.invalidate()
+
+
+esphome_services = ESPHomeServiceRegistry(ha_client)
+state_mirror.event_listeners.append(esphome_services.on_event)
+
+
+def preflight_esphome_service(service_name):
+    """Return an error if esphome.<service_name> is known not to exist, else None.
+    Calls go ahead when the registry cannot be loaded.
+    """
+    if not HA_TOKEN or not HA_API:
+        return None
+    if esphome_services.has(service_name) is False:
+        return (f"Service esphome.{service_name} is not registered in Home Assistant "
+                f"(panel offline or renamed)")
+    return None
+
+
+if HA_TOKEN and HA_WS_URL and HA_WS_MIRROR:
+    if websocket is None:
+        logger.warning("websocket-client not installed - entity states will be read via REST")
+    else:
+        state_mirror.start()
+
 # Default configuration structure
 def get_default_config():
     """Get default empty configuration"""
@@ -694,6 +2040,287 @@ AUDIO_SERVICE_SCHEMA = {
 }
 
 
+# Schemas served by /api/schema/<widget_type>
+WIDGET_SCHEMAS = {
+    'light': LIGHT_SCHEMA,
+    'cover': COVER_SCHEMA,
+    'tester': TESTER_SCHEMA,
+    'art': ART_SCHEMA,
+    'climate2': CLIMATE2_SCHEMA,
+    # Phase 1 schemas
+    'cctv': CCTV_SCHEMA,
+    'alarm_panel': ALARM_PANEL_SCHEMA,
+    'camera_service': CAMERA_SERVICE_SCHEMA,
+    'weather_service': WEATHER_SERVICE_SCHEMA,
+    'slideshow': SLIDESHOW_SCHEMA,
+    'video_test': VIDEO_TEST_SCHEMA,
+    'plasma': PLASMA_SCHEMA,
+    'network_test': NETWORK_TEST_SCHEMA,
+    'weather': WEATHER_SCHEMA,
+    'art3': ART3_SCHEMA,
+    'audio_test': AUDIO_TEST_SCHEMA,
+    'audio_service': AUDIO_SERVICE_SCHEMA
+}
+
+
+
+# =============================================================================
+# CONFIG VALIDATION
+# =============================================================================
+
+def _is_integer(v):
+    return isinstance(v, int) and not isinstance(v, bool)
+
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+_TYPE_CHECKS = {
+    'object': lambda v: isinstance(v, dict),
+    'array': lambda v: isinstance(v, list),
+    'string': lambda v: isinstance(v, str),
+    'integer': _is_integer,
+    'number': _is_number,
+    'boolean': lambda v: isinstance(v, bool),
+}
+
+
+def compile_schema(schema):
+    """Compile the JSON Schema subset used by the widget schemas into a validator.
+    The returned callable is validate(value, path, errors) and appends
+    {"path", "message"} dicts to errors. Unsupported keywords are ignored.
+    """
+    checks = []
+
+    expected = schema.get('type')
+    if expected:
+        type_ok = _TYPE_CHECKS[expected]
+
+        def check_type(v, path, errors):
+            if not type_ok(v):
+                errors.append({"path": path, "message": f"Expected {expected}"})
+                return False
+            return True
+    else:
+        def check_type(v, path, errors):
+            return True
+
+    if 'enum' in schema:
+        allowed = schema['enum']
+        allowed_set = set(allowed)
+
+        def check_enum(v, path, errors):
+            if not isinstance(v, (str, int, float, bool)) or v not in allowed_set:
+                errors.append({"path": path, "message": f"Must be one of {allowed}"})
+        checks.append(check_enum)
+
+    if 'const' in schema:
+        const = schema['const']
+
+        def check_const(v, path, errors):
+            if v != const:
+                errors.append({"path": path, "message": f"Must be {const!r}"})
+        checks.append(check_const)
+
+    if 'pattern' in schema:
+        regex = re.compile(schema['pattern'])
+
+        def check_pattern(v, path, errors):
+            if isinstance(v, str) and not regex.search(v):
+                errors.append({"path": path, "message": f"Does not match {regex.pattern}"})
+        checks.append(check_pattern)
+
+    if 'minLength' in schema:
+        min_length = schema['minLength']
+
+        def check_min_length(v, path, errors):
+            if isinstance(v, str) and len(v) < min_length:
+                errors.append({"path": path, "message": f"Must be at least {min_length} characters"})
+        checks.append(check_min_length)
+
+    for keyword, compare, word in (('minimum', lambda v, b: v < b, 'at least'),
+                                   ('maximum', lambda v, b: v > b, 'at most')):
+        if keyword in schema:
+            def check_bound(v, path, errors, bound=schema[keyword], compare=compare, word=word):
+                if _is_number(v) and compare(v, bound):
+                    errors.append({"path": path, "message": f"Must be {word} {bound}"})
+            checks.append(check_bound)
+
+    if 'required' in schema:
+        required = schema['required']
+
+        def check_required(v, path, errors):
+            if isinstance(v, dict):
+                for key in required:
+                    if key not in v:
+                        errors.append({"path": f"{path}.{key}", "message": "Required"})
+        checks.append(check_required)
+
+    if 'properties' in schema:
+        properties = {k: compile_schema(sub) for k, sub in schema['properties'].items()}
+
+        def check_properties(v, path, errors):
+            if isinstance(v, dict):
+                for key, validate in properties.items():
+                    if key in v:
+                        validate(v[key], f"{path}.{key}", errors)
+        checks.append(check_properties)
+
+    if 'items' in schema:
+        validate_item = compile_schema(schema['items'])
+
+        def check_items(v, path, errors):
+            if isinstance(v, list):
+                for i, item in enumerate(v):
+                    validate_item(item, f"{path}[{i}]", errors)
+        checks.append(check_items)
+
+    for keyword, compare, word in (('minItems', lambda n, b: n < b, 'at least'),
+                                   ('maxItems', lambda n, b: n > b, 'at most')):
+        if keyword in schema:
+            def check_count(v, path, errors, bound=schema[keyword], compare=compare, word=word):
+                if isinstance(v, list) and compare(len(v), bound):
+                    errors.append({"path": path, "message": f"Must have {word} {bound} items"})
+            checks.append(check_count)
+
+    for clause in schema.get('allOf', []):
+        if 'if' in clause:
+            condition = compile_schema(clause['if'])
+            then = compile_schema(clause.get('then', {}))
+
+            def check_conditional(v, path, errors, condition=condition, then=then):
+                probe = []
+                condition(v, path, probe)
+                if not probe:
+                    then(v, path, errors)
+            checks.append(check_conditional)
+        else:
+            checks.append(compile_schema(clause))
+
+    def validate(v, path, errors):
+        if check_type(v, path, errors):
+            for check in checks:
+                check(v, path, errors)
+    return validate
+
+
+# Which schema validates each entry of device.widgets ('list' widgets are validated per item)
+DEVICE_WIDGET_SCHEMAS = {
+    'lights': ('list', LIGHT_SCHEMA),
+    'covers': ('list', COVER_SCHEMA),
+    'climate2': ('list', CLIMATE2_SCHEMA),
+    'tests': ('list', TESTER_SCHEMA),
+    'art': ('object', ART_SCHEMA),
+    'cctv': ('value', CCTV_SCHEMA),
+    'alarm_panel': ('object', ALARM_PANEL_SCHEMA),
+    'test_video': ('object', VIDEO_TEST_SCHEMA),
+    'plasma': ('object', PLASMA_SCHEMA),
+    'network_test': ('object', NETWORK_TEST_SCHEMA),
+    'weather': ('object', WEATHER_SCHEMA),
+    'art3': ('object', ART3_SCHEMA),
+    'audio_test': ('object', AUDIO_TEST_SCHEMA),
+}
+
+# Which schema validates each entry of services
+SERVICE_SCHEMAS = {
+    'cameras': CAMERA_SERVICE_SCHEMA,
+    'weather': WEATHER_SERVICE_SCHEMA,
+    'audio': AUDIO_SERVICE_SCHEMA,
+}
+
+
+class ConfigValidator:
+    """Validates whole site configs against the widget and service schemas.
+
+    Schemas are compiled once. Widget results are remembered by widget key and
+    a SHA-1 of the widget's canonical JSON, and reused while that digest is
+    unchanged, so re-validating a large config after a small edit only
+    re-checks what changed.
+    """
+
+    def __init__(self):
+        self._widgets = {}
+        for key, (kind, schema) in DEVICE_WIDGET_SCHEMAS.items():
+            if kind == 'list':
+                schema = {"type": "array", "items": schema}
+            self._widgets[key] = compile_schema(schema)
+        self._services = {key: compile_schema(schema) for key, schema in SERVICE_SCHEMAS.items()}
+        self._lock = threading.Lock()
+        self._previous = {}  # (widget_key, content sha1) -> errors with relative paths
+
+    def _widget_errors(self, key, value, validate, cache, stats):
+        digest = hashlib.sha1(json.dumps(value, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+        errors = cache.get((key, digest))
+        if errors is None:
+            errors = self._previous.get((key, digest))
+        if errors is not None:
+            stats['reused'] += 1
+        else:
+            stats['validated'] += 1
+            errors = []
+            validate(value, '', errors)
+        cache[(key, digest)] = errors
+        return errors
+
+    def validate(self, config):
+        """Return {"valid", "errors": [{"path", "message"}], "stats": {validated, reused}}"""
+        errors = []
+        stats = {"validated": 0, "reused": 0}
+        if not isinstance(config, dict):
+            return {"valid": False, "errors": [{"path": "$", "message": "Expected object"}], "stats": stats}
+
+        services = config.get('services', {})
+        if not isinstance(services, dict):
+            errors.append({"path": "$.services", "message": "Expected object"})
+            services = {}
+        for key, validate in self._services.items():
+            if services.get(key) is not None:
+                validate(services[key], f"$.services.{key}", errors)
+
+        devices = config.get('devices', [])
+        if not isinstance(devices, list):
+            errors.append({"path": "$.devices", "message": "Expected array"})
+            devices = []
+
+        cache = {}
+        seen_ids = set()
+        with self._lock:
+            for i, device in enumerate(devices):
+                path = f"$.devices[{i}]"
+                if not isinstance(device, dict):
+                    errors.append({"path": path, "message": "Expected object"})
+                    continue
+                device_id = device.get('id')
+                if not isinstance(device_id, str) or not device_id:
+                    errors.append({"path": f"{path}.id", "message": "Required"})
+                elif device_id in seen_ids:
+                    errors.append({"path": f"{path}.id", "message": f"Duplicate device id '{device_id}'"})
+                seen_ids.add(device_id)
+
+                widgets = device.get('widgets', {})
+                if not isinstance(widgets, dict):
+                    errors.append({"path": f"{path}.widgets", "message": "Expected object"})
+                    continue
+                for key, value in widgets.items():
+                    validate = self._widgets.get(key)
+                    if validate is None or value is None:
+                        continue
+                    widget_path = f"{path}.widgets.{key}"
+                    for e in self._widget_errors(key, value, validate, cache, stats):
+                        errors.append({"path": widget_path + e['path'], "message": e['message']})
+            # Only the latest validated version is kept
+            self._previous = cache
+
+        return {"valid": not errors, "errors": errors, "stats": stats}
+
+
+config_validator = ConfigValidator()
+
+# warn: saves report validation errors; enforce: live publishes with errors are rejected
+CONFIG_VALIDATION = os.environ.get('CONFIG_VALIDATION', 'warn')
+
+
 @app.route('/')
 def landing():
     """Landing page - choose Configurator or Controller"""
@@ -716,14 +2343,16 @@ def controller():
 def get_config():
     """Get current configuration - loads LIVE config on startup"""
     # Always load from LIVE location
-    if LIVE_CONFIG.exists():
-        try:
-            with open(LIVE_CONFIG, 'r') as f:
-                config = json.load(f)
-                logger.info(f"Loaded LIVE config from {LIVE_CONFIG}")
-                return jsonify(config)
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON in live config: {e}")
+    eq_saver.flush()
+    etag = LIVE_STORE.etag()
+    if etag_matches(etag):
+        return json_body_response(None, etag)
+    try:
+        body, etag = LIVE_STORE.body()
+        if body is not None:
+            return json_body_response(body, etag)
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON in live config: {e}")
     
     # If no live config, return default
     logger.info("No live config found, returning default")
@@ -761,20 +2390,23 @@ def save_config():
         # Default staging file
         staging_file = ADDON_CONFIG / 'site_settings_staging.json'
     
-    # Backup existing staging if present
-    if staging_file.exists():
-        backup = ADDON_CONFIG / f'site_settings_staging_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-        staging_file.rename(backup)
+    with config_lock():
+        # Previous versions live in the config history instead of backup files
+        record_existing(staging_file, 'staging', name=staging_file.name)
+        atomic_write_json(staging_file, data)
+        version = record_history(data, 'staging', name=staging_file.name)
     
-    with open(staging_file, 'w') as f:
-        json.dump(data, f, indent=2)
+    # Staging saves are never blocked, errors are reported back to the UI
+    validation = config_validator.validate(data)
     
     logger.info(f"Saved STAGING config to {staging_file}")
     return jsonify({
         "success": True, 
         "message": "Configuration saved to staging",
         "staging_file": str(staging_file),
-        "filename": filename or "site_settings_staging.json"
+        "filename": filename or "site_settings_staging.json",
+        "version": version,
+        "validation": validation
     })
 
 
@@ -795,16 +2427,21 @@ def save_and_make_live():
     if 'devices' not in data:
         data['devices'] = []
     
-    # Also save to staging first (as backup)
     staging_file = ADDON_CONFIG / 'site_settings_staging.json'
-    with open(staging_file, 'w') as f:
-        json.dump(data, f, indent=2)
+    validation = config_validator.validate(data)
+    if not validation['valid'] and CONFIG_VALIDATION == 'enforce':
+        return jsonify({
+            "error": f"Configuration has {len(validation['errors'])} validation error(s), not made live",
+            "validation": validation
+        }), 422
     
     try:
-        # Copy to live location
-        import shutil
-        LIVE_CONFIG.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(staging_file, LIVE_CONFIG)
+        with config_lock():
+            # Also save to staging first (as backup)
+            record_existing(staging_file, 'staging', name=staging_file.name)
+            atomic_write_json(staging_file, data)
+            record_history(data, 'staging', name=staging_file.name)
+            slices = write_live_config(data, note='Save and make live')
         
         logger.info(f"Saved and made LIVE: {LIVE_CONFIG}")
         return jsonify({
@@ -812,13 +2449,118 @@ def save_and_make_live():
             "message": "Configuration saved and is now live",
             "live_path": str(LIVE_CONFIG),
             "staging_file": str(staging_file),
-            "url": "/local/panel_widgets/site_settings.json"
+            "url": "/local/panel_widgets/site_settings.json",
+            "device_slices": slices,
+            "validation": validation
         })
     except Exception as e:
         logger.error(f"Failed to save and make live: {e}")
         return jsonify({"error": f"Failed to make live: {str(e)}"}), 500
 
 
+@app.route('/api/config/validate', methods=['POST'])
+def validate_config():
+    """Validate a config against the widget schemas without saving it.
+    Validates the posted config, or the live config if the body is empty.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        if not LIVE_STORE.exists():
+            return jsonify({"error": "No config provided and no live config found"}), 400
+        data = LIVE_STORE.load()
+    
+    result = config_validator.validate(data)
+    logger.info(f"Validated config: {len(result['errors'])} errors "
+                f"({result['stats']['validated']} widgets checked, {result['stats']['reused']} unchanged)")
+    return jsonify(result)
+
+
+@app.route('/api/config/history', methods=['GET'])
+def list_config_history():
+    """List recorded config versions, newest first.
+    Query: kind (staging|live), name (staging file), limit (default 50), before (version id, for paging)
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        before = int(request.args['before']) if request.args.get('before') else None
+    except ValueError:
+        return jsonify({"error": "limit and before must be integers"}), 400
+    
+    versions = config_history.list(kind=request.args.get('kind'), name=request.args.get('name'),
+                                   limit=limit, before=before)
+    for v in versions:
+        v['created'] = datetime.fromtimestamp(v['created_at']).strftime("%Y-%m-%d %H:%M:%S")
+    live = config_history.latest('live')
+    return jsonify({
+        "versions": versions,
+        "live_version": live['id'] if live else None,
+        "stats": config_history.stats()
+    })
+
+
+@app.route('/api/config/history/<int:version_id>', methods=['GET'])
+def get_config_version(version_id):
+    """Return the full config of one recorded version"""
+    config = config_history.get(version_id)
+    if config is None:
+        return jsonify({"error": f"Version {version_id} not found"}), 404
+    return jsonify({"version": config_history.info(version_id), "config": config})
+
+
+@app.route('/api/config/history/diff', methods=['GET'])
+def diff_config_versions():
+    """Structural diff between two versions.
+    Query: from (version id), to (version id, default: current live version)
+    """
+    try:
+        from_id = int(request.args['from'])
+        to_id = int(request.args['to']) if request.args.get('to') else None
+    except (KeyError, ValueError):
+        return jsonify({"error": "'from' (and optional 'to') must be version ids"}), 400
+    if to_id is None:
+        live = config_history.latest('live')
+        if live is None:
+            return jsonify({"error": "No live version recorded"}), 404
+        to_id = live['id']
+    
+    diff = config_history.diff(from_id, to_id)
+    if diff is None:
+        return jsonify({"error": "Version not found"}), 404
+    return jsonify(diff)
+
+
+@app.route('/api/config/history/<int:version_id>/rollback', methods=['POST'])
+def rollback_config(version_id):
+    """Make a recorded version live again (recorded as a new live version)"""
+    config = config_history.get(version_id)
+    if config is None:
+        return jsonify({"error": f"Version {version_id} not found"}), 404
+    
+    # Same rules as any other live publish
+    validation = config_validator.validate(config)
+    if not validation['valid'] and CONFIG_VALIDATION == 'enforce':
+        return jsonify({
+            "error": f"Version {version_id} has {len(validation['errors'])} validation error(s), not made live",
+            "validation": validation
+        }), 422
+    
+    try:
+        with config_lock():
+            slices = write_live_config(config, note=f'Rollback to version {version_id}')
+        live = config_history.latest('live')
+        logger.info(f"Rolled live config back to version {version_id}")
+        return jsonify({
+            "success": True,
+            "message": f"Version {version_id} is now live",
+            "version": live['id'] if live else None,
+            "device_slices": slices,
+            "validation": validation
+        })
+    except Exception as e:
+        logger.error(f"Failed to roll back to version {version_id}: {e}")
+        return jsonify({"error": f"Failed to roll back: {str(e)}"}), 500
+
+
 @app.route('/api/config/staging', methods=['GET'])
 def list_staging_files():
     """List all available staging configuration files"""
@@ -850,14 +2592,20 @@ def load_staging_file(filename):
         
         staging_file = STAGING_DIR / safe_filename
         
-        if not staging_file.exists():
+        store = staging_store(staging_file)
+        etag = store.etag()
+        if etag is None:
+            _staging_stores.pop(staging_file, None)  # Removed outside the add-on
             return jsonify({"error": f"Staging file not found: {filename}"}), 404
+        if etag_matches(etag):
+            return json_body_response(None, etag)
         
-        with open(staging_file, 'r') as f:
-            config = json.load(f)
+        body, etag = store.body()
+        if body is None:
+            return jsonify({"error": f"Staging file not found: {filename}"}), 404
         
         logger.info(f"Loaded staging file: {staging_file}")
-        return jsonify(config)
+        return json_body_response(body, etag)
     except json.JSONDecodeError as e:
         return jsonify({"error": f"Invalid JSON: {str(e)}"}), 400
     except Exception as e:
@@ -876,6 +2624,7 @@ def delete_staging_file(filename):
             return jsonify({"error": f"Staging file not found: {filename}"}), 404
         
         staging_file.unlink()
+        _staging_stores.pop(staging_file, None)
         logger.info(f"Deleted staging file: {staging_file}")
         return jsonify({"success": True, "message": f"Deleted {filename}"})
     except Exception as e:
@@ -894,16 +2643,25 @@ def make_live():
     
     try:
         # Copy staging to live
-        import shutil
-        LIVE_CONFIG.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(staging_file, LIVE_CONFIG)
+        with config_lock():
+            with open(staging_file, 'r') as f:
+                data = json.load(f)
+            validation = config_validator.validate(data)
+            if not validation['valid'] and CONFIG_VALIDATION == 'enforce':
+                return jsonify({
+                    "error": f"Configuration has {len(validation['errors'])} validation error(s), not made live",
+                    "validation": validation
+                }), 422
+            slices = write_live_config(data, note='Make live from staging')
         
         logger.info(f"Made config LIVE: {LIVE_CONFIG}")
         return jsonify({
             "success": True, 
             "message": "Configuration is now live",
             "live_path": str(LIVE_CONFIG),
-            "url": "/local/panel_widgets/site_settings.json"
+            "url": "/local/panel_widgets/site_settings.json",
+            "device_slices": slices,
+            "validation": validation
         })
     except Exception as e:
         logger.error(f"Failed to make live: {e}")
@@ -929,14 +2687,17 @@ def import_config():
         
         # Save as staging
         staging_file = ADDON_CONFIG / 'site_settings_staging.json'
-        with open(staging_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        with config_lock():
+            record_existing(staging_file, 'staging', name=staging_file.name)
+            atomic_write_json(staging_file, data)
+            record_history(data, 'staging', name=staging_file.name, note=f'Imported {file.filename}')
         
         logger.info(f"Imported config to staging: {staging_file}")
         return jsonify({
             "success": True,
             "message": f"Imported {len(data['devices'])} devices to staging",
-            "config": data
+            "config": data,
+            "validation": config_validator.validate(data)
         })
     except json.JSONDecodeError as e:
         return jsonify({"error": f"Invalid JSON: {str(e)}"}), 400
@@ -987,7 +2748,6 @@ def export_config(filename):
     
     # Create temporary copy with desired filename in staging dir
     temp_file = STAGING_DIR / safe_filename
-    import shutil
     shutil.copy2(staging_file, temp_file)
     
     return send_from_directory(
@@ -1023,13 +2783,22 @@ def validate_entity():
             "simulated": True
         })
     
+    # Serve from the live mirror when possible
+    state = state_mirror.get(entity_id)
+    if state is not None:
+        return jsonify({
+            "valid": True,
+            "state": state.get('state'),
+            "attributes": state.get('attributes', {}),
+            "domain": domain
+        })
+    
+    if entity_id in ha_not_found:
+        return jsonify({"valid": False, "error": f"Entity '{entity_id}' not found in Home Assistant"})
+    
     try:
         # Query HA API
-        response = requests.get(
-            f'{HA_API}/states/{entity_id}',
-            headers=get_headers(),
-            timeout=5
-        )
+        response = ha_client.get(f'states/{entity_id}', timeout='lookup')
         
         if response.status_code == 200:
             state = response.json()
@@ -1040,95 +2809,230 @@ def validate_entity():
                 "domain": domain
             })
         elif response.status_code == 404:
+            ha_not_found.add(entity_id)
             return jsonify({"valid": False, "error": f"Entity '{entity_id}' not found in Home Assistant"})
         else:
             return jsonify({"valid": False, "error": f"HA API error: {response.status_code}"})
             
+    except HAUnavailable as e:
+        return jsonify({"valid": False, "error": str(e), "ha_unavailable": True})
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to validate entity: {e}")
         return jsonify({"valid": False, "error": "Cannot connect to Home Assistant API"})
 
 
-@app.route('/api/entities/<domain>')
-def get_entities(domain):
-    """Get all entities of a specific domain from HA"""
-    # Debug logging
-    logger.info(f"API: get_entities({domain})")
-    logger.info(f"RUNNING_IN_HA: {RUNNING_IN_HA}")
-    logger.info(f"HA_TOKEN available: {bool(HA_TOKEN)}")
-    logger.info(f"HA_API: {HA_API}")
-    
+# Config keys that hold Home Assistant entity ids
+ENTITY_REFERENCE_KEYS = ('entity', 'presence_sensor', 'show_cam_entity')
+
+# States reported as unavailable rather than healthy
+UNAVAILABLE_STATES = ('unavailable', 'unknown')
+
+
+def collect_entity_references(node, path, refs):
+    """Append (path, entity_id) for every entity reference below node"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            child = f"{path}.{key}"
+            if key in ENTITY_REFERENCE_KEYS:
+                if isinstance(value, str) and value:
+                    refs.append((child, value))
+            else:
+                collect_entity_references(value, child, refs)
+    elif isinstance(node, list):
+        for i, item in enumerate(node):
+            collect_entity_references(item, f"{path}[{i}]", refs)
+
+
+def verify_references(refs, all_states):
+    """Check (path, entity_id) pairs against {entity_id: state}.
+    Returns {checked, missing: [{path, entity}], unavailable: [{path, entity, state}]}
+    """
+    missing = []
+    unavailable = []
+    for path, entity_id in refs:
+        state = all_states.get(entity_id)
+        if state is None:
+            missing.append({"path": path, "entity": entity_id})
+        elif state.get('state') in UNAVAILABLE_STATES:
+            unavailable.append({"path": path, "entity": entity_id, "state": state.get('state')})
+    return {"checked": len(refs), "missing": missing, "unavailable": unavailable}
+
+
+@app.route('/api/config/verify-entities', methods=['POST'])
+def verify_config_entities():
+    """Check every entity referenced by a config against one HA states snapshot.
+    Verifies the posted config, or the live config if the body is empty.
+    Query: ?refresh=1 forces a fresh /states download.
+    Returns: {success, ok, services: report, devices: [{id, name, ...report}], totals}
+    """
+    config = request.get_json(silent=True)
+    if config is None:
+        if not LIVE_STORE.exists():
+            return jsonify({"error": "No config provided and no live config found"}), 400
+        config = LIVE_STORE.load()
+    if not isinstance(config, dict):
+        return jsonify({"error": "Invalid configuration structure"}), 400
+    
+    if not RUNNING_IN_HA and not HA_TOKEN:
+        return jsonify({"error": "Not connected to Home Assistant"}), 503
+    
+    # The mirror already holds every state; otherwise one /states download covers the whole config
+    force = request.args.get('refresh') == '1'
+    all_states = None if force else state_mirror.snapshot()
+    source = 'mirror'
+    if all_states is None:
+        snapshot, err = states_cache.get(force=force)
+        if snapshot is None:
+            return jsonify({"error": err}), 503
+        all_states = snapshot.by_id
+        source = 'snapshot'
+    
+    refs = []
+    collect_entity_references(config.get('services', {}), '$.services', refs)
+    services = verify_references(refs, all_states)
+    
+    devices = []
+    for i, device in enumerate(config.get('devices', [])):
+        if not isinstance(device, dict):
+            continue
+        refs = []
+        collect_entity_references(device.get('widgets', {}), f"$.devices[{i}].widgets", refs)
+        report = verify_references(refs, all_states)
+        devices.append({"id": device.get('id', ''), "name": device.get('name', ''), **report})
+    
+    reports = [services] + devices
+    totals = {key: sum(len(r[key]) for r in reports) for key in ('missing', 'unavailable')}
+    totals['checked'] = sum(r['checked'] for r in reports)
+    logger.info(f"Verified {totals['checked']} entity references from {source}: "
+                f"{totals['missing']} missing, {totals['unavailable']} unavailable")
+    
+    return jsonify({
+        "success": True,
+        "ok": totals['missing'] == 0 and totals['unavailable'] == 0,
+        "source": source,
+        "services": services,
+        "devices": devices,
+        "totals": totals
+    })
+
+
+@app.route('/api/ha/status', methods=['GET'])
+def ha_status():
+    """Report Home Assistant connectivity: circuit breaker, command queue, state mirror and caches"""
+    return jsonify({
+        "breaker": ha_client.breaker.status(),
+        "commands": command_queue.stats(),
+        "mirror_connected": state_mirror.ready,
+        "not_found_cached": len(ha_not_found),
+        "not_found_hits": ha_not_found.hits
+    })
+
+
+# Fields /api/entities/search can return
+ENTITY_SEARCH_FIELDS = ('entity_id', 'name', 'state', 'domain', 'attributes')
+ENTITY_SEARCH_MAX_LIMIT = 200
+
+
+@app.route('/api/entities/search')
+def search_entities():
+    """Typeahead search over entity ids and friendly names.
+    Query: q (terms, all must match), domain, limit (default 20), offset,
+    fields (comma separated, default entity_id,name,state)
+    Returns: {entities, total, offset, limit}
+    """
+    query = request.args.get('q', '')
+    domain = request.args.get('domain') or None
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), ENTITY_SEARCH_MAX_LIMIT)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    fields = [f for f in request.args.get('fields', 'entity_id,name,state').split(',') if f]
+    unknown = [f for f in fields if f not in ENTITY_SEARCH_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+    
+    if not RUNNING_IN_HA and not HA_TOKEN:
+        return jsonify({"entities": [], "total": 0, "offset": offset, "limit": limit})
+    
+    snapshot, err = states_cache.get()
+    if snapshot is None:
+        return jsonify({"error": err}), 503
+    
+    index = snapshot.search_index
+    total, matches = index.search(query, domain, limit=offset + limit)
+    
+    entities = []
+    for i in matches[offset:]:
+        entity_id, name = index.entries[i]
+        state = snapshot.by_id[entity_id]
+        values = {
+            "entity_id": entity_id,
+            "name": name,
+            "state": state.get('state'),
+            "domain": entity_id.split('.', 1)[0],
+        }
+        row = {}
+        for field in fields:
+            row[field] = state.get('attributes', {}) if field == 'attributes' else values[field]
+        entities.append(row)
+    
+    return jsonify({"entities": entities, "total": total, "offset": offset, "limit": limit})
+
+
+@app.route('/api/entities/<domain>')
+def get_entities(domain):
+    """Get all entities of a specific domain from HA"""
     # If not running in HA, return empty list for local testing
     if not RUNNING_IN_HA and not HA_TOKEN:
         logger.warning("Not in HA mode and no token - returning empty list")
         return jsonify({"entities": []})
     
-    try:
-        url = f'{HA_API}/states'
-        headers = get_headers()
-        logger.info(f"Fetching from: {url}")
-        logger.info(f"Headers: {headers}")
-        
-        response = requests.get(url, headers=headers, timeout=5)
-        logger.info(f"Response status: {response.status_code}")
-        
-        if response.status_code == 200:
-            states = response.json()
-            logger.info(f"Got {len(states)} states from HA")
-            entities = [
-                {
-                    "entity_id": s['entity_id'],
-                    "name": s['attributes'].get('friendly_name', s['entity_id']),
-                    "state": s['state']
-                }
-                for s in states
-                if s['entity_id'].startswith(f'{domain}.')
-            ]
-            logger.info(f"Returning {len(entities)} entities for domain '{domain}'")
-            return jsonify({"entities": entities})
-        else:
-            logger.error(f"HA API error: {response.status_code} - {response.text}")
-            return jsonify({"error": f"HA API returned {response.status_code}"}), 500
-            
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to fetch entities: {e}")
-        return jsonify({"error": "Cannot connect to Home Assistant API"}), 503
+    snapshot, err = states_cache.get()
+    if snapshot is None:
+        return jsonify({"error": err}), 503
+    
+    entities = snapshot.by_domain.get(domain, [])
+    logger.debug(f"Returning {len(entities)} entities for domain '{domain}'")
+    return jsonify({"entities": entities})
+
+
+@app.route('/api/entities/refresh', methods=['POST'])
+def refresh_entities():
+    """Force a re-fetch of the cached HA states snapshot"""
+    if not RUNNING_IN_HA and not HA_TOKEN:
+        return jsonify({"error": "Not running in HA mode"}), 503
+    
+    snapshot, err = states_cache.get(force=True)
+    if snapshot is None:
+        return jsonify({"error": err}), 503
+    
+    return jsonify({
+        "success": True,
+        "entity_count": len(snapshot.by_id),
+        "domain_count": len(snapshot.by_domain),
+        "fetched_at": datetime.fromtimestamp(snapshot.fetched_at).strftime("%Y-%m-%d %H:%M:%S")
+    })
 
 
 @app.route('/api/schema/<widget_type>')
 def get_schema(widget_type):
     """Get JSON schema for a widget type"""
-    schemas = {
-        'light': LIGHT_SCHEMA,
-        'cover': COVER_SCHEMA,
-        'tester': TESTER_SCHEMA,
-        'art': ART_SCHEMA,
-        'climate2': CLIMATE2_SCHEMA,
-        # Phase 1 schemas
-        'cctv': CCTV_SCHEMA,
-        'alarm_panel': ALARM_PANEL_SCHEMA,
-        'camera_service': CAMERA_SERVICE_SCHEMA,
-        'weather_service': WEATHER_SERVICE_SCHEMA,
-        'slideshow': SLIDESHOW_SCHEMA,
-        'video_test': VIDEO_TEST_SCHEMA,
-        'plasma': PLASMA_SCHEMA,
-        'network_test': NETWORK_TEST_SCHEMA,
-        'weather': WEATHER_SCHEMA,
-        'art3': ART3_SCHEMA,
-        'audio_test': AUDIO_TEST_SCHEMA,
-        'audio_service': AUDIO_SERVICE_SCHEMA
-    }
-    
-    if widget_type not in schemas:
+    if widget_type not in WIDGET_SCHEMAS:
         return jsonify({"error": "Unknown widget type"}), 404
     
-    return jsonify(schemas[widget_type])
+    return static_json_response(f'schema/{widget_type}', lambda: WIDGET_SCHEMAS[widget_type])
 
 
 @app.route('/api/widget-types')
 def widget_types():
     """Get list of supported widget types"""
-    return jsonify({
+    return static_json_response('widget-types', _widget_types_payload)
+
+
+def _widget_types_payload():
+    """Supported widget types (content only changes with the add-on version)"""
+    return {
         "widgets": [
             {
                 "id": "lights",
@@ -1298,7 +3202,7 @@ def widget_types():
                 "note": "Configure audio server IP/port. Sounds array optional for custom playback."
             }
         ]
-    })
+    }
 
 
 # =============================================================================
@@ -1308,20 +3212,18 @@ def widget_types():
 
 def call_ha_service(service_domain, service_name, service_data):
     """Call a Home Assistant service via REST API"""
-    if not RUNNING_IN_HA or not HA_TOKEN:
+    if not HA_TOKEN or not HA_API:
         return False, "Not running in Home Assistant mode"
     try:
-        response = requests.post(
-            f'{HA_API}/services/{service_domain}/{service_name}',
-            headers=get_headers(),
+        response = ha_client.post(
+            f'services/{service_domain}/{service_name}',
             json=service_data,
-            timeout=10
+            timeout='service'
         )
         if response.status_code in (200, 201):
             return True, None
         else:
             logger.error(f"HA service call failed: POST {HA_API}/services/{service_domain}/{service_name}")
-            logger.error(f"  Headers: {get_headers()}")
             logger.error(f"  Payload: {json.dumps(service_data)}")
             logger.error(f"  Response {response.status_code}: {response.text}")
             return False, f"HA returned {response.status_code}: {response.text}"
@@ -1331,17 +3233,16 @@ def call_ha_service(service_domain, service_name, service_data):
 
 def call_ha_state_read(entity_id):
     """Read a Home Assistant entity state via REST API"""
-    if not RUNNING_IN_HA or not HA_TOKEN:
+    if not HA_TOKEN or not HA_API:
         return None, "Not running in Home Assistant mode"
+    if entity_id in ha_not_found:
+        return None, f"Entity {entity_id} not found"
     try:
-        response = requests.get(
-            f'{HA_API}/states/{entity_id}',
-            headers=get_headers(),
-            timeout=10
-        )
+        response = ha_client.get(f'states/{entity_id}', timeout='state')
         if response.status_code == 200:
             return response.json(), None
         elif response.status_code == 404:
+            ha_not_found.add(entity_id)
             return None, f"Entity {entity_id} not found"
         else:
             return None, f"HA returned {response.status_code}: {response.text}"
@@ -1351,19 +3252,15 @@ def call_ha_state_read(entity_id):
 
 def call_ha_state_write(entity_id, state, attributes=None):
     """Write a Home Assistant entity state via REST API"""
-    if not RUNNING_IN_HA or not HA_TOKEN:
+    if not HA_TOKEN or not HA_API:
         return False, "Not running in Home Assistant mode"
     payload = {"state": state}
     if attributes:
         payload["attributes"] = attributes
     try:
-        response = requests.post(
-            f'{HA_API}/states/{entity_id}',
-            headers=get_headers(),
-            json=payload,
-            timeout=10
-        )
+        response = ha_client.post(f'states/{entity_id}', json=payload, timeout='state')
         if response.status_code in (200, 201):
+            ha_not_found.discard(entity_id)
             return True, None
         else:
             return False, f"HA returned {response.status_code}: {response.text}"
@@ -1371,18 +3268,248 @@ def call_ha_state_write(entity_id, state, attributes=None):
         return False, str(e)
 
 
+# Panels work through device commands one at a time; this many panels are served in parallel
+COMMAND_QUEUE_WORKERS = int(os.environ.get('COMMAND_QUEUE_WORKERS', str(HA_POOL_SIZE)))
+# Seconds a request waits for its queued command before giving up on the answer
+COMMAND_WAIT_TIMEOUT = HA_CONNECT_TIMEOUT + HA_TIMEOUTS['service'] * 2
+
+
+class _Command:
+    __slots__ = ('domain', 'service', 'data', 'done', 'success', 'error', 'superseded')
+
+    def __init__(self, domain, service, data):
+        self.domain = domain
+        self.service = service
+        self.data = data
+        self.done = threading.Event()
+        self.success = False
+        self.error = None
+        self.superseded = False
+
+
+class DeviceCommandQueue:
+    """Latest-wins service call queue, serialized per panel.
+
+    Each panel has at most one call in flight. Setter calls that wait behind it
+    are keyed (typically by entity): a newer call for the same key replaces the
+    waiting one, whose caller is told it was superseded. Calls queued with
+    key None are only serialized, never replaced. Dragging a slider
+    therefore sends the value in flight plus the latest value, not every
+    intermediate one. Different panels are served in parallel.
+    """
+
+    def __init__(self, workers=COMMAND_QUEUE_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='device-cmd')
+        self._lock = threading.Lock()
+        self._pending = {}  # device -> {key: _Command}, insertion ordered
+        self._active = set()  # devices with a drain task running
+        self.submitted = 0
+        self.executed = 0
+        self.superseded = 0
+        self.failed = 0
+        self.max_depth = 0
+
+    def call(self, device, key, domain, service, data, timeout=COMMAND_WAIT_TIMEOUT):
+        """Queue a service call and wait for it. Returns (success, error, superseded)"""
+        cmd = _Command(domain, service, data)
+        with self._lock:
+            self.submitted += 1
+            pending = self._pending.setdefault(device, {})
+            if key is None:
+                key = cmd  # Not coalescible: its own entry, never replaced
+            previous = pending.get(key)
+            # Replacing keeps the queue position, so a busy key is not starved
+            pending[key] = cmd
+            self.max_depth = max(self.max_depth, len(pending))
+            if previous is not None:
+                self.superseded += 1
+                previous.superseded = True
+                previous.done.set()
+            if device not in self._active:
+                self._active.add(device)
+                self._executor.submit(self._drain, device)
+
+        if not cmd.done.wait(timeout):
+            return False, f"Timed out after {timeout:.0f}s waiting for {device}", False
+        return cmd.success, cmd.error, cmd.superseded
+
+    def _drain(self, device):
+        while True:
+            with self._lock:
+                pending = self._pending.get(device)
+                if not pending:
+                    self._pending.pop(device, None)
+                    self._active.discard(device)
+                    return
+                key = next(iter(pending))
+                cmd = pending.pop(key)
+            try:
+                cmd.success, cmd.error = call_ha_service(cmd.domain, cmd.service, cmd.data)
+            except Exception as e:
+                cmd.success, cmd.error = False, str(e)
+            with self._lock:
+                self.executed += 1
+                if not cmd.success:
+                    self.failed += 1
+            cmd.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "executed": self.executed,
+                "superseded": self.superseded,
+                "failed": self.failed,
+                "max_depth": self.max_depth,
+                "depth": {device: len(pending) for device, pending in self._pending.items() if pending},
+                "busy_devices": len(self._active)
+            }
+
+
+command_queue = DeviceCommandQueue()
+
+
+# Services that set an entity to a value given in full: a newer call makes a waiting one moot
+SETTER_SERVICES = {
+    ('number', 'set_value'),
+    ('switch', 'turn_on'), ('switch', 'turn_off'),
+    ('input_number', 'set_value'),
+    ('input_text', 'set_value'),
+    ('input_select', 'select_option'),
+    ('input_boolean', 'turn_on'), ('input_boolean', 'turn_off'),
+    ('input_datetime', 'set_datetime'),
+}
+
+
+def command_target(domain, service, data):
+    """Return (device, key) to queue a service call under, or None to call HA directly.
+    Only true setters get a key (entity, or esphome set_* service plus the profile it
+    writes) and may be replaced by a newer call; everything else (toggle, button.press,
+    esphome actions) is queued with key None and always sent.
+    """
+    data = data if isinstance(data, dict) else {}
+    if domain == 'esphome':
+        name = service
+        key = None
+        if '_set_' in service:
+            key = (f'esphome.{service}', data.get('profile'))
+    else:
+        entity_id = data.get('entity_id')
+        if not isinstance(entity_id, str) or '.' not in entity_id:
+            return None
+        name = entity_id.split('.', 1)[1]
+        key = entity_id if (domain, service) in SETTER_SERVICES else None
+    # Serialize per panel: the longest configured entity base the name starts with
+    device = None
+    for base in get_device_index().by_entity_base:
+        if base and name.startswith(base + '_') and (device is None or len(base) > len(device)):
+            device = base
+    return device or name, key
+
+
+def queue_ha_service(domain, service, data):
+    """Call an HA service through the device command queue when it targets a panel entity.
+    Returns (success, error, superseded).
+    """
+    target = command_target(domain, service, data)
+    if target is None:
+        success, err = call_ha_service(domain, service, data)
+        return success, err, False
+    device, key = target
+    return command_queue.call(device, key, domain, service, data)
+
+
 def device_to_entity_base(device_id):
     """Normalize device ID for use in HA entity IDs"""
     return device_id.lower().replace(' ', '_').replace('-', '_')
 
 
+def mac_to_suffix(mac):
+    """Return the last 6 hex chars (3 bytes) of a MAC address, or None if invalid"""
+    if not mac:
+        return None
+    clean = mac.lower().replace(':', '').replace('-', '')
+    suffix = clean[-6:] if len(clean) >= 6 else clean
+    if len(suffix) == 6 and all(c in '0123456789abcdef' for c in suffix):
+        return suffix
+    return None
+
+
+def derive_entity_base(device_id, mac=''):
+    """Derive the ESPHome entity base for a panel.
+    MAC → last 6 hex chars (3 bytes) → smartpanel_{suffix}, else the normalized device ID
+    """
+    suffix = mac_to_suffix(mac)
+    if suffix:
+        return f"smartpanel_{suffix}"
+    return device_to_entity_base(device_id)
+
+
+class DeviceIndex:
+    """Lookup tables over the devices in one version of the live config"""
+
+    def __init__(self, devices, generation):
+        self.generation = generation
+        self.by_id = {}
+        self.by_mac_suffix = {}
+        self.by_entity_base = {}
+        self._entity_bases = {}
+        for d in devices:
+            device_id = d.get('id', '')
+            entity_base = derive_entity_base(device_id, d.get('mac', ''))
+            # First entry wins, matching the old linear scan
+            if device_id not in self.by_id:
+                self.by_id[device_id] = d
+                self._entity_bases[device_id] = entity_base
+            suffix = mac_to_suffix(d.get('mac', ''))
+            if suffix:
+                self.by_mac_suffix.setdefault(suffix, d)
+            self.by_entity_base.setdefault(entity_base, d)
+
+    def entity_base(self, device_id):
+        """Entity base for a configured device, or the normalized ID for unknown devices"""
+        if device_id in self._entity_bases:
+            return self._entity_bases[device_id]
+        return device_to_entity_base(device_id)
+
+    def find(self, key):
+        """Find a device by id, MAC suffix or entity base"""
+        if key in self.by_id:
+            return self.by_id[key]
+        suffix = mac_to_suffix(key)
+        if suffix and suffix in self.by_mac_suffix:
+            return self.by_mac_suffix[suffix]
+        return self.by_entity_base.get(key)
+
+
+_device_index = DeviceIndex([], generation=-1)
+_device_index_lock = threading.Lock()
+
+
+def get_device_index():
+    """Return the device index for the current live config, rebuilding it only on change"""
+    global _device_index
+    try:
+        config, generation = LIVE_STORE.snapshot()
+    except Exception as e:
+        logger.warning(f"Could not load config for device index: {e}")
+        return _device_index  # Keep the last good index until the file parses again
+    index = _device_index
+    if index.generation == generation:
+        return index
+    with _device_index_lock:
+        if _device_index.generation != generation:
+            devices = (config or {}).get('devices', [])
+            _device_index = DeviceIndex(devices, generation)
+        return _device_index
+
+
 @app.route('/api/devices', methods=['GET'])
 def get_devices():
     """Get list of configured devices from live config"""
-    if LIVE_CONFIG.exists():
-        try:
-            with open(LIVE_CONFIG, 'r') as f:
-                config = json.load(f)
+    try:
+        config = LIVE_STORE.load()
+        if config is not None:
             devices = config.get('devices', [])
             return jsonify({
                 "devices": [
@@ -1396,15 +3523,58 @@ def get_devices():
                     for d in devices
                 ]
             })
-        except Exception as e:
-            logger.error(f"Failed to load devices: {e}")
+    except Exception as e:
+        logger.error(f"Failed to load devices: {e}")
     return jsonify({"devices": []})
 
 
+@app.route('/api/devices/services', methods=['GET'])
+def get_device_services():
+    """ESPHome services each configured panel currently exposes in HA.
+    Query: ?refresh=1 reloads the service list from HA.
+    Returns: {devices: [{id, name, entity_base, online, services}], unassigned: [str]}
+    A panel is online when at least one of its services is registered.
+    """
+    if not RUNNING_IN_HA and not HA_TOKEN:
+        return jsonify({"error": "Not running in HA mode"}), 503
+    services, err = esphome_services.get(force=request.args.get('refresh') == '1')
+    if services is None:
+        return jsonify({"error": err}), 503
+    
+    index = get_device_index()
+    claimed = set()
+    devices = []
+    for device_id, device in index.by_id.items():
+        if not device_id:
+            continue  # Configured without an id
+        prefix = index.entity_base(device_id) + '_'
+        own = sorted(name for name in services if name.startswith(prefix))
+        claimed.update(own)
+        devices.append({
+            "id": device_id,
+            "name": device.get('name', ''),
+            "entity_base": prefix[:-1],
+            "online": bool(own),
+            "services": [name[len(prefix):] for name in own]
+        })
+    
+    result = {
+        "devices": devices,
+        "unassigned": sorted(name for name in services if name not in claimed)
+    }
+    if err:
+        # Served from the last good list
+        result["refresh_error"] = err
+    return jsonify(result)
+
+
 @app.route('/api/ha_state/<path:entity_id>', methods=['GET'])
 def get_ha_state(entity_id):
     """Read current state of a Home Assistant entity"""
-    state_data, err = call_ha_state_read(entity_id)
+    state_data = state_mirror.get(entity_id)
+    err = None
+    if state_data is None:
+        state_data, err = call_ha_state_read(entity_id)
     if state_data is None:
         return jsonify({"error": err or "Unknown error"}), 503 if err else 404
     return jsonify({
@@ -1415,23 +3585,172 @@ def get_ha_state(entity_id):
     })
 
 
+# Exact-ID batches larger than this are served from one /states download
+BATCH_SNAPSHOT_THRESHOLD = 8
+# Maximum age (seconds) of a /states snapshot used for batch reads
+BATCH_SNAPSHOT_MAX_AGE = 2
+
+
+@app.route('/api/ha_state/batch', methods=['POST'])
+def get_ha_state_batch():
+    """Read several Home Assistant entity states in one round trip.
+    Payload: {entity_ids: [str]} - entries may be glob patterns such as '*.smartpanel_ddeeff_*'
+    Returns: {success, states: {entity_id: {state, attributes}}, missing: [str], errors: {entity_id: str}}
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('entity_ids'), list):
+        return jsonify({"error": "Payload must contain an 'entity_ids' list"}), 400
+
+    requested = [e for e in data['entity_ids'] if isinstance(e, str) and e]
+    patterns = [e for e in requested if any(c in e for c in '*?[')]
+    exact = [e for e in requested if e not in patterns]
+
+    states = {}
+    missing = []
+    errors = {}
+
+    all_states = state_mirror.snapshot()
+    from_mirror = all_states is not None
+    if all_states is None and (patterns or len(exact) > BATCH_SNAPSHOT_THRESHOLD):
+        snapshot, err = states_cache.get(max_age=BATCH_SNAPSHOT_MAX_AGE)
+        if snapshot is None:
+            return jsonify({"error": err}), 503
+        all_states = snapshot.by_id
+
+    if all_states is not None:
+        for pattern in patterns:
+            for entity_id in fnmatch.filter(all_states.keys(), pattern):
+                states[entity_id] = all_states[entity_id]
+        for entity_id in exact:
+            if entity_id in all_states:
+                states[entity_id] = all_states[entity_id]
+        unresolved = [e for e in exact if e not in states]
+        if not from_mirror:
+            missing.extend(unresolved)
+            unresolved = []
+        # Otherwise the mirror may lag a freshly created entity; confirm misses over REST
+    else:
+        unresolved = exact
+
+    if unresolved:
+        results = ha_executor.map(call_ha_state_read, unresolved)
+        for entity_id, (state_data, err) in zip(unresolved, results):
+            if state_data is not None:
+                states[entity_id] = state_data
+            elif err == f"Entity {entity_id} not found":
+                missing.append(entity_id)
+            else:
+                errors[entity_id] = err
+
+    return jsonify({
+        "success": True,
+        "states": {
+            entity_id: {
+                "state": s.get('state'),
+                "attributes": s.get('attributes', {})
+            }
+            for entity_id, s in states.items()
+        },
+        "missing": missing,
+        "errors": errors
+    })
+
+
+# Entities pushed to the controller for a panel ({base} = entity base)
+DEVICE_STREAM_ENTITIES = [
+    'number.{base}_codec_gain',
+    'switch.{base}_eq_enable',
+    'switch.{base}_drc_enable',
+    'sensor.{base}_eq_active_profile',
+    'binary_sensor.{base}_eq_enabled',
+    'sensor.{base}_eq_bands',
+]
+SSE_KEEPALIVE_SECS = 15
+# Each open stream holds one gunicorn thread; keep some free for API calls.
+# Sync workers would be held for the life of the stream, so streams are off there.
+SSE_MAX_SUBSCRIBERS = int(os.environ.get(
+    'SSE_MAX_SUBSCRIBERS',
+    str(max(0, SERVER_THREADS - 8)) if SERVER_MODE == 'gthread' else '0'
+))
+
+
+def _sse_state_event(entity_id, state):
+    payload = {
+        "entity_id": entity_id,
+        "state": state.get('state') if state else None,
+        "attributes": state.get('attributes', {}) if state else {}
+    }
+    return f"event: state\ndata: {json.dumps(payload)}\n\n"
+
+
+@app.route('/api/stream/device/<device_id>', methods=['GET'])
+def stream_device_state(device_id):
+    """Server-Sent Events stream of a panel's controller entities.
+    Sends the current states on connect, then only entities whose state or
+    attributes changed. Requires the WebSocket state mirror; clients fall
+    back to polling /api/ha_state when this returns 503. If the mirror drops
+    later, the stream sends an `unavailable` event and ends.
+    """
+    if not state_mirror.ready:
+        return jsonify({"error": "Live state mirror not available"}), 503
+
+    entity_base = get_device_index().entity_base(device_id)
+    entity_ids = [e.format(base=entity_base) for e in DEVICE_STREAM_ENTITIES]
+    sub = state_hub.subscribe(entity_ids, limit=SSE_MAX_SUBSCRIBERS)
+    if sub is None:
+        return jsonify({"error": "Stream limit reached or disabled in this server mode"}), 503
+
+    def generate():
+        last_sent = {}
+        try:
+            yield "retry: 5000\n\n"
+            for entity_id in entity_ids:
+                state = state_mirror.get(entity_id)
+                if state is not None:
+                    last_sent[entity_id] = (state.get('state'), state.get('attributes'))
+                    yield _sse_state_event(entity_id, state)
+            while True:
+                changes = sub.drain(SSE_KEEPALIVE_SECS)
+                if sub.closed or not state_mirror.ready:
+                    yield "event: unavailable\ndata: {\"error\": \"Live state mirror disconnected\"}\n\n"
+                    return
+                if not changes:
+                    yield ": keepalive\n\n"
+                    continue
+                for entity_id, state in changes.items():
+                    key = (state.get('state'), state.get('attributes')) if state else None
+                    if last_sent.get(entity_id) == key:
+                        continue
+                    last_sent[entity_id] = key
+                    yield _sse_state_event(entity_id, state)
+        finally:
+            state_hub.unsubscribe(sub)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/api/eq_profiles', methods=['GET'])
 def get_eq_profiles():
     """Get EQ profiles from live config.
     Returns: {eq_enabled, eq_active_profile, eq_profiles: {music, intercom, pa}}
-    Backward-compatible: migrates legacy 'eq' array to eq_profiles.music if needed.
+    Backward-compatible: migrates legacy 'eq' array to eq_profiles.music in the response;
+    the migrated structure is persisted by the next EQ save (GETs never write).
     """
-    if not LIVE_CONFIG.exists():
-        return jsonify({"error": "Live config not found"}), 404
-
+    eq_saver.flush()
     try:
-        with open(LIVE_CONFIG, 'r') as f:
-            config = json.load(f)
+        config = LIVE_STORE.load()
+        if config is None:
+            return jsonify({"error": "Live config not found"}), 404
 
         audio = config.get('services', {}).get('audio', {})
 
         # Backward compatibility: migrate legacy 'eq' to eq_profiles.music
         if 'eq_profiles' not in audio and 'eq' in audio:
+            audio = dict(audio)
             audio['eq_profiles'] = {
                 'music': {
                     'enabled': audio.get('eq_enabled', False),
@@ -1447,10 +3766,6 @@ def get_eq_profiles():
                 }
             }
             audio['eq_active_profile'] = 'music'
-            # Save the migrated structure back
-            config['services']['audio'] = audio
-            with open(LIVE_CONFIG, 'w') as f:
-                json.dump(config, f, indent=2)
 
         eq_profiles = audio.get('eq_profiles', {
             'music': {'enabled': True, 'bands': []},
@@ -1470,48 +3785,15 @@ def get_eq_profiles():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/device/<device_id>/eq', methods=['POST'])
-def send_eq_to_device(device_id):
-    """Send EQ settings to a panel by calling the ESPHome custom service.
-    Payload: {profile: str, eq_enabled: bool, bands: [{enabled, type, freq, q, gain_db}]}
-    Calls esphome.{device_name}_set_eq_profile service on the device.
+def build_eq_service_data(data):
+    """Build the esphome.<base>_set_eq_profile payload from an EQ request body.
+    Raises ValueError if bands is not a list of band objects.
     """
-    raw_body = request.get_data(as_text=True)
-    logger.debug(f"send_eq_to_device: device_id={device_id}, content-type={request.content_type}, body={raw_body[:500]}")
-    data = request.get_json(silent=True)
-    if not isinstance(data, dict):
-        logger.warning(f"send_eq_to_device: Invalid payload from device_id={device_id}, data={data}, raw_body={raw_body[:500]}")
-        return jsonify({"error": "Invalid payload"}), 400
-
-    # Derive ESPHome entity base from MAC address
-    # MAC → last 6 hex chars (3 bytes) → smartpanel_{suffix}
-    def derive_entity_base(mac):
-        if not mac:
-            return device_to_entity_base(device_id)
-        clean = mac.lower().replace(':', '').replace('-', '')
-        suffix = clean[-6:] if len(clean) >= 6 else clean
-        if len(suffix) == 6 and all(c in '0123456789abcdef' for c in suffix):
-            return f"smartpanel_{suffix}"
-        return device_to_entity_base(device_id)
-
-    entity_base = derive_entity_base('')
-    try:
-        if LIVE_CONFIG.exists():
-            with open(LIVE_CONFIG, 'r') as f:
-                config = json.load(f)
-            for d in config.get('devices', []):
-                if d.get('id', '') == device_id:
-                    entity_base = derive_entity_base(d.get('mac', ''))
-                    break
-    except Exception as e:
-        logger.warning(f"Could not load config for MAC lookup: {e}")
-
-    # ESPHome service name: entity_base + _set_eq_profile
-    service_name = entity_base + '_set_eq_profile'
-
-    profile = data.get('profile', 'music')
-    eq_enabled = data.get('eq_enabled', False)
-    bands = data.get('bands', [])
+    bands = data.get('bands')
+    if bands is None:
+        bands = []
+    if not isinstance(bands, list) or not all(isinstance(b, dict) for b in bands):
+        raise ValueError("bands must be a list of band objects")
 
     # Strip band index for service call
     bands_clean = [
@@ -1524,87 +3806,207 @@ def send_eq_to_device(device_id):
         }
         for b in bands
     ]
-    bands_json = json.dumps(bands_clean)
 
-    service_data = {
-        'profile': profile,
-        'enabled': eq_enabled,
-        'bands_json': bands_json
+    return {
+        'profile': data.get('profile', 'music'),
+        'enabled': data.get('eq_enabled', False),
+        'bands_json': json.dumps(bands_clean)
     }
-    
-    logger.info(f"EQ service call: {service_name} for {device_id} with profile={profile}, enabled={eq_enabled}")
-    # Debug: log exact service call details
+
+
+# An unchanged EQ push is only skipped within this many seconds of the last one sent
+EQ_SKIP_TTL = float(os.environ.get('EQ_SKIP_TTL', '60'))
+
+# (service name, profile) -> (payload hash, monotonic time sent) of the last EQ push (per worker).
+# Entries for a panel are dropped when its services are (re)registered, i.e. after it reboots
+# or reconnects, so the first push after that is always sent.
+_eq_sent_hashes = {}
+_eq_sent_lock = threading.Lock()
+
+
+def eq_payload_hash(service_data):
+    return hashlib.sha1(json.dumps(service_data, sort_keys=True).encode()).hexdigest()
+
+
+def eq_recently_sent(service_name, service_data, payload_hash):
+    entry = _eq_sent_hashes.get((service_name, service_data['profile']))
+    return entry is not None and entry[0] == payload_hash and time.monotonic() - entry[1] < EQ_SKIP_TTL
+
+
+def forget_eq_sent(event_type, data):
+    """Mirror event listener: a panel (re)registered or lost its services"""
+    if data.get('domain') != 'esphome':
+        return
+    with _eq_sent_lock:
+        for key in [k for k in _eq_sent_hashes if k[0] == data.get('service')]:
+            del _eq_sent_hashes[key]
+
+
+state_mirror.event_listeners.append(forget_eq_sent)
+
+
+def push_eq_to_device(device_id, service_data, skip_unchanged=False):
+    """Call esphome.<base>_set_eq_profile for one device.
+    Returns a result dict: {device_id, service, status: sent|skipped|superseded|unavailable|failed,
+    elapsed_ms, error}. A newer EQ push for the same panel supersedes one still waiting to be sent.
+    """
+    started = time.monotonic()
+    service_name = get_device_index().entity_base(device_id) + '_set_eq_profile'
+    result = {"device_id": device_id, "service": f"esphome.{service_name}"}
+
+    payload_hash = eq_payload_hash(service_data)
+    if skip_unchanged and eq_recently_sent(service_name, service_data, payload_hash):
+        result.update(status="skipped", elapsed_ms=0)
+        return result
+
+    err = preflight_esphome_service(service_name)
+    if err:
+        result.update(status="unavailable", error=err,
+                      elapsed_ms=round((time.monotonic() - started) * 1000))
+        return result
+
     logger.info(f"EQ service call: domain=esphome, service={service_name}")
     logger.info(f"EQ service data: {json.dumps(service_data)}")
-    
-    success, err = call_ha_service(
-        'esphome',
-        service_name,
-        service_data
-    )
 
-    if not success:
+    success, err, superseded = queue_ha_service('esphome', service_name, service_data)
+    result["elapsed_ms"] = round((time.monotonic() - started) * 1000)
+    if superseded:
+        result["status"] = "superseded"
+    elif success:
+        with _eq_sent_lock:
+            _eq_sent_hashes[(service_name, service_data['profile'])] = (payload_hash, time.monotonic())
+        result["status"] = "sent"
+    else:
         logger.warning(f"EQ service call failed for {device_id} ({service_name}): {err}")
-        return jsonify({"error": f"Service call failed: {err}"}), 503
+        result.update(status="failed", error=err)
+    return result
+
 
-    logger.info(f"EQ sent to {device_id} via {service_name} — profile={profile}, enabled={eq_enabled}, bands={len(bands)}")
+@app.route('/api/device/<device_id>/eq', methods=['POST'])
+def send_eq_to_device(device_id):
+    """Send EQ settings to a panel by calling the ESPHome custom service.
+    Payload: {profile: str, eq_enabled: bool, bands: [{enabled, type, freq, q, gain_db}]}
+    Calls esphome.{device_name}_set_eq_profile service on the device.
+    """
+    raw_body = request.get_data(as_text=True)
+    logger.debug(f"send_eq_to_device: device_id={device_id}, content-type={request.content_type}, body={raw_body[:500]}")
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        logger.warning(f"send_eq_to_device: Invalid payload from device_id={device_id}, data={data}, raw_body={raw_body[:500]}")
+        return jsonify({"error": "Invalid payload"}), 400
+
+    try:
+        service_data = build_eq_service_data(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    profile = service_data['profile']
+    eq_enabled = service_data['enabled']
+    bands = data.get('bands', [])
+
+    result = push_eq_to_device(device_id, service_data)
+    if result['status'] == 'unavailable':
+        return jsonify({"error": result['error']}), 404
+    if result['status'] == 'failed':
+        return jsonify({"error": f"Service call failed: {result['error']}"}), 503
+
+    if result['status'] == 'superseded':
+        return jsonify({
+            "success": True,
+            "superseded": True,
+            "message": f"EQ for {device_id} replaced by a newer update before it was sent"
+        })
+
+    logger.info(f"EQ sent to {device_id} via {result['service']} — profile={profile}, enabled={eq_enabled}, bands={len(bands)}")
     return jsonify({
         "success": True,
         "message": f"EQ sent to {device_id} — profile: {profile}, enabled: {eq_enabled}, {len(bands)} bands"
     })
 
 
+# Upper bound on concurrent service calls for a bulk EQ push
+EQ_BULK_MAX_CONCURRENCY = int(os.environ.get('EQ_BULK_MAX_CONCURRENCY', '8'))
+
+
+@app.route('/api/devices/eq/bulk', methods=['POST'])
+def send_eq_bulk():
+    """Push one EQ profile to many panels in parallel.
+    Payload: {device_ids: [str] (default: all configured devices), profile, eq_enabled, bands,
+              force: bool (resend unchanged payloads), concurrency: int}
+    Returns per-device status and timing; a partial failure still returns 200 with success=false.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Invalid payload"}), 400
+
+    device_ids = data.get('device_ids')
+    if device_ids is None:
+        # Devices configured without an id are indexed under '' and have no services
+        device_ids = [d for d in get_device_index().by_id if d]
+    if not isinstance(device_ids, list) or not device_ids:
+        return jsonify({"error": "No devices to update"}), 400
+    # De-duplicate while keeping order
+    device_ids = list(dict.fromkeys(str(d) for d in device_ids))
+
+    try:
+        concurrency = int(data.get('concurrency', EQ_BULK_MAX_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency must be an integer"}), 400
+    concurrency = max(1, min(concurrency, EQ_BULK_MAX_CONCURRENCY, len(device_ids)))
+    skip_unchanged = not data.get('force', False)
+
+    try:
+        service_data = build_eq_service_data(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='eq-bulk') as pool:
+        results = list(pool.map(
+            lambda device_id: push_eq_to_device(device_id, service_data, skip_unchanged),
+            device_ids
+        ))
+
+    summary = {status: sum(1 for r in results if r['status'] == status)
+               for status in ('sent', 'skipped', 'superseded', 'unavailable', 'failed')}
+    logger.info(f"Bulk EQ push to {len(device_ids)} devices: {summary}")
+    return jsonify({
+        "success": summary['failed'] == 0 and summary['unavailable'] == 0,
+        "profile": service_data['profile'],
+        "summary": summary,
+        "elapsed_ms": round((time.monotonic() - started) * 1000),
+        "results": results
+    })
+
+
 @app.route('/api/config/eq', methods=['POST'])
 def save_eq_to_config():
     """Save EQ profile settings to the live configuration file.
     Payload: {eq_enabled: bool, eq_active_profile: str, eq_profiles: {music: {enabled, bands}, ...}}
     Merges EQ data into services.audio without destroying other audio fields.
+    Saves arriving within EQ_SAVE_DEBOUNCE_SECS of each other are written to disk once;
+    each request answers after that write, with its error if it failed.
     """
     data = request.get_json()
     if not isinstance(data, dict):
         return jsonify({"error": "Invalid payload"}), 400
 
-    if not LIVE_CONFIG.exists():
+    if not LIVE_STORE.exists():
         return jsonify({"error": "Live config not found"}), 404
 
-    try:
-        with open(LIVE_CONFIG, 'r') as f:
-            config = json.load(f)
-
-        # Ensure services.audio exists
-        if 'services' not in config:
-            config['services'] = {}
-        if 'audio' not in config['services']:
-            config['services']['audio'] = {}
-
-        audio = config['services']['audio']
-
-        # Merge EQ profile data (preserve all other audio fields)
-        if 'eq_enabled' in data:
-            audio['eq_enabled'] = data['eq_enabled']
-        if 'eq_active_profile' in data:
-            audio['eq_active_profile'] = data['eq_active_profile']
-        if 'eq_profiles' in data:
-            audio['eq_profiles'] = data['eq_profiles']
-
-        # Write back to live config
-        with open(LIVE_CONFIG, 'w') as f:
-            json.dump(config, f, indent=2)
-
-        profile_count = len(data.get('eq_profiles', {}))
-        logger.info(f"Saved EQ profiles to {LIVE_CONFIG}: {profile_count} profiles")
-        return jsonify({
-            "success": True,
-            "message": f"EQ profiles saved ({profile_count} profiles)",
-            "live_path": str(LIVE_CONFIG)
-        })
+    update = {k: data[k] for k in ('eq_enabled', 'eq_active_profile', 'eq_profiles') if k in data}
+    batch = eq_saver.submit(update)
+    if not batch.done.wait(EQ_SAVE_DEBOUNCE_SECS + EQ_SAVE_TIMEOUT):
+        return jsonify({"error": "EQ save timed out"}), 504
+    if isinstance(batch.error, FileNotFoundError):
+        return jsonify({"error": "Live config not found"}), 404
+    if batch.error is not None:
+        return jsonify({"error": f"Failed to save EQ config: {batch.error}"}), 500
 
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse live config: {e}")
-        return jsonify({"error": "Config file is corrupt"}), 500
-    except Exception as e:
-        logger.error(f"Failed to save EQ config: {e}")
-        return jsonify({"error": str(e)}), 500
+    profile_count = len(data.get('eq_profiles', {}))
+    return jsonify({
+        "success": True,
+        "message": f"EQ profiles saved ({profile_count} profiles)",
+        "live_path": str(LIVE_CONFIG)
+    })
 
 
 # =============================================================================
@@ -1625,7 +4027,16 @@ def ha_service_proxy():
     if not domain or not service:
         return jsonify({"error": "Missing domain or service"}), 400
     
-    success, err = call_ha_service(domain, service, service_data)
+    # Panel services disappear while the panel is offline; don't wait for HA to say so
+    if domain == 'esphome':
+        err = preflight_esphome_service(service)
+        if err:
+            return jsonify({"error": err}), 404
+    
+    success, err, superseded = queue_ha_service(domain, service, service_data)
+    if superseded:
+        # A newer value for the same entity replaced this one before it was sent
+        return jsonify({"success": True, "superseded": True})
     if success:
         return jsonify({"success": True})
     else:
@@ -1642,29 +4053,15 @@ def debug_esphome_services():
     """List all ESPHome services registered in HA"""
     if not RUNNING_IN_HA or not HA_TOKEN:
         return jsonify({"error": "Not running in HA mode"}), 503
-    try:
-        response = requests.get(
-            f'{HA_API}/services',
-            headers=get_headers(),
-            timeout=10
-        )
-        if response.status_code != 200:
-            return jsonify({"error": f"HA returned {response.status_code}", "text": response.text}), 502
-        services = response.json()
-        esphome_services = [s for s in services if s.get('domain') == 'esphome']
-        return jsonify({
-            "esphome_services": [
-                {
-                    "domain": s.get('domain'),
-                    "service": s.get('service'),
-                    "fields": list(s.get('fields', {}).keys())
-                }
-                for s in esphome_services
-            ]
-        })
-    except Exception as e:
-        logger.error(f"debug_esphome_services failed: {e}")
-        return jsonify({"error": str(e)}), 500
+    services, err = esphome_services.get(force=request.args.get('refresh') == '1')
+    if services is None:
+        return jsonify({"error": err}), 502
+    return jsonify({
+        "esphome_services": [
+            {"domain": "esphome", "service": name, "fields": fields}
+            for name, fields in sorted(services.items())
+        ]
+    })
 
 
 @app.route('/api/debug/test-eq/<device_id>', methods=['POST'])
@@ -1672,49 +4069,13 @@ def debug_test_eq(device_id):
     """Test EQ service call and return full request/response details"""
     data = request.get_json(silent=True) or {}
     
-    def derive_entity_base(mac):
-        if not mac:
-            return device_to_entity_base(device_id)
-        clean = mac.lower().replace(':', '').replace('-', '')
-        suffix = clean[-6:] if len(clean) >= 6 else clean
-        if len(suffix) == 6 and all(c in '0123456789abcdef' for c in suffix):
-            return f"smartpanel_{suffix}"
-        return device_to_entity_base(device_id)
-    
-    entity_base = derive_entity_base('')
-    try:
-        if LIVE_CONFIG.exists():
-            with open(LIVE_CONFIG, 'r') as f:
-                config = json.load(f)
-            for d in config.get('devices', []):
-                if d.get('id', '') == device_id:
-                    entity_base = derive_entity_base(d.get('mac', ''))
-                    break
-    except Exception as e:
-        logger.warning(f"Could not load config for MAC lookup: {e}")
+    entity_base = get_device_index().entity_base(device_id)
     
     service_name = entity_base + '_set_eq_profile'
-    profile = data.get('profile', 'music')
-    eq_enabled = data.get('eq_enabled', False)
-    bands = data.get('bands', [])
-    
-    bands_clean = [
-        {
-            'enabled': b.get('enabled', False),
-            'type': b.get('type', 'PEAK'),
-            'freq': b.get('freq', 1000),
-            'q': b.get('q', 1.0),
-            'gain_db': b.get('gain_db', 0.0)
-        }
-        for b in bands
-    ]
-    bands_json = json.dumps(bands_clean)
-    
-    service_data = {
-        'profile': profile,
-        'enabled': eq_enabled,
-        'bands_json': bands_json
-    }
+    try:
+        service_data = build_eq_service_data(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     url = f'{HA_API}/services/esphome/{service_name}'
     headers = get_headers()
@@ -1734,7 +4095,7 @@ def debug_test_eq(device_id):
         return jsonify(result)
     
     try:
-        ha_response = requests.post(url, headers=headers, json=service_data, timeout=10)
+        ha_response = ha_client.post(f'services/esphome/{service_name}', json=service_data, timeout='service')
         result["ha_status_code"] = ha_response.status_code
         result["ha_response_text"] = ha_response.text
         result["ha_response_headers"] = dict(ha_response.headers)
@@ -1748,9 +4109,16 @@ def debug_test_eq(device_id):
 # ART WIDGET - Image Management Endpoints
 # =============================================================================
 
+# Image metadata for the art directories (see art_catalogue.py)
+art_catalogue = ArtCatalogue(ADDON_CONFIG / 'art_catalogue.db')
+
+
 @app.route('/api/art/images', methods=['GET'])
 def list_art_images():
-    """List images in the art directory"""
+    """List images in the art directory.
+    Returns the file names plus per-image details (size, dimensions, format,
+    progressive flag, content hash and whether panels can display it).
+    """
     directory = request.args.get('directory', '/local/art')
     
     # Convert /local/art to /config/www/art path
@@ -1774,16 +4142,15 @@ def list_art_images():
     
     # List image files
     try:
-        images = []
-        for ext in ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp']:
-            images.extend([f.name for f in art_path.glob(ext)])
-        images.sort()
+        details = art_catalogue.list(art_path)
         
         return jsonify({
             "success": True,
             "directory": directory,
             "path": str(art_path),
-            "images": images
+            "images": [d['name'] for d in details],
+            "details": details,
+            "invalid_count": sum(1 for d in details if not d['valid'])
         })
     except Exception as e:
         logger.error(f"Failed to list images: {e}")
@@ -1841,75 +4208,51 @@ def validate_jpeg(file_stream, filename):
     
     Returns: (is_valid, error_message)
     """
-    # Read file content
-    content = file_stream.read()
-    file_stream.seek(0)  # Reset for later use
-    
-    # Check JPEG SOI marker (FF D8)
-    if len(content) < 2 or content[0] != 0xFF or content[1] != 0xD8:
+    # Only the headers up to the frame header are read, whatever the file size
+    try:
+        info = probe_jpeg(file_stream)
+    finally:
+        file_stream.seek(0)  # Reset for later use
+    if info is None:
         return False, "Not a valid JPEG file"
-    
-    # Parse JPEG markers
-    i = 2
-    width = None
-    height = None
-    is_progressive = False
-    
-    while i < len(content) - 1:
-        # Look for marker
-        if content[i] != 0xFF:
-            i += 1
-            continue
-        
-        marker = content[i + 1]
-        
-        # Skip padding
-        if marker == 0xFF:
-            i += 1
-            continue
-        
-        # SOF0 = Baseline DCT
-        if marker == 0xC0:
-            if i + 9 < len(content):
-                height = (content[i + 5] << 8) | content[i + 6]
-                width = (content[i + 7] << 8) | content[i + 8]
-        
-        # SOF2 = Progressive DCT
-        elif marker == 0xC2:
-            is_progressive = True
-            if i + 9 < len(content):
-                height = (content[i + 5] << 8) | content[i + 6]
-                width = (content[i + 7] << 8) | content[i + 8]
-        
-        # Skip to next marker
-        if marker == 0xD9:  # EOI
-            break
-        elif marker in [0xD8, 0x01]:  # SOI, TEM
-            i += 2
-        elif marker in [0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7]:  # Restart markers
-            i += 2
-        else:
-            # Skip segment length
-            if i + 3 < len(content):
-                length = (content[i + 2] << 8) | content[i + 3]
-                i += 2 + length
-            else:
-                break
-    
-    # Validate results
-    if is_progressive:
-        return False, "Progressive JPEG not supported - use baseline JPEG"
-    
-    if width != 720 or height != 720:
-        return False, f"Image must be 720x720 pixels, got {width}x{height}"
-    
-    return True, None
+    return panel_compatibility(info)
+
+
+# Largest accepted art upload (add-on option max_upload_mb)
+ART_MAX_UPLOAD_BYTES = int(float(os.environ.get('ART_MAX_UPLOAD_MB', '10')) * 1024 * 1024)
+# Room for the multipart boundaries and form fields around the file
+ART_FORM_OVERHEAD_BYTES = 64 * 1024
+
+# Normalization of uploads that are not panel-ready (see art_ingest.py; needs Pillow)
+ART_NORMALIZE = os.environ.get('ART_NORMALIZE', 'true').lower() in ('1', 'true', 'yes')
+ART_JPEG_QUALITY = int(os.environ.get('ART_JPEG_QUALITY', '85'))
+ART_TARGET_KB = int(os.environ.get('ART_TARGET_KB', '120'))
+ART_WORKERS = int(os.environ.get('ART_WORKERS', '2'))
+
+# Upload extensions: JPEG only unless uploads are normalized
+ART_UPLOAD_EXTENSIONS = ('.jpg', '.jpeg')
+ART_NORMALIZE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+
+art_ingest = ArtIngest(ADDON_CONFIG / 'art_cache', workers=ART_WORKERS,
+                       quality=ART_JPEG_QUALITY, target_kb=ART_TARGET_KB)
+if ART_NORMALIZE and not art_ingest.available:
+    logger.warning("Pillow is not installed - art uploads must already be 720x720 baseline JPEGs")
+
+
+def art_upload_too_large():
+    return jsonify({"error": f"Upload too large (max {ART_MAX_UPLOAD_BYTES // 1024} KB)"}), 413
 
 
 @app.route('/api/art/upload', methods=['POST'])
 def upload_art_image():
     """Upload an image to the art directory"""
-    directory = request.form.get('directory', '/local/art')
+    # Early reject when the size is declared; chunked bodies are bounded by MAX_CONTENT_LENGTH
+    if request.content_length is not None and request.content_length > ART_MAX_UPLOAD_BYTES + ART_FORM_OVERHEAD_BYTES:
+        return art_upload_too_large()
+    try:
+        directory = request.form.get('directory', '/local/art')
+    except RequestEntityTooLarge:
+        return art_upload_too_large()
     
     # Convert /local/art to /config/www/art path
     if directory.startswith('/local/'):
@@ -1937,34 +4280,150 @@ def upload_art_image():
     file = request.files['file']
     if file.filename == '':
         return jsonify({"error": "No file selected"}), 400
+    file.stream.seek(0, os.SEEK_END)
+    if file.stream.tell() > ART_MAX_UPLOAD_BYTES:
+        return art_upload_too_large()
+    file.stream.seek(0)
+    
+    body, status = store_art_image(file.stream, file.filename, art_path)
+    return jsonify(body), status
+
+
+def art_upload_extensions():
+    """File extensions accepted for art uploads (more when uploads are converted)"""
+    if ART_NORMALIZE and art_ingest.available:
+        return ART_NORMALIZE_EXTENSIONS
+    return ART_UPLOAD_EXTENSIONS
+
+
+def store_art_image(stream, filename, art_path):
+    """Validate an uploaded image and write it to art_path, converting it when needed.
+    Used by the form upload and by chunked upload sessions. Returns (response body, status).
+    """
+    normalize = ART_NORMALIZE and art_ingest.available
     
-    # Validate file extension - ONLY JPG/JPEG allowed
-    file_ext = Path(file.filename).suffix.lower()
-    if file_ext not in ['.jpg', '.jpeg']:
-        return jsonify({"error": "Only JPG/JPEG files allowed"}), 400
+    # Validate file extension - JPG/JPEG, or any decodable format when normalizing
+    file_ext = Path(filename).suffix.lower()
+    if file_ext not in art_upload_extensions():
+        if normalize:
+            return {"error": "Only JPG, PNG, WebP and GIF files allowed"}, 400
+        return {"error": "Only JPG/JPEG files allowed"}, 400
     
-    # Validate JPEG content
-    is_valid, error_msg = validate_jpeg(file.stream, file.filename)
-    file.stream.seek(0)  # Reset stream after validation
+    # Validate JPEG content; anything else is converted when normalizing
+    is_valid, error_msg = validate_jpeg(stream, filename)
+    stream.seek(0)  # Reset stream after validation
     
-    if not is_valid:
-        return jsonify({"error": error_msg}), 400
+    if not is_valid and not normalize:
+        return {"error": error_msg}, 400
     
-    # Save file with safe filename
+    # Save file with safe filename (normalized images always get a .jpg name)
     try:
-        safe_filename = Path(file.filename).name
-        file_path = art_path / safe_filename
-        file.save(str(file_path))
+        safe_filename = Path(filename).name
+        normalized = None
+        if is_valid:
+            file_path = art_path / safe_filename
+            with open(file_path, 'wb') as out:
+                shutil.copyfileobj(stream, out)
+        else:
+            safe_filename = Path(safe_filename).stem + '.jpg'
+            file_path = art_path / safe_filename
+            try:
+                normalized = art_ingest.save(stream, file_path)
+            except IngestBusy as e:
+                return {"error": f"Image processing busy, retry shortly ({e})"}, 503
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            if file_ext not in ART_UPLOAD_EXTENSIONS:
+                error_msg = f"{file_ext[1:].upper()} converted to JPEG"
+            normalized["reason"] = error_msg
+            logger.info(f"Normalized art upload {filename}: {error_msg}")
+        image = art_catalogue.update(art_path, safe_filename)
+        prewarm_art_thumbnail(file_path, image)
         
         logger.info(f"Uploaded art image: {file_path}")
-        return jsonify({
+        return {
             "success": True,
             "filename": safe_filename,
-            "path": str(file_path)
-        })
+            "path": str(file_path),
+            "image": image,
+            "normalized": normalized
+        }, 200
     except Exception as e:
         logger.error(f"Failed to upload image: {e}")
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
+
+
+@app.route('/api/art/ingest', methods=['GET'])
+def art_ingest_status():
+    """Report the art normalization pool: availability, settings, queue and cache counters"""
+    return jsonify({"enabled": ART_NORMALIZE, **art_ingest.status()})
+
+
+# Gallery thumbnail size rendered on upload and served when no size is asked for
+ART_THUMB_SIZE = 128
+# Thumbnails requested with ?v=<content hash> never change, so browsers may keep them this long
+ART_THUMB_MAX_AGE = 365 * 86400
+
+
+def prewarm_art_thumbnail(file_path, image):
+    """Queue the default gallery thumbnail of a new image without waiting for it"""
+    if not art_ingest.available or image is None:
+        return
+    try:
+        art_ingest.thumbnail(str(file_path), image['sha1'], ART_THUMB_SIZE, wait=False)
+    except IngestBusy:
+        pass  # Rendered on first view instead
+
+
+@app.route('/api/art/thumb/<path:directory>/<filename>', methods=['GET'])
+def art_thumbnail(directory, filename):
+    """Gallery thumbnail of an art image. directory is relative to /config/www (e.g. art).
+    Query: size (px, rounded up to 64/128/256/360, default 128), v (content hash from
+    /api/art/images; when it matches, the response is cacheable for a year).
+    """
+    art_path = Path('/config/www') / directory.strip('/')
+    
+    # Security check
+    try:
+        art_path = art_path.resolve()
+        www_path = Path('/config/www').resolve()
+        if not str(art_path).startswith(str(www_path)):
+            return jsonify({"error": "Invalid directory path"}), 403
+    except Exception as e:
+        return jsonify({"error": f"Invalid path: {str(e)}"}), 400
+    
+    filename = Path(filename).name
+    if Path(filename).suffix.lower() not in IMAGE_EXTENSIONS:
+        return jsonify({"error": "File not found"}), 404
+    image = art_catalogue.lookup(art_path, filename)
+    if image is None:
+        return jsonify({"error": "File not found"}), 404
+    try:
+        size = ArtIngest.thumb_size(int(request.args.get('size', ART_THUMB_SIZE)))
+    except ValueError:
+        return jsonify({"error": "size must be an integer"}), 400
+    
+    if request.args.get('v') == image['sha1']:
+        cache_control = f"public, max-age={ART_THUMB_MAX_AGE}, immutable"
+    else:
+        cache_control = 'no-cache'
+    etag = f"{image['sha1']}-{size}"
+    if etag_matches(etag):
+        response = Response(status=304)
+    elif not art_ingest.available:
+        # No Pillow: the original is the thumbnail
+        response = send_file(str(art_path / filename), conditional=False, etag=False)
+    else:
+        try:
+            thumb_path = art_ingest.thumbnail(str(art_path / filename), image['sha1'], size)
+        except IngestBusy as e:
+            return jsonify({"error": f"Image processing busy, retry shortly ({e})"}), 503, {'Retry-After': '1'}
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 422
+        response = send_file(thumb_path, mimetype='image/jpeg', conditional=False, etag=False)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
 
 
 @app.route('/api/art/delete', methods=['POST'])
@@ -1998,6 +4457,7 @@ def delete_art_image():
         file_path = art_path / Path(filename).name
         if file_path.exists():
             file_path.unlink()
+            art_catalogue.update(art_path, file_path.name)
             logger.info(f"Deleted art image: {file_path}")
             return jsonify({
                 "success": True,
@@ -2011,6 +4471,189 @@ def delete_art_image():
         return jsonify({"error": str(e)}), 500
 
 
+# =============================================================================
+# CHUNKED UPLOADS - resumable uploads for art and audio media
+# =============================================================================
+
+# Sessions without new data for this long are removed
+UPLOAD_SESSION_TTL = float(os.environ.get('UPLOAD_SESSION_TTL', '86400'))
+# Chunk size suggested to clients, and the largest chunk accepted
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+UPLOAD_MAX_CHUNK_BYTES = 8 * 1024 * 1024
+AUDIO_MAX_UPLOAD_BYTES = int(float(os.environ.get('AUDIO_MAX_UPLOAD_MB', '50')) * 1024 * 1024)
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.flac')
+
+upload_sessions = UploadSessions(ADDON_CONFIG / 'uploads', ttl=UPLOAD_SESSION_TTL)
+
+# Largest request body (an art form upload or one chunk). werkzeug enforces it while
+# reading, so bodies without Content-Length (chunked transfer via proxies) are bounded too.
+app.config['MAX_CONTENT_LENGTH'] = max(ART_MAX_UPLOAD_BYTES + ART_FORM_OVERHEAD_BYTES, UPLOAD_MAX_CHUNK_BYTES)
+
+
+def upload_limits(kind):
+    """(default directory, max bytes, allowed extensions) for an upload kind, or None"""
+    if kind == 'art':
+        return '/local/art', ART_MAX_UPLOAD_BYTES, art_upload_extensions()
+    if kind == 'audio':
+        return '/local/audio', AUDIO_MAX_UPLOAD_BYTES, AUDIO_EXTENSIONS
+    return None
+
+
+def www_directory(directory):
+    """Resolve a /local/... or www-relative directory. Returns (path, err), err = (message, status)"""
+    if directory.startswith('/local/'):
+        path = Path('/config/www') / directory[7:]
+    else:
+        path = Path('/config/www') / directory.strip('/')
+    try:
+        path = path.resolve()
+        if not str(path).startswith(str(Path('/config/www').resolve())):
+            return None, ("Invalid directory path", 403)
+    except Exception as e:
+        return None, (f"Invalid path: {str(e)}", 400)
+    return path, None
+
+
+def upload_error_response(e):
+    body = {"error": str(e)}
+    if e.received is not None:
+        body["received"] = e.received
+    return jsonify(body), e.status
+
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """Start a chunked upload session.
+    Body: {kind: art|audio, directory, filename, size, sha1 (optional, checked at finalize)}
+    Returns the session (id, received, progress, chunk_size, ...) with 201.
+    """
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind', 'art')
+    limits = upload_limits(kind)
+    if limits is None:
+        return jsonify({"error": f"Unknown upload kind: {kind}"}), 400
+    default_directory, max_bytes, extensions = limits
+    
+    filename = Path(str(data.get('filename', ''))).name
+    if not filename:
+        return jsonify({"error": "No filename provided"}), 400
+    if Path(filename).suffix.lower() not in extensions:
+        return jsonify({"error": f"Only {', '.join(e[1:].upper() for e in extensions)} files allowed"}), 400
+    size = data.get('size')
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        return jsonify({"error": "size must be a positive integer"}), 400
+    if size > max_bytes:
+        return jsonify({"error": f"Upload too large ({size // 1024} KB, max {max_bytes // 1024} KB)"}), 413
+    sha1 = data.get('sha1')
+    if sha1 is not None and not re.fullmatch(r'[0-9a-fA-F]{40}', str(sha1)):
+        return jsonify({"error": "sha1 must be 40 hex characters"}), 400
+    
+    directory = data.get('directory') or default_directory
+    _, err = www_directory(directory)
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+    
+    session = upload_sessions.create(kind, directory, filename, size, sha1)
+    logger.info(f"Upload session {session['id']}: {kind} {filename} ({size} bytes)")
+    return jsonify({**session, "chunk_size": UPLOAD_CHUNK_BYTES}), 201
+
+
+@app.route('/api/uploads', methods=['GET'])
+def list_uploads():
+    """Open upload sessions with their progress"""
+    return jsonify({"sessions": upload_sessions.list()})
+
+
+@app.route('/api/uploads/<session_id>', methods=['GET'])
+def get_upload(session_id):
+    """Progress of one upload session; clients resume from `received`"""
+    try:
+        return jsonify({**upload_sessions.get(session_id), "chunk_size": UPLOAD_CHUNK_BYTES})
+    except UploadError as e:
+        return upload_error_response(e)
+
+
+@app.route('/api/uploads/<session_id>', methods=['PUT'])
+def put_upload_chunk(session_id):
+    """Append a chunk. Query: offset (must equal the bytes received so far).
+    The raw request body is the chunk. 409 carries `received` when the offset is wrong.
+    """
+    if request.content_length is None:
+        return jsonify({"error": "Content-Length required"}), 411
+    if request.content_length > UPLOAD_MAX_CHUNK_BYTES:
+        return jsonify({"error": f"Chunk too large (max {UPLOAD_MAX_CHUNK_BYTES // 1024} KB)"}), 413
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({"error": "offset must be an integer"}), 400
+    try:
+        session = upload_sessions.write(session_id, offset, request.stream, request.content_length)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify(session)
+
+
+@app.route('/api/uploads/<session_id>/finalize', methods=['POST'])
+def finalize_upload(session_id):
+    """Verify a complete upload (size, SHA-1 from init or this body) and store it.
+    Art goes through the same validation and conversion as /api/art/upload. Audio
+    does not replace a different file of the same name unless overwrite is set.
+    Repeating a finalize that succeeded returns the same result.
+    Body (optional): {sha1, overwrite}
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        done = upload_sessions.result(session_id)
+        if done is not None:
+            return jsonify(done)
+        with upload_sessions.finalize(session_id, data.get('sha1')) as (session, part_path):
+            body, status = store_upload(session, part_path, bool(data.get('overwrite')))
+            body["upload"] = {"id": session_id, "size": session['size'], "sha1": session['sha1_received']}
+            # A busy converter (503) or a name clash (409) keeps the data for a retry
+            if status == 200:
+                upload_sessions.complete(session_id, body)
+            elif status not in (409, 503):
+                upload_sessions.discard(session_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify(body), status
+
+
+def store_upload(session, part_path, overwrite=False):
+    """Move or convert a verified upload into its directory. Returns (response body, status)."""
+    target, err = www_directory(session['directory'])
+    if err:
+        return {"error": err[0]}, err[1]
+    target.mkdir(parents=True, exist_ok=True)
+    
+    if session['kind'] == 'art':
+        with open(part_path, 'rb') as f:
+            return store_art_image(f, session['filename'], target)
+    
+    file_path = target / session['filename']
+    if file_path.exists() and not overwrite:
+        with open(file_path, 'rb') as f:
+            if file_sha1(f) != session['sha1_received']:
+                return {"error": f"{file_path.name} already exists with different content"}, 409
+        logger.info(f"Audio upload {file_path.name} matches the existing file")
+        return {"success": True, "filename": file_path.name, "path": str(file_path), "unchanged": True}, 200
+    shutil.move(part_path, file_path)
+    logger.info(f"Uploaded audio file: {file_path}")
+    return {"success": True, "filename": file_path.name, "path": str(file_path)}, 200
+
+
+@app.route('/api/uploads/<session_id>', methods=['DELETE'])
+def abort_upload(session_id):
+    """Abort an upload session and drop the data received"""
+    try:
+        found = upload_sessions.discard(session_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    if not found:
+        return jsonify({"error": "Upload session not found"}), 404
+    return jsonify({"success": True})
+
+
 if __name__ == '__main__':
     # Development mode
     app.run(host='0.0.0.0', port=8099, debug=True)
@@ -0,0 +1,228 @@
+"""
+Resumable chunked uploads
+
+A session is two files in the uploads directory:
+
+    <id>.json   what is being uploaded: kind, target directory, file name,
+                declared size and (optionally) the expected SHA-1
+    <id>.part   the bytes received so far
+
+Chunks are appended with write(id, offset, stream, length). The offset must
+equal the bytes already received, so a client that lost a chunk asks for the
+session, reads `received` and carries on from there. Because all state is on
+disk, sessions survive add-on restarts and work across gunicorn worker
+processes; a per-session flock keeps two requests from writing at once.
+
+finalize() checks the size and hash and keeps the session locked while the
+caller validates the file and moves it into place. complete() then replaces
+the session with <id>.done holding the result, so a finalize retried after
+a lost response gets the same answer. Sessions idle longer than the TTL
+are swept away.
+"""
+
+import hashlib
+import json
+import os
+import re
+import secrets
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows dev machines
+    fcntl = None
+
+SESSION_ID = re.compile(r'^[0-9a-f]{32}$')
+COPY_BUFFER = 65536
+
+
+class UploadError(Exception):
+    """Upload request that cannot be applied; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400, received=None):
+        super().__init__(message)
+        self.status = status
+        self.received = received
+
+
+class UploadSessions:
+    """Chunked upload sessions stored in a directory"""
+
+    def __init__(self, root, ttl=86400):
+        self.root = str(root)
+        self.ttl = ttl
+        os.makedirs(self.root, exist_ok=True)
+
+    def _paths(self, session_id):
+        if not SESSION_ID.match(session_id or ''):
+            raise UploadError("Upload session not found", 404)
+        base = os.path.join(self.root, session_id)
+        return base + '.json', base + '.part'
+
+    def _done_path(self, session_id):
+        return os.path.join(self.root, session_id + '.done')
+
+    def _load(self, session_id):
+        meta_path, part_path = self._paths(session_id)
+        try:
+            with open(meta_path) as f:
+                session = json.load(f)
+            received = os.path.getsize(part_path)
+            updated = os.path.getmtime(part_path)
+        except FileNotFoundError:
+            raise UploadError("Upload session not found", 404)
+        session["received"] = received
+        session["updated_at"] = updated
+        session["progress"] = round(received / session["size"], 4) if session["size"] else 1.0
+        return session
+
+    @contextmanager
+    def _locked(self, part_path):
+        """Open the part file exclusively; UploadError 409 if another request holds it"""
+        try:
+            f = open(part_path, 'r+b')
+        except FileNotFoundError:
+            raise UploadError("Upload session not found", 404)
+        with f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise UploadError("Another request is writing this upload", 409)
+            yield f
+
+    def create(self, kind, directory, filename, size, sha1=None):
+        """Start a session. Returns the session dict (id, received 0, ...)."""
+        self.sweep()
+        session_id = secrets.token_hex(16)
+        meta_path, part_path = self._paths(session_id)
+        session = {
+            "id": session_id,
+            "kind": kind,
+            "directory": directory,
+            "filename": filename,
+            "size": size,
+            "sha1": sha1.lower() if sha1 else None,
+            "created_at": time.time()
+        }
+        open(part_path, 'wb').close()
+        tmp = meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(session, f)
+        os.replace(tmp, meta_path)
+        return self._load(session_id)
+
+    def get(self, session_id):
+        return self._load(session_id)
+
+    def list(self):
+        sessions = []
+        for name in os.listdir(self.root):
+            if name.endswith('.json'):
+                try:
+                    sessions.append(self._load(name[:-5]))
+                except UploadError:
+                    pass  # Finished or aborted while listing
+        sessions.sort(key=lambda s: s["created_at"])
+        return sessions
+
+    def write(self, session_id, offset, stream, length):
+        """Append `length` bytes from stream at `offset`. Returns the updated session.
+        Raises UploadError 409 (with received) when offset is not where the upload stands.
+        """
+        session = self._load(session_id)
+        _, part_path = self._paths(session_id)
+        if offset + length > session["size"]:
+            raise UploadError(f"Chunk ends at {offset + length}, past the declared size {session['size']}", 413)
+        with self._locked(part_path) as f:
+            received = os.fstat(f.fileno()).st_size
+            if offset != received:
+                raise UploadError(f"Expected offset {received}, got {offset}", 409, received)
+            f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                chunk = stream.read(min(COPY_BUFFER, remaining))
+                if not chunk:
+                    break  # Client went away; the bytes so far are kept
+                f.write(chunk)
+                remaining -= len(chunk)
+        return self._load(session_id)
+
+    @contextmanager
+    def finalize(self, session_id, sha1=None):
+        """Check the upload is complete and matches its hash.
+        Yields (session, path of the received file) with the session locked, so a
+        concurrent finalize gets a 409 instead of a file that is being moved. Inside
+        the block the caller moves or copies the file, then calls complete() or discard().
+        """
+        session = self._load(session_id)
+        _, part_path = self._paths(session_id)
+        if session["received"] != session["size"]:
+            raise UploadError(f"Upload incomplete: {session['received']} of {session['size']} bytes",
+                              409, session["received"])
+        expected = (sha1 or session["sha1"] or '').lower()
+        digest = hashlib.sha1()
+        with self._locked(part_path) as f:
+            if not os.path.exists(part_path):
+                raise UploadError("Upload session not found", 404)  # Moved by a finalize that just finished
+            for chunk in iter(lambda: f.read(COPY_BUFFER), b''):
+                digest.update(chunk)
+            session["sha1_received"] = digest.hexdigest()
+            if expected and expected != session["sha1_received"]:
+                raise UploadError(f"SHA-1 mismatch: expected {expected}, received {session['sha1_received']}", 422)
+            yield session, part_path
+
+    def complete(self, session_id, result):
+        """Replace a finalized session by its result (kept until the TTL sweep)"""
+        done_path = self._done_path(session_id)
+        tmp = done_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp, done_path)
+        self.discard(session_id, keep_result=True)
+
+    def result(self, session_id):
+        """Result stored by complete(), or None"""
+        self._paths(session_id)  # Validates the id
+        try:
+            with open(self._done_path(session_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def discard(self, session_id, keep_result=False):
+        """Remove a session and its data. Returns False if it did not exist."""
+        found = False
+        paths = list(self._paths(session_id))
+        if not keep_result:
+            paths.append(self._done_path(session_id))
+        for path in paths:
+            try:
+                os.unlink(path)
+                found = True
+            except FileNotFoundError:
+                pass
+        return found
+
+    def sweep(self):
+        """Drop sessions that have not received data for longer than the TTL"""
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.root):
+            if name.endswith('.done'):
+                try:
+                    if os.path.getmtime(os.path.join(self.root, name)) < cutoff:
+                        os.unlink(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    pass
+                continue
+            if not name.endswith('.json'):
+                continue
+            session_id = name[:-5]
+            try:
+                idle_since = max(os.path.getmtime(os.path.join(self.root, name)),
+                                 os.path.getmtime(os.path.join(self.root, session_id + '.part')))
+            except FileNotFoundError:
+                idle_since = 0
+            if idle_since < cutoff:
+                self.discard(session_id)
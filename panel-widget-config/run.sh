@@ -5,6 +5,31 @@ set -e
 export FLASK_APP=main.py
 export PYTHONPATH=/app
 
+# Add-on options (written by the Supervisor)
+OPTIONS_FILE=/data/options.json
+
+read_option() {
+    python3 -c "import json, sys; print(json.load(open(sys.argv[1])).get(sys.argv[2], sys.argv[3]))" \
+        "$OPTIONS_FILE" "$1" "$2" 2>/dev/null || echo "$2"
+}
+
+# gthread: threaded workers, HA proxy calls only block a thread (default)
+# sync: one request per worker process (legacy)
+SERVER_MODE=$(read_option server_mode gthread)
+WORKERS=$(read_option workers 2)
+THREADS=$(read_option threads 32)
+export SERVER_MODE
+export SERVER_THREADS="$THREADS"
+export BINARY_CONFIG=$(read_option binary_config false)
+export CONFIG_VALIDATION=$(read_option config_validation warn)
+export CONFIG_HISTORY_MAX_VERSIONS=$(read_option history_max_versions 200)
+export CONFIG_HISTORY_MAX_DAYS=$(read_option history_max_days 90)
+export ART_MAX_UPLOAD_MB=$(read_option max_upload_mb 10)
+export ART_NORMALIZE=$(read_option art_normalize true)
+export ART_JPEG_QUALITY=$(read_option art_jpeg_quality 85)
+export ART_TARGET_KB=$(read_option art_target_kb 120)
+export ART_WORKERS=$(read_option art_workers 2)
+
 # Create config directory if not exists
 mkdir -p /config/panel_widgets
 
@@ -12,11 +37,19 @@ mkdir -p /config/panel_widgets
 echo "Starting Panel Widget Configurator..."
 echo "Config directory: /config/panel_widgets"
 echo "API endpoint: http://supervisor/core/api"
+echo "Server mode: $SERVER_MODE ($WORKERS workers, $THREADS threads)"
+
+if [ "$SERVER_MODE" = "sync" ]; then
+    WORKER_ARGS="--worker-class sync"
+else
+    WORKER_ARGS="--worker-class gthread --threads $THREADS"
+fi
 
 # Run with gunicorn for production
 exec gunicorn \
     --bind 0.0.0.0:8099 \
-    --workers 2 \
+    --workers "$WORKERS" \
+    $WORKER_ARGS \
     --timeout 30 \
     --access-logfile - \
     --error-logfile - \
@@ -205,9 +205,11 @@ const app = {
             if (response.ok) {
                 const result = await response.json();
                 this.showToast('Configuration saved and is now LIVE!', 'success');
+                this.showValidationWarning(result.validation);
             } else {
                 const error = await response.json();
                 this.showToast(error.error || 'Failed to make live', 'error');
+                this.showValidationWarning(error.validation);
             }
         } catch (error) {
             console.error('Failed to save live:', error);
@@ -215,6 +217,17 @@ const app = {
         }
     },
     
+    // Report schema validation errors returned with a save
+    showValidationWarning(validation) {
+        if (!validation || validation.valid) return;
+        
+        const errors = validation.errors || [];
+        errors.forEach(e => console.warn(`Config validation: ${e.path}: ${e.message}`));
+        const first = errors[0];
+        const more = errors.length > 1 ? ` (+${errors.length - 1} more, see console)` : '';
+        this.showToast(`Validation: ${first.path.replace(/^\$\./, '')}: ${first.message}${more}`, 'warning');
+    },
+    
     // Save to staging (show filename dialog)
     doSaveStaging() {
         this.closeSavePromptModal();
@@ -249,6 +262,7 @@ const app = {
             if (response.ok) {
                 const result = await response.json();
                 this.showToast(`Configuration saved to staging: ${result.filename}`, 'success');
+                this.showValidationWarning(result.validation);
             } else {
                 const error = await response.json();
                 this.showToast(error.error || 'Failed to save', 'error');
@@ -458,6 +472,7 @@ const app = {
             } else {
                 this.showToast(result.error || 'Failed to make live', 'error');
             }
+            this.showValidationWarning(result.validation);
         } catch (error) {
             console.error('Failed to make live:', error);
             this.showToast('Failed to make configuration live', 'error');
@@ -1091,16 +1106,25 @@ const app = {
                 return;
             }
             
-            // Render image list with thumbnails
-            const haBaseUrl = window.location.origin;  // Get HA base URL
+            // Per-image details from the server catalogue (dimensions, format, panel compatibility)
+            const details = {};
+            (data.details || []).forEach(d => { details[d.name] = d; });
+            
+            // Render image list with server-side thumbnails (cached by content hash)
+            const thumbDir = directory.replace(/^\/local\//, '').replace(/^\/+|\/+$/g, '')
+                .split('/').map(encodeURIComponent).join('/');
             listContainer.innerHTML = imagesToShow.map((img, index) => {
-                const imageUrl = `${haBaseUrl}/local/art/${encodeURIComponent(img)}`;
+                const info = details[img];
+                const imageUrl = `api/art/thumb/${thumbDir}/${encodeURIComponent(img)}?size=128&v=${info ? info.sha1 : ''}`;
+                const warning = !info ? 'File not found in directory' : (info.valid ? '' : info.error);
+                const meta = info && info.width ? `${info.width}&times;${info.height}, ${Math.round(info.size / 1024)} KB` : '';
                 return `
                 <div class="art-image-item" draggable="true" data-filename="${img}" style="display: flex; align-items: center; padding: 10px; border-bottom: 1px solid var(--border-color); background: var(--bg-secondary); cursor: grab; gap: 10px;">
                     <span class="drag-handle" style="color: var(--text-muted); cursor: grab;"><i class="fas fa-grip-vertical"></i></span>
                     <span class="image-number" style="color: var(--text-muted); min-width: 25px; text-align: center;">${index + 1}</span>
-                    <img src="${imageUrl}" alt="${img}" style="width: 60px; height: 60px; object-fit: cover; border-radius: 4px; border: 1px solid var(--border-color); flex-shrink: 0;" onerror="this.style.display='none'">
-                    <span class="image-name" style="flex: 1; font-family: monospace; font-size: 12px; word-break: break-all;">${img}</span>
+                    <img src="${imageUrl}" alt="${img}" loading="lazy" decoding="async" style="width: 60px; height: 60px; object-fit: cover; border-radius: 4px; border: 1px solid var(--border-color); flex-shrink: 0;" onerror="this.style.display='none'">
+                    <span class="image-name" style="flex: 1; font-family: monospace; font-size: 12px; word-break: break-all;">${img}${meta ? `<br><small style="color: var(--text-muted);">${meta}</small>` : ''}</span>
+                    ${warning ? `<span class="image-warning" title="${warning}" style="color: var(--warning);"><i class="fas fa-exclamation-triangle"></i></span>` : ''}
                     <button class="btn btn-sm btn-danger" onclick="app.deleteArtImage('${img}')">
                         <i class="fas fa-trash"></i>
                     </button>
@@ -1159,60 +1183,74 @@ const app = {
         });
     },
     
-    // Upload new images
+    // Upload new images (chunked, resumable sessions; a few files in parallel)
     async uploadArtImages(input) {
-        const files = input.files;
-        if (!files || files.length === 0) return;
+        const files = Array.from(input.files || []);
+        if (files.length === 0) return;
         
         const directory = document.getElementById('art-manager-directory').value;
         const uploadArea = document.querySelector('.file-upload-area');
         const originalContent = uploadArea.innerHTML;
         
-        uploadArea.innerHTML = `<i class="fas fa-spinner fa-spin" style="font-size: 24px;"></i><p>Uploading ${files.length} image(s)...</p>`;
-        
         let successCount = 0;
+        let normalizedCount = 0;
         let errorCount = 0;
         let errorMessages = [];
         
-        for (const file of files) {
-            // Pre-validate file extension
-            if (!file.name.toLowerCase().endsWith('.jpg') && !file.name.toLowerCase().endsWith('.jpeg')) {
-                errorCount++;
-                errorMessages.push(`${file.name}: Only JPG/JPEG files allowed`);
-                continue;
-            }
-            
-            const formData = new FormData();
-            formData.append('file', file);
-            formData.append('directory', directory);
-            
-            try {
-                const response = await fetch('api/art/upload', {
-                    method: 'POST',
-                    body: formData
+        // Bytes sent per file, for the overall progress
+        const sent = new Map();
+        const totalBytes = files.reduce((sum, f) => sum + f.size, 0) || 1;
+        const showProgress = () => {
+            let bytes = 0;
+            sent.forEach(n => { bytes += n; });
+            const done = successCount + errorCount;
+            uploadArea.innerHTML = `<i class="fas fa-spinner fa-spin" style="font-size: 24px;"></i><p>Uploading ${done}/${files.length} image(s)... ${Math.floor(bytes * 100 / totalBytes)}%</p>`;
+        };
+        showProgress();
+        
+        const queue = [...files];
+        const worker = async () => {
+            while (queue.length > 0) {
+                const file = queue.shift();
+                // Pre-validate file extension (the server converts non-JPEG formats when it can)
+                if (!/\.(jpe?g|png|webp|gif)$/i.test(file.name)) {
+                    errorCount++;
+                    errorMessages.push(`${file.name}: Only JPG, PNG, WebP and GIF files allowed`);
+                    continue;
+                }
+                let data = await this.uploadFileChunked(file, 'art', directory, (bytes) => {
+                    sent.set(file, bytes);
+                    showProgress();
                 });
-                
-                const data = await response.json();
+                if (data.conflict) {
+                    if (confirm(`${file.name}: ${data.error}.\n\nReplace the existing file?`)) {
+                        data = await this.finalizeUpload(data.session_id, true);
+                    } else {
+                        this.abortUpload(data.session_id);
+                        data = { error: 'Existing file kept' };
+                    }
+                }
                 if (data.success) {
                     successCount++;
+                    if (data.normalized) normalizedCount++;
                 } else {
                     errorCount++;
                     errorMessages.push(`${file.name}: ${data.error}`);
                     console.error(`Failed to upload ${file.name}:`, data.error);
                 }
-            } catch (error) {
-                errorCount++;
-                errorMessages.push(`${file.name}: Network error`);
-                console.error(`Error uploading ${file.name}:`, error);
+                sent.set(file, file.size);
+                showProgress();
             }
-        }
+        };
+        await Promise.all(Array.from({ length: Math.min(3, files.length) }, worker));
         
         // Restore upload area
         uploadArea.innerHTML = originalContent;
         
         // Show result
         if (successCount > 0) {
-            this.showToast(`Uploaded ${successCount} image(s)`, 'success');
+            const converted = normalizedCount > 0 ? ` (${normalizedCount} converted to 720x720 baseline JPEG)` : '';
+            this.showToast(`Uploaded ${successCount} image(s)${converted}`, 'success');
         }
         if (errorCount > 0) {
             // Show detailed error for first error
@@ -1230,6 +1268,107 @@ const app = {
         input.value = '';
     },
     
+    // SHA-1 of a file as hex, or null where WebCrypto is unavailable (plain http)
+    async fileSha1(file) {
+        if (!window.crypto || !window.crypto.subtle) return null;
+        const digest = await window.crypto.subtle.digest('SHA-1', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    },
+    
+    // Upload one file through /api/uploads: init, PUT chunks (resuming after errors), finalize.
+    // Resolves to the finalize response (see finalizeUpload for name clashes), or {error}.
+    // A session given up on is deleted.
+    async uploadFileChunked(file, kind, directory, onProgress) {
+        const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+        let session;
+        try {
+            const response = await fetch('api/uploads', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ kind, directory, filename: file.name, size: file.size, sha1: await this.fileSha1(file) })
+            });
+            session = await response.json();
+            if (!response.ok) return session;
+        } catch (error) {
+            return { error: 'Network error' };
+        }
+        
+        let offset = 0;
+        let failures = 0;
+        while (offset < file.size) {
+            try {
+                const response = await fetch(`api/uploads/${session.id}?offset=${offset}`, {
+                    method: 'PUT',
+                    body: file.slice(offset, offset + session.chunk_size)
+                });
+                const data = await response.json();
+                if (response.ok) {
+                    offset = data.received;
+                    failures = 0;
+                    if (onProgress) onProgress(offset);
+                    continue;
+                }
+                if (response.status !== 409 && response.status < 500) {
+                    this.abortUpload(session.id);
+                    return data;
+                }
+            } catch (error) {
+                console.warn(`Chunk upload of ${file.name} failed, resuming:`, error);
+            }
+            // Resume from what the server actually has
+            if (++failures > 5) {
+                this.abortUpload(session.id);
+                return { error: 'Upload interrupted, please retry' };
+            }
+            await sleep(500 * failures);
+            try {
+                const status = await fetch(`api/uploads/${session.id}`);
+                if (status.ok) offset = (await status.json()).received;
+            } catch (error) {
+                // Retried on the next pass
+            }
+        }
+        
+        return this.finalizeUpload(session.id);
+    },
+    
+    // Finalize an upload session, retrying while the server is busy. A name clash resolves to
+    // {conflict: true, session_id} with the session kept: finalize again with overwrite = true,
+    // or abortUpload() it. Any other failure aborts the session.
+    async finalizeUpload(sessionId, overwrite = false) {
+        const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+        // 503: converter busy. 409 after a lost response: our earlier finalize is still running.
+        let lostResponse = false;
+        for (let attempt = 0; ; attempt++) {
+            let data = { error: 'Network error' };
+            let status = 0;
+            try {
+                const response = await fetch(`api/uploads/${sessionId}/finalize`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ overwrite })
+                });
+                status = response.status;
+                data = await response.json();
+            } catch (error) {
+                lostResponse = true;
+            }
+            if (status === 409 && !lostResponse) {
+                return { ...data, conflict: true, session_id: sessionId };
+            }
+            const retry = status === 0 || status === 503 || status === 409;
+            if (!retry || attempt >= 5) {
+                if (!data.success) this.abortUpload(sessionId);
+                return data;
+            }
+            await sleep(1000);
+        }
+    },
+    
+    abortUpload(sessionId) {
+        return fetch(`api/uploads/${sessionId}`, { method: 'DELETE' }).catch(() => {});
+    },
+    
     // Delete an image
     async deleteArtImage(filename) {
         if (!confirm(`Are you sure you want to delete "${filename}"?\n\nThis cannot be undone.`)) {
@@ -1728,63 +1867,88 @@ const app = {
     // Entity picker modal
     async pickEntity(button, domain) {
         this.currentEntityButton = button;
+        this.openEntityPicker(domain, (entityId) => this.selectEntity(entityId));
+    },
+    
+    // Open the entity picker; matches are searched server side as the user types
+    openEntityPicker(domain, onSelect) {
         this.currentEntityDomain = domain;
         
         const modal = document.getElementById('entity-modal');
         const list = document.getElementById('entity-list');
+        const search = document.getElementById('entity-search');
         
         list.innerHTML = '<div class="entity-item">Loading...</div>';
+        search.value = '';
         modal.classList.add('active');
         
-        try {
-            const response = await fetch(`api/entities/${domain}`);
-            const data = await response.json();
-            
-            this.renderEntityList(data.entities || []);
-        } catch (error) {
-            list.innerHTML = '<div class="entity-item">Failed to load entities</div>';
-        }
+        let timer = null;
+        let latest = 0;
+        const run = async (query) => {
+            const requestId = ++latest;
+            try {
+                const params = new URLSearchParams({ q: query, domain: domain, limit: 50 });
+                const response = await fetch(`api/entities/search?${params}`);
+                const data = await response.json();
+                // Ignore answers to queries the user has already typed past
+                if (requestId !== latest) return;
+                if (!response.ok) {
+                    list.innerHTML = `<div class="entity-item">${data.error || 'Failed to load entities'}</div>`;
+                    return;
+                }
+                this.renderEntityList(data.entities || [], data.total || 0, onSelect);
+            } catch (error) {
+                if (requestId === latest) {
+                    list.innerHTML = '<div class="entity-item">Failed to load entities</div>';
+                }
+            }
+        };
+        
+        run('');
+        search.oninput = (e) => {
+            clearTimeout(timer);
+            timer = setTimeout(() => run(e.target.value), 150);
+        };
     },
     
     // Render entity list
-    renderEntityList(entities) {
+    renderEntityList(entities, total, onSelect) {
         const list = document.getElementById('entity-list');
-        const search = document.getElementById('entity-search');
+        list.innerHTML = '';
         
-        const render = (filter = '') => {
-            list.innerHTML = '';
-            
-            const filtered = entities.filter(e => 
-                e.entity_id.toLowerCase().includes(filter.toLowerCase()) ||
-                e.name.toLowerCase().includes(filter.toLowerCase())
-            );
-            
-            filtered.forEach(entity => {
-                const item = document.createElement('div');
-                item.className = 'entity-item';
-                
-                // Icon based on domain
-                let icon = 'circle';
-                if (this.currentEntityDomain === 'light') icon = 'lightbulb';
-                else if (this.currentEntityDomain === 'cover') icon = 'window-shutter';
-                else if (this.currentEntityDomain === 'climate') icon = 'temperature-half';
-                
-                item.innerHTML = `
-                    <i class="fas fa-${icon}"></i>
-                    <div>
-                        <div>${entity.name}</div>
-                        <small style="color: var(--text-muted)">${entity.entity_id}</small>
-                    </div>
-                    <span class="state">${entity.state}</span>
-                `;
-                item.onclick = () => this.selectEntity(entity.entity_id);
-                list.appendChild(item);
-            });
-        };
+        // Icon based on domain
+        let icon = 'circle';
+        if (this.currentEntityDomain === 'light') icon = 'lightbulb';
+        else if (this.currentEntityDomain === 'cover') icon = 'window-shutter';
+        else if (this.currentEntityDomain === 'binary_sensor') icon = 'motion-sensor';
+        else if (this.currentEntityDomain === 'climate') icon = 'temperature-half';
+        
+        if (entities.length === 0) {
+            list.innerHTML = '<div class="entity-item">No matching entities</div>';
+            return;
+        }
         
-        render();
+        entities.forEach(entity => {
+            const item = document.createElement('div');
+            item.className = 'entity-item';
+            item.innerHTML = `
+                <i class="fas fa-${icon}"></i>
+                <div>
+                    <div>${entity.name}</div>
+                    <small style="color: var(--text-muted)">${entity.entity_id}</small>
+                </div>
+                <span class="state">${entity.state}</span>
+            `;
+            item.onclick = () => onSelect(entity.entity_id);
+            list.appendChild(item);
+        });
         
-        search.oninput = (e) => render(e.target.value);
+        if (total > entities.length) {
+            const more = document.createElement('div');
+            more.className = 'entity-item';
+            more.innerHTML = `<small style="color: var(--text-muted)">${total - entities.length} more, type to narrow the list</small>`;
+            list.appendChild(more);
+        }
     },
     
     // Select entity from picker
@@ -1811,64 +1975,7 @@ const app = {
     // Show entity picker for an input field (by ID)
     async showEntityPicker(inputId, domain) {
         this.currentEntityInput = document.getElementById(inputId);
-        this.currentEntityDomain = domain;
-        
-        const modal = document.getElementById('entity-modal');
-        const list = document.getElementById('entity-list');
-        
-        list.innerHTML = '<div class="entity-item">Loading...</div>';
-        modal.classList.add('active');
-        
-        try {
-            const response = await fetch(`api/entities/${domain}`);
-            const data = await response.json();
-            
-            this.renderEntityListForInput(data.entities || []);
-        } catch (error) {
-            list.innerHTML = '<div class="entity-item">Failed to load entities</div>';
-        }
-    },
-    
-    // Render entity list for input field selection
-    renderEntityListForInput(entities) {
-        const list = document.getElementById('entity-list');
-        const search = document.getElementById('entity-search');
-        
-        const render = (filter = '') => {
-            list.innerHTML = '';
-            
-            const filtered = entities.filter(e => 
-                e.entity_id.toLowerCase().includes(filter.toLowerCase()) ||
-                e.name.toLowerCase().includes(filter.toLowerCase())
-            );
-            
-            filtered.forEach(entity => {
-                const item = document.createElement('div');
-                item.className = 'entity-item';
-                
-                // Icon based on domain
-                let icon = 'circle';
-                if (this.currentEntityDomain === 'light') icon = 'lightbulb';
-                else if (this.currentEntityDomain === 'cover') icon = 'window-shutter';
-                else if (this.currentEntityDomain === 'binary_sensor') icon = 'motion-sensor';
-                else if (this.currentEntityDomain === 'climate') icon = 'temperature-half';
-                
-                item.innerHTML = `
-                    <i class="fas fa-${icon}"></i>
-                    <div>
-                        <div>${entity.name}</div>
-                        <small style="color: var(--text-muted)">${entity.entity_id}</small>
-                    </div>
-                    <span class="state">${entity.state}</span>
-                `;
-                item.onclick = () => this.selectEntityForInput(entity.entity_id);
-                list.appendChild(item);
-            });
-        };
-        
-        render();
-        
-        search.oninput = (e) => render(e.target.value);
+        this.openEntityPicker(domain, (entityId) => this.selectEntityForInput(entityId));
     },
     
     // Select entity for input field
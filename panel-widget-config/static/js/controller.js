@@ -169,6 +169,7 @@ const controller = {
             document.getElementById('gain-device-select').value = e.target.value;
             this.updateDeviceStatus();
             this.updateGainDeviceStatus();
+            this.restartGainPolling();
             if (this.selectedDevice) {
                 await this.loadDeviceHaState();
             }
@@ -179,6 +180,7 @@ const controller = {
             document.getElementById('device-select').value = e.target.value;
             this.updateDeviceStatus();
             this.updateGainDeviceStatus();
+            this.restartGainPolling();
             if (this.selectedDevice) {
                 await this.loadDeviceHaState();
                 await this.loadGainControlState();
@@ -216,6 +218,22 @@ const controller = {
         this.setupCanvasTooltip();
     },
 
+    async fetchHaStates(entityIds) {
+        // One round trip for several entities; returns {entity_id: {success, state, attributes}}
+        const response = await fetch('./api/ha_state/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ entity_ids: entityIds })
+        });
+        const data = await response.json();
+        const result = {};
+        entityIds.forEach(id => {
+            const s = data.states && data.states[id];
+            result[id] = s ? { success: true, state: s.state, attributes: s.attributes } : { success: false };
+        });
+        return result;
+    },
+
     async loadDeviceHaState() {
         if (!this.selectedDevice) return;
         const deviceId = this.selectedDevice.id;
@@ -223,25 +241,28 @@ const controller = {
         const base = this.deriveEntityBase(mac) || deviceId.toLowerCase().replace(/ /g, '_').replace(/-/g, '_');
 
         try {
+            const states = await this.fetchHaStates([
+                `sensor.${base}_eq_active_profile`,
+                `binary_sensor.${base}_eq_enabled`,
+                `sensor.${base}_eq_bands`
+            ]);
+
             // Read active profile
-            const profileResp = await fetch(`./api/ha_state/sensor.${base}_eq_active_profile`);
-            const profileData = await profileResp.json();
+            const profileData = states[`sensor.${base}_eq_active_profile`];
             if (profileData.success && ['music', 'intercom', 'pa'].includes(profileData.state)) {
                 this.activeProfile = profileData.state;
                 document.getElementById('eq-profile-select').value = this.activeProfile;
             }
 
             // Read enabled state
-            const enabledResp = await fetch(`./api/ha_state/binary_sensor.${base}_eq_enabled`);
-            const enabledData = await enabledResp.json();
+            const enabledData = states[`binary_sensor.${base}_eq_enabled`];
             if (enabledData.success) {
                 this.eqEnabled = enabledData.state === 'on';
                 document.getElementById('eq-master-enable').checked = this.eqEnabled;
             }
 
             // Read bands for the active profile (from native ESPHome text_sensor state)
-            const bandsResp = await fetch(`./api/ha_state/sensor.${base}_eq_bands`);
-            const bandsData = await bandsResp.json();
+            const bandsData = states[`sensor.${base}_eq_bands`];
             const bandsState = bandsData.state;
             if (bandsData.success && bandsState && bandsState !== 'unknown' && bandsState !== 'unavailable') {
                 try {
@@ -989,6 +1010,9 @@ const controller = {
     // ========================================================================
 
     gainPollInterval: null,
+    gainStream: null,
+    gainStreamFailed: false,
+    gainStreamRetryAt: 0,
     preMuteGain: null,
     isMuted: false,
 
@@ -1004,9 +1028,24 @@ const controller = {
     },
 
     startGainPolling() {
-        if (this.gainPollInterval) return;
+        if (this.gainPollInterval || this.gainStream) return;
         this.loadGainControlState();
-        this.gainPollInterval = setInterval(() => this.loadGainControlState(), 2000);
+        // Prefer the server push stream; fall back to polling if it is unavailable
+        if (this.gainStreamFailed && Date.now() >= this.gainStreamRetryAt) {
+            this.gainStreamFailed = false;
+        }
+        if (window.EventSource && this.selectedDevice && !this.gainStreamFailed) {
+            this.startGainStream();
+        } else {
+            this.gainPollInterval = setInterval(() => {
+                // Try the stream again once the server may have reconnected to HA
+                if (this.gainStreamFailed && Date.now() >= this.gainStreamRetryAt) {
+                    this.restartGainPolling();
+                    return;
+                }
+                this.loadGainControlState();
+            }, 2000);
+        }
     },
 
     stopGainPolling() {
@@ -1014,6 +1053,77 @@ const controller = {
             clearInterval(this.gainPollInterval);
             this.gainPollInterval = null;
         }
+        if (this.gainStream) {
+            this.gainStream.close();
+            this.gainStream = null;
+        }
+    },
+
+    restartGainPolling() {
+        if (!this.gainPollInterval && !this.gainStream) return;
+        this.stopGainPolling();
+        this.startGainPolling();
+    },
+
+    startGainStream() {
+        const stream = new EventSource(`./api/stream/device/${encodeURIComponent(this.selectedDevice.id)}`);
+        stream.addEventListener('state', (e) => {
+            try {
+                this.applyGainEntityState(JSON.parse(e.data));
+            } catch (error) {
+                // Ignore malformed events
+            }
+        });
+        // The server ends the stream when it loses its HA connection
+        stream.addEventListener('unavailable', () => this.gainStreamFallback(stream));
+        stream.onerror = () => {
+            // EventSource reconnects by itself unless the server refused the stream
+            if (stream.readyState === EventSource.CLOSED) {
+                this.gainStreamFallback(stream);
+            }
+        };
+        this.gainStream = stream;
+    },
+
+    // Poll instead of streaming for a while, then retry the stream
+    gainStreamFallback(stream) {
+        stream.close();
+        if (this.gainStream !== stream) return;
+        this.gainStream = null;
+        this.gainStreamFailed = true;
+        this.gainStreamRetryAt = Date.now() + 30000;
+        this.startGainPolling();
+    },
+
+    applyGainEntityState(data) {
+        const base = this.deriveEntityBase(this.selectedDevice.mac) || this.selectedDevice.id.toLowerCase().replace(/ /g, '_').replace(/-/g, '_');
+        if (data.entity_id === `number.${base}_codec_gain`) {
+            this.applyGainState(data.state);
+        } else if (data.entity_id === `switch.${base}_eq_enable`) {
+            document.getElementById('rt-eq-enable').checked = data.state === 'on';
+        } else if (data.entity_id === `switch.${base}_drc_enable`) {
+            document.getElementById('rt-drc-enable').checked = data.state === 'on';
+        }
+    },
+
+    applyGainState(state) {
+        if (state === 'unknown' || state === 'unavailable') return;
+        const db = parseFloat(state);
+        if (isNaN(db)) return;
+        const slider = document.getElementById('gain-slider');
+        // Only update slider if user is not currently dragging it
+        if (document.activeElement !== slider) {
+            slider.value = Math.max(-40, Math.min(20, db));
+            this.updateGainSliderVisuals(db);
+            // Auto-detect mute from very low gain
+            if (db <= -90 && !this.isMuted) {
+                this.isMuted = true;
+                this.updateMuteButton();
+            } else if (db > -90 && this.isMuted) {
+                this.isMuted = false;
+                this.updateMuteButton();
+            }
+        }
     },
 
     updateGainSliderVisuals(db) {
@@ -1039,39 +1149,26 @@ const controller = {
         const base = this.deriveEntityBase(mac) || this.selectedDevice.id.toLowerCase().replace(/ /g, '_').replace(/-/g, '_');
 
         try {
+            const states = await this.fetchHaStates([
+                `number.${base}_codec_gain`,
+                `switch.${base}_eq_enable`,
+                `switch.${base}_drc_enable`
+            ]);
+
             // Read codec gain
-            const gainResp = await fetch(`./api/ha_state/number.${base}_codec_gain`);
-            const gainData = await gainResp.json();
-            if (gainData.success && gainData.state !== 'unknown' && gainData.state !== 'unavailable') {
-                const db = parseFloat(gainData.state);
-                if (!isNaN(db)) {
-                    const slider = document.getElementById('gain-slider');
-                    // Only update slider if user is not currently dragging it
-                    if (document.activeElement !== slider) {
-                        slider.value = Math.max(-40, Math.min(20, db));
-                        this.updateGainSliderVisuals(db);
-                        // Auto-detect mute from very low gain
-                        if (db <= -90 && !this.isMuted) {
-                            this.isMuted = true;
-                            this.updateMuteButton();
-                        } else if (db > -90 && this.isMuted) {
-                            this.isMuted = false;
-                            this.updateMuteButton();
-                        }
-                    }
-                }
+            const gainData = states[`number.${base}_codec_gain`];
+            if (gainData.success) {
+                this.applyGainState(gainData.state);
             }
 
             // Read EQ switch
-            const eqResp = await fetch(`./api/ha_state/switch.${base}_eq_enable`);
-            const eqData = await eqResp.json();
+            const eqData = states[`switch.${base}_eq_enable`];
             if (eqData.success) {
                 document.getElementById('rt-eq-enable').checked = eqData.state === 'on';
             }
 
             // Read DRC switch
-            const drcResp = await fetch(`./api/ha_state/switch.${base}_drc_enable`);
-            const drcData = await drcResp.json();
+            const drcData = states[`switch.${base}_drc_enable`];
             if (drcData.success) {
                 document.getElementById('rt-drc-enable').checked = drcData.state === 'on';
             }
@@ -0,0 +1,259 @@
+"""
+EntityStateMirror against a local stand-in for the HA WebSocket API.
+
+FakeHAWebSocket speaks just enough of the protocol (RFC 6455 framing, auth,
+subscribe_events, get_states) to seed the mirror, push state_changed events
+and drop the connection. The REST fallback is checked through
+/api/ha_state with a stand-in for the REST API.
+
+Run from panel-widget-config/: python -m pytest tests
+"""
+
+import base64
+import hashlib
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('websocket')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
+
+import main  # noqa: E402
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def state(entity_id, value):
+    return {"entity_id": entity_id, "state": value, "attributes": {}}
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class FakeHAWebSocket:
+    """Minimal HA WebSocket API serving one client at a time"""
+
+    def __init__(self, states):
+        self.states = {s['entity_id']: s for s in states}
+        self.connections = 0
+        self._server = socket.create_server(('127.0.0.1', 0))
+        self.url = f"ws://127.0.0.1:{self._server.getsockname()[1]}/api/websocket"
+        self._conn = None
+        self._send_lock = threading.Lock()
+        self._state_sub = None
+        self.seeded = threading.Event()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def close(self):
+        self._server.close()
+        self.drop()
+
+    def drop(self):
+        """Close the client connection without a close frame, like a restarting HA"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+    def push(self, entity_id, new_state):
+        event = {"event_type": "state_changed",
+                 "data": {"entity_id": entity_id, "new_state": new_state}}
+        if new_state is None:
+            self.states.pop(entity_id, None)
+        else:
+            self.states[entity_id] = new_state
+        self._send({"id": self._state_sub, "type": "event", "event": event})
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            try:
+                self._handle(conn)
+            except (OSError, ValueError):
+                pass  # Client went away or the test dropped it
+            finally:
+                conn.close()
+
+    def _handle(self, conn):
+        reader = conn.makefile('rb')
+        headers = {}
+        for line in iter(reader.readline, b'\r\n'):
+            if b':' in line:
+                name, value = line.decode().split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + WS_GUID).encode()).digest())
+        conn.sendall(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        self._conn = conn
+        self.connections += 1
+
+        self._send({"type": "auth_required"})
+        if self._recv(reader).get('type') != 'auth':
+            return
+        self._send({"type": "auth_ok"})
+        while True:
+            msg = self._recv(reader)
+            if msg is None:
+                return
+            if msg.get('type') == 'subscribe_events':
+                if msg.get('event_type') == 'state_changed':
+                    self._state_sub = msg['id']
+                self._send({"id": msg['id'], "type": "result", "success": True, "result": None})
+            elif msg.get('type') == 'get_states':
+                self._send({"id": msg['id'], "type": "result", "success": True,
+                            "result": list(self.states.values())})
+                self.seeded.set()
+            elif msg.get('type') == 'ping':
+                self._send({"id": msg['id'], "type": "pong"})
+
+    def _recv(self, reader):
+        """Read one client frame (always masked). None on close."""
+        head = reader.read(2)
+        if len(head) < 2 or head[0] & 0x0F == 0x8:
+            return None
+        length = head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack('>H', reader.read(2))[0]
+        elif length == 127:
+            length = struct.unpack('>Q', reader.read(8))[0]
+        mask = reader.read(4)
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(reader.read(length)))
+        return json.loads(payload)
+
+    def _send(self, msg):
+        payload = json.dumps(msg).encode()
+        if len(payload) < 126:
+            header = struct.pack('>BB', 0x81, len(payload))
+        elif len(payload) < 65536:
+            header = struct.pack('>BBH', 0x81, 126, len(payload))
+        else:
+            header = struct.pack('>BBQ', 0x81, 127, len(payload))
+        with self._send_lock:
+            if self._conn is not None:
+                self._conn.sendall(header + payload)
+
+
+class FakeHARest:
+    """HA REST API serving GET /api/states/<entity_id> and counting requests"""
+
+    def __init__(self, states):
+        self.states = {s['entity_id']: s for s in states}
+        self.requests = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.requests += 1
+                found = fake.states.get(self.path.rsplit('/', 1)[-1])
+                body = json.dumps(found or {"message": "Entity not found."}).encode()
+                self.send_response(200 if found else 404)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/api"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def ws():
+    server = FakeHAWebSocket([state('light.kitchen', 'off'), state('sensor.gone', '1')])
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def mirror(ws):
+    mirror = main.EntityStateMirror(ws.url, 'token')
+    mirror.start()
+    assert wait_for(lambda: mirror.ready), "mirror never seeded"
+    return mirror
+
+
+def test_seed_and_events(ws, mirror):
+    changes = []
+    mirror.listeners.append(lambda entity_id, new_state: changes.append((entity_id, new_state)))
+
+    assert mirror.get('light.kitchen')['state'] == 'off'
+    ws.push('light.kitchen', state('light.kitchen', 'on'))
+    assert wait_for(lambda: mirror.get('light.kitchen')['state'] == 'on')
+    ws.push('sensor.gone', None)
+    assert wait_for(lambda: mirror.get('sensor.gone') is None)
+    assert ('light.kitchen', state('light.kitchen', 'on')) in changes
+
+
+def test_reconnect_resyncs(ws, mirror):
+    dropped = threading.Event()
+    mirror.disconnect_listeners.append(dropped.set)
+    changes = []
+    mirror.listeners.append(lambda entity_id, new_state: changes.append(entity_id))
+
+    # HA changes while the connection is down: only the resync can tell the mirror
+    ws.seeded.clear()
+    ws.drop()
+    assert dropped.wait(5)
+    ws.states['light.kitchen'] = state('light.kitchen', 'on')
+    del ws.states['sensor.gone']
+    ws.states['switch.new'] = state('switch.new', 'on')
+
+    assert ws.seeded.wait(10), "mirror did not reconnect"
+    assert wait_for(lambda: mirror.ready and mirror.get('switch.new') is not None)
+    assert ws.connections == 2
+    assert mirror.get('light.kitchen')['state'] == 'on'
+    assert mirror.get('sensor.gone') is None
+    assert {'light.kitchen', 'switch.new'} <= set(changes)
+
+
+def test_rest_fallback(ws, mirror, monkeypatch):
+    rest = FakeHARest([state('light.kitchen', 'rest')])
+    monkeypatch.setattr(main, 'HA_TOKEN', 'token')
+    monkeypatch.setattr(main, 'HA_API', rest.url)
+    monkeypatch.setattr(main.ha_client, 'base_url', rest.url)
+    monkeypatch.setattr(main, 'state_mirror', mirror)
+    client = main.app.test_client()
+    try:
+        # Connected: answered from the mirror
+        assert client.get('/api/ha_state/light.kitchen').get_json()['state'] == 'off'
+        assert rest.requests == 0
+
+        # Disconnected: every read goes to REST until the mirror is back
+        ws.seeded.clear()
+        ws.drop()
+        assert wait_for(lambda: not mirror.ready)
+        assert client.get('/api/ha_state/light.kitchen').get_json()['state'] == 'rest'
+        assert rest.requests == 1
+
+        assert ws.seeded.wait(10)
+        assert wait_for(lambda: mirror.ready)
+        assert client.get('/api/ha_state/light.kitchen').get_json()['state'] == 'off'
+        assert rest.requests == 1
+    finally:
+        rest.close()
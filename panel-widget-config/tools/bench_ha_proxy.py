@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+HA proxy load benchmark
+
+Starts a deliberately slow local Home Assistant stand-in, runs the add-on
+under gunicorn in each server mode and fires concurrent /api/ha_state and
+/api/ha_service requests at it. Prints throughput and latency per mode.
+
+Usage (from panel-widget-config/):
+    pip install -r requirements.txt
+    python tools/bench_ha_proxy.py --ha-delay 0.5 --requests 200 --concurrency 32
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+import requests
+
+APP_DIR = Path(__file__).resolve().parent.parent / 'app'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_slow_ha(delay):
+    """Minimal HA REST stand-in that answers every call after `delay` seconds"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, code, body):
+            payload = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            time.sleep(delay)
+            entity_id = self.path.rsplit('/', 1)[-1]
+            self._reply(200, {"entity_id": entity_id, "state": "on", "attributes": {}})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(delay)
+            self._reply(200, [])
+
+    server = ThreadingHTTPServer(('127.0.0.1', free_port()), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_addon(mode, ha_url, workers, threads):
+    port = free_port()
+    env = dict(os.environ,
+               SUPERVISOR_TOKEN='bench',
+               HA_API=ha_url,
+               HA_WS_MIRROR='0',  # Measure the REST proxy path, not the mirror
+               SERVER_MODE=mode,
+               SERVER_THREADS=str(threads))
+    worker_args = ['--worker-class', 'sync'] if mode == 'sync' else \
+        ['--worker-class', 'gthread', '--threads', str(threads)]
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--chdir', str(APP_DIR),
+         '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         *worker_args, '--timeout', '120', '--log-level', 'warning', 'main:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            requests.get(f'{base}/api/widget-types', timeout=1)
+            return proc, base
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"add-on did not start in {mode} mode")
+
+
+def run_load(base, total, concurrency):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+
+    def one(i):
+        started = time.monotonic()
+        if i % 2:
+            r = session.get(f'{base}/api/ha_state/sensor.bench_{i}', timeout=120)
+        else:
+            r = session.post(f'{base}/api/ha_service', timeout=120, json={
+                "domain": "switch", "service": "turn_on",
+                "data": {"entity_id": f"switch.bench_{i}"}
+            })
+        return time.monotonic() - started, r.status_code
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.monotonic() - started
+
+    latencies = sorted(r[0] for r in results)
+    errors = sum(1 for r in results if r[1] != 200)
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        "rps": total / elapsed,
+        "elapsed": elapsed,
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+        "max": latencies[-1] * 1000,
+        "errors": errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ha-delay', type=float, default=0.5, help='Stand-in HA response delay (s)')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per mode')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--modes', default='sync,gthread')
+    args = parser.parse_args()
+
+    ha = start_slow_ha(args.ha_delay)
+    ha_url = f'http://127.0.0.1:{ha.server_address[1]}/api'
+    print(f"HA stand-in: {ha_url} (delay {args.ha_delay * 1000:.0f} ms)")
+    print(f"{args.requests} requests, {args.concurrency} concurrent, {args.workers} workers\n")
+    print(f"{'mode':<10}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'errors':>8}")
+
+    for mode in args.modes.split(','):
+        proc, base = start_addon(mode, ha_url, args.workers, args.threads)
+        try:
+            r = run_load(base, args.requests, args.concurrency)
+        finally:
+            proc.terminate()
+            proc.wait()
+        print(f"{mode:<10}{r['rps']:>9.1f}{r['p50']:>10.0f}{r['p95']:>10.0f}{r['max']:>10.0f}{r['errors']:>8}")
+
+    ha.shutdown()
+
+
+if __name__ == '__main__':
+    main()
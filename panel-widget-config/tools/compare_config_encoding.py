@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Config encoding comparison
+
+Compares the size and parse time of a site_settings.json (and the
+per-device slices in devices/ next to it) as pretty JSON, compact JSON and
+compact CBOR (app/config_codec.py). Parse times are measured in CPython and
+are only a relative guide to what a panel sees.
+
+Usage (from panel-widget-config/):
+    python tools/compare_config_encoding.py /config/www/panel_widgets/site_settings.json
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
+from config_codec import encode_config, decode_config  # noqa: E402
+
+
+def time_per_call(fn, arg, min_secs=0.2):
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        fn(arg)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_secs:
+            return elapsed / runs * 1e6
+
+
+def compare(name, doc):
+    pretty = json.dumps(doc, indent=2).encode()
+    compact = json.dumps(doc, separators=(',', ':')).encode()
+    binary = encode_config(doc)
+    if decode_config(binary) != doc:
+        raise SystemExit(f"{name}: CBOR round trip mismatch")
+
+    rows = [
+        ('json (indent=2)', pretty, json.loads),
+        ('json (compact)', compact, json.loads),
+        ('cbor (compact)', binary, decode_config),
+    ]
+    print(f"\n{name}")
+    print(f"  {'encoding':<18}{'bytes':>10}{'gzip':>10}{'vs pretty':>11}{'parse us':>11}")
+    for label, body, parse in rows:
+        print(f"  {label:<18}{len(body):>10}{len(gzip.compress(body)):>10}"
+              f"{len(body) / len(pretty):>10.0%}{time_per_call(parse, body):>11.0f}")
+    return len(pretty), len(compact), len(binary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('config', help='Path to site_settings.json')
+    parser.add_argument('--slices', type=int, default=3, help='Number of device slices to show (0 = none)')
+    args = parser.parse_args()
+
+    path = Path(args.config)
+    with open(path) as f:
+        compare(path.name, json.load(f))
+
+    slices = sorted((path.parent / 'devices').glob('*.json'))
+    slices = [p for p in slices if p.name != 'index.json']
+    if not slices or args.slices == 0:
+        return
+    totals = [0, 0, 0]
+    for i, slice_path in enumerate(slices):
+        with open(slice_path) as f:
+            doc = json.load(f)
+        if i < args.slices:
+            sizes = compare(f"devices/{slice_path.name}", doc)
+        else:
+            sizes = (len(json.dumps(doc, indent=2)),
+                     len(json.dumps(doc, separators=(',', ':'))),
+                     len(encode_config(doc)))
+        totals = [t + s for t, s in zip(totals, sizes)]
+    print(f"\nAll {len(slices)} device slices: pretty {totals[0]} B, "
+          f"compact {totals[1]} B, cbor {totals[2]} B")
+
+
+if __name__ == '__main__':
+    main()